@@ -1,17 +1,30 @@
-import atexit
+import contextlib
 import cProfile
 import functools
+import hashlib
 import json
 import multiprocessing
+import os
+import pstats
 import random
+import shelve
+import sys
+import time
 
 import click
 import jsonpickle
 
-from .lib.util import load_from_file_if_string, evaluate, getPairsFromSpellvardict, get_positive_and_negative_pairs_with_context
+from .lib.util import load_from_file_if_string, evaluate, evaluate_thresholds, get_positive_and_negative_pairs_with_context
+from .lib.util import JsonLinesFile, get_candidate_items, chunked, iterPairsFromSpellvardict, ReservoirSample
+from .lib.hashed_set import HashedSet
+from .lib.feature_cache import FeatureCache
+from .lib.feature_store import FeatureStore, FeatureStoreWriter
+from .lib.embeddings import WordEmbeddings
+from .lib import profiling
 from .util.spellvarfactory import create_base_factory
 import spellvardetection.util.learn_simplification_rules
 import spellvardetection.util.learn_edit_probabilities
+import spellvardetection.util.benchmark
 
 class JsonOption(click.ParamType):
     """The json-option type allows for passing a list or dict using json as
@@ -23,7 +36,8 @@ class JsonOption(click.ParamType):
 
     def convert(self, value, param, ctx):
         try:
-            result = load_from_file_if_string(value)
+            with profiling.stage(profiling.IO):
+                result = load_from_file_if_string(value)
         except Exception:
             self.fail(
                 value + " could not be parsed.",
@@ -33,21 +47,95 @@ class JsonOption(click.ParamType):
 
         return result
 
+class FeatureCacheOption(JsonOption):
+    """The feature-cache-option type additionally allows for passing the
+    directory of a feature store.
+    """
+
+    name = 'feature-cache-option'
+
+    def convert(self, value, param, ctx):
+        if isinstance(value, str) and os.path.isdir(value):
+            return FeatureStore(value)
+
+        return super().convert(value, param, ctx)
+
+class JsonLinesOption(JsonOption):
+    """The json-lines-option type additionally allows for passing a JSON
+    Lines file (with the extension .jsonl), which is read record by record.
+    """
+
+    name = 'json-lines-option'
+
+    def convert(self, value, param, ctx):
+        if isinstance(value, str) and value.endswith('.jsonl') and os.path.isfile(value):
+            return JsonLinesFile(value)
+
+        return super().convert(value, param, ctx)
+
+## number of records that are processed at once when streaming
+_CHUNK_SIZE = 10000
+
+def echo_jsonl(records, output_file):
+    for record in records:
+        with profiling.stage(profiling.IO):
+            click.echo(json.dumps(record), file=output_file)
+
+def echo_candidates(candidate_items, output_file, jsonl=False):
+    if jsonl:
+        echo_jsonl(({'type': word, 'candidates': list(candidates)} for word, candidates in candidate_items), output_file)
+    else:
+        with profiling.stage(profiling.IO):
+            click.echo(
+                json.dumps({word: list(candidates) for word, candidates in candidate_items}),
+                file=output_file)
+
+## candidates are used as lookup - a JSON Lines file has to be read completely
+def load_candidates(candidates):
+    if isinstance(candidates, dict):
+        return candidates
+    return dict(get_candidate_items(candidates))
+
 
 @click.group()
 @click.option('--with_profiler', default=False, is_flag=True)
+@click.option('--profile_file', type=click.Path(dir_okay=False))
+@click.option('--timing_report', type=click.Path(dir_okay=False))
+@click.option('--timing_samples', type=click.Path(dir_okay=False))
+@click.option('--sample_interval', type=float, default=10.0)
 @click.pass_context
-def main(ctx, with_profiler):
+def main(ctx, with_profiler, profile_file, timing_report, timing_samples, sample_interval):
 
-    if with_profiler:
+    ## profiling results are written to stderr or files, so they do not mix with the output
+    if with_profiler or profile_file is not None:
         cp = cProfile.Profile()
         cp.enable()
 
         def stop_profiling():
             cp.disable()
-            cp.print_stats(sort='time')
-
-        atexit.register(stop_profiling)
+            if profile_file is not None:
+                cp.dump_stats(profile_file)
+            if with_profiler:
+                pstats.Stats(cp, stream=sys.stderr).sort_stats('time').print_stats()
+
+        ctx.call_on_close(stop_profiling)
+
+    if timing_report is not None or timing_samples is not None:
+        timer = profiling.enable()
+        sampler = None
+        if timing_samples is not None:
+            sampler = profiling.Sampler(timer, timing_samples, sample_interval)
+            sampler.start()
+
+        def stop_timing():
+            profiling.disable()
+            if sampler is not None:
+                sampler.stop()
+            if timing_report is not None:
+                with open(timing_report, 'w') as outfile:
+                    json.dump({**timer.getReport(), 'command': ctx.invoked_subcommand}, outfile)
+
+        ctx.call_on_close(stop_timing)
 
     if ctx.obj is None:
         ctx.obj = {}
@@ -56,12 +144,13 @@ def main(ctx, with_profiler):
 
 @main.command()
 @click.pass_context
-@click.argument('vocabulary', type=JsonOption())
+@click.argument('vocabulary', type=JsonLinesOption())
 @click.argument('generator_settings', type=JsonOption())
 @click.option('-d', '--dictionary', type=JsonOption())
 @click.option('-o', '--output_file', type=click.File('w'))
 @click.option('-p', '--max_processes', type=click.INT, default=1)
-def generate(ctx, vocabulary, generator_settings, dictionary, output_file, max_processes):
+@click.option('--jsonl', default=False, is_flag=True)
+def generate(ctx, vocabulary, generator_settings, dictionary, output_file, max_processes, jsonl):
 
     generator = ctx.obj['factory'].create_from_name("generator", generator_settings)
 
@@ -72,28 +161,69 @@ def generate(ctx, vocabulary, generator_settings, dictionary, output_file, max_p
     generator.setMaxProcesses(max_processes)
 
     if dictionary:
-        generator.setDictionary(dictionary)
+        with profiling.stage(profiling.DICTIONARY):
+            generator.setDictionary(dictionary)
 
+    ## errors (e.g. a missing dictionary) are written to stderr, so they do not mix with the output
     try:
-        variants = generator.getCandidatesForWords(vocabulary)
-    except Exception as e:
-        print(e)
-    else:
-        click.echo(
-            json.dumps({word: list(variants) for word, variants in variants.items()}),
-            file=output_file)
+        echo_candidates(
+            profiling.timed_iter(generator.iterCandidatesForWords(vocabulary, _CHUNK_SIZE), profiling.GENERATION),
+            output_file, jsonl)
+    except RuntimeError as e:
+        click.echo(str(e), err=True)
+        ctx.exit(1)
+
+## the filter of a worker process, it is set once per process by the initializer of the pool
+_worker_filter = None
+
+def _init_filter_worker(cand_filter):
+    global _worker_filter
+    _worker_filter = cand_filter
+
+## Helper function for filter - also returns the process and the time used for the statistics
+def apply_filter(word_candidates, cand_filter=None):
+    if cand_filter is None:
+        cand_filter = _worker_filter
+
+    start = time.perf_counter()
+    filtered = list(cand_filter.filterCandidates(word_candidates[0], word_candidates[1]))
+    return (word_candidates[0], filtered, os.getpid(), len(word_candidates[1]), time.perf_counter() - start)
+
+def filter_candidate_items(candidate_items, cand_filter, max_processes=1, worker_statistics=None):
+    """Filter (type, candidates) pairs, the filtered pairs are generated in order.
+
+    If a dict is given as worker_statistics, the number of types and
+    candidates and the time used are added for each process.
+    """
 
-## Helper function for filter
-def apply_filter(word_candidates, cand_filter):
-    return (word_candidates[0], list(cand_filter.filterCandidates(word_candidates[0], word_candidates[1])))
+    def collect(results):
+        for word, filtered, pid, number_of_candidates, seconds in results:
+            if worker_statistics is not None:
+                stats = worker_statistics.setdefault(str(pid), {'types': 0, 'candidates': 0, 'seconds': 0.0})
+                stats['types'] += 1
+                stats['candidates'] += number_of_candidates
+                stats['seconds'] += seconds
+            yield (word, filtered)
+
+    ## no pool is needed for a single process
+    if max_processes == 1:
+        yield from collect(map(functools.partial(apply_filter, cand_filter=cand_filter), candidate_items))
+        return
+
+    ## the filter is passed to each process once instead of with every task
+    with multiprocessing.Pool(max_processes, initializer=_init_filter_worker, initargs=(cand_filter,)) as pool:
+        for chunk in chunked(candidate_items, _CHUNK_SIZE):
+            yield from collect(pool.imap(apply_filter, chunk, chunksize=max(1, len(chunk) // (4*max_processes))))
 
 @main.command('filter')
 @click.pass_context
-@click.argument('candidates', type=JsonOption())
+@click.argument('candidates', type=JsonLinesOption())
 @click.argument('filter_settings', type=JsonOption())
 @click.option('-o', '--output_file', type=click.File('w'))
 @click.option('-p', '--max_processes', type=click.INT, default=1)
-def filter_(ctx, candidates, filter_settings, output_file, max_processes):
+@click.option('--jsonl', default=False, is_flag=True)
+@click.option('-s', '--statistics', default=False, is_flag=True)
+def filter_(ctx, candidates, filter_settings, output_file, max_processes, jsonl, statistics):
 
     cand_filter = ctx.obj['factory'].create_from_name("type_filter", filter_settings)
 
@@ -101,46 +231,325 @@ def filter_(ctx, candidates, filter_settings, output_file, max_processes):
     if max_processes < 1:
         max_processes = multiprocessing.cpu_count()
 
-    with multiprocessing.Pool(max_processes) as pool:
+    worker_statistics = {} if statistics else None
 
-        filtered = pool.map(
-            functools.partial(apply_filter, cand_filter=cand_filter),
-            candidates.items())
+    echo_candidates(
+        profiling.timed_iter(filter_candidate_items(get_candidate_items(candidates), cand_filter, max_processes, worker_statistics), profiling.FILTERING),
+        output_file, jsonl)
 
-    click.echo(
-        json.dumps({word_variants[0]: word_variants[1] for word_variants in filtered}),
-        file=output_file)
+    if statistics:
+        for stats in worker_statistics.values():
+            stats['types_per_second'] = stats['types'] / stats['seconds'] if stats['seconds'] > 0 else None
+        click.echo(json.dumps(worker_statistics), err=True)
+
+
+## the token filter is created in each worker process from its settings
+def _init_token_filter_worker(filter_settings):
+    global _worker_filter
+    _worker_filter = create_base_factory().create_from_name("token_filter", filter_settings)
+
+## Helper function for filter_tokens - filters groups of tokens with the same type, i.e. (type, candidates, contexts)
+def apply_token_filter(type_groups, cand_filter=None):
+    if cand_filter is None:
+        cand_filter = _worker_filter
+
+    ## the candidates of all tokens are filtered at once
+    filtered_candidates = iter(cand_filter.filterCandidatesForTokens(
+        [(type_, candidates, left_context, right_context)
+         for type_, candidates, contexts in type_groups for left_context, right_context in contexts]))
+
+    return ([[list(next(filtered_candidates)) for _ in contexts] for _, _, contexts in type_groups],
+            os.getpid(), cand_filter.getStatistics())
+
+## Helper function for filter_tokens and run
+def filter_token_chunk(tokens, spellvarcandidates, cand_filter=None, pool=None, max_processes=1, worker_statistics=None):
+    """Filter the candidates of tokens, the tokens are grouped by type.
+
+    With a pool, the groups are distributed to max_processes worker processes.
+    """
+
+    ## the candidates of a type are only looked up once
+    type_positions = {}
+    for position, token in enumerate(tokens):
+        type_positions.setdefault(token['type'], []).append(position)
+
+    type_groups = [
+        (type_, spellvarcandidates.get(type_, []), [(tokens[position]['left_context'], tokens[position]['right_context']) for position in positions])
+        for type_, positions in type_positions.items()
+    ]
+
+    if pool is None:
+        results = [apply_token_filter(type_groups, cand_filter)]
+    else:
+        results = pool.imap(apply_token_filter, chunked(type_groups, max(1, len(type_groups) // (4*max_processes))))
+
+    group_filtered = []
+    for batch_filtered, pid, stats in results:
+        group_filtered.extend(batch_filtered)
+        if worker_statistics is not None:
+            worker_statistics[str(pid)] = stats
+
+    ## the filtered tokens are returned in the original order
+    filtered = [None]*len(tokens)
+    for (_, candidates, _), positions, type_filtered in zip(type_groups, type_positions.values(), group_filtered):
+        for position, token_filtered in zip(positions, type_filtered):
+            filtered[position] = {
+                **tokens[position],
+                **{
+                    'candidates': candidates,
+                    'filtered_candidates': token_filtered
+                }
+            }
 
+    return filtered
+
+def echo_tokens(tokens, output_file, jsonl=False):
+    if jsonl:
+        echo_jsonl(tokens, output_file)
+    else:
+        with profiling.stage(profiling.IO):
+            click.echo(
+                json.dumps(list(tokens)),
+                file=output_file)
 
 @main.command('filter_tokens')
 @click.pass_context
-@click.argument('tokens', type=JsonOption())
-@click.argument('spellvarcandidates', type=JsonOption())
+@click.argument('tokens', type=JsonLinesOption())
+@click.argument('spellvarcandidates', type=JsonLinesOption())
 @click.argument('filter_settings', type=JsonOption())
 @click.option('-o', '--output_file', type=click.File('w'))
-def filter_tokens(ctx, tokens, spellvarcandidates, filter_settings, output_file):
+@click.option('-p', '--max_processes', type=click.INT, default=1)
+@click.option('-s', '--statistics', default=False, is_flag=True)
+@click.option('--jsonl', default=False, is_flag=True)
+def filter_tokens(ctx, tokens, spellvarcandidates, filter_settings, output_file, max_processes, statistics, jsonl):
 
+    spellvarcandidates = load_candidates(spellvarcandidates)
 
-    cand_filter = ctx.obj['factory'].create_from_name("token_filter", filter_settings)
+    ## 0 or negative numbers for allowing as many processes as cores
+    if max_processes < 1:
+        max_processes = multiprocessing.cpu_count()
 
-    def filter_variants_for_token(token_candidates):
-        token_candidates[0]['variants'] = cand_filter.filterCandidates(token_candidates[0]['type'], token_candidates[1], token_candidates[0]['left_context'], token_candidates[0]['left_context'])
-        return token_candidates[0]
+    worker_statistics = {}
 
-    filtered = [
-        {
-            **token,
-            **{
-                'candidates': spellvarcandidates.get(token['type'], []),
-                'filtered_candidates': list(cand_filter.filterCandidates(token['type'], spellvarcandidates.get(token['type'], []), token['left_context'], token['right_context']))
-            }
-        }
-        for token in tokens
-    ]
+    def filter_chunks(cand_filter=None, pool=None):
+        for chunk in chunked(tokens, _CHUNK_SIZE):
+            with profiling.stage(profiling.FILTERING):
+                filtered = filter_token_chunk(chunk, spellvarcandidates, cand_filter, pool, max_processes, worker_statistics)
+            yield from filtered
+
+    if max_processes == 1:
+        cand_filter = ctx.obj['factory'].create_from_name("token_filter", filter_settings)
+        echo_tokens(filter_chunks(cand_filter), output_file, jsonl)
+        statistics_output = cand_filter.getStatistics()
+    else:
+        ## each worker process loads the filter once
+        with multiprocessing.Pool(max_processes, initializer=_init_token_filter_worker, initargs=(filter_settings,)) as pool:
+            echo_tokens(filter_chunks(pool=pool), output_file, jsonl)
+        statistics_output = worker_statistics
+
+    if statistics:
+        click.echo(json.dumps(statistics_output), err=True)
+
+
+## the generator of a worker process of run, it is set once per process by the initializer of the pool
+_worker_generator = None
+
+def _init_run_worker(generator, type_filter):
+    global _worker_generator, _worker_filter
+    _worker_generator = generator
+    _worker_filter = type_filter
+
+## Helper function for run - generates and filters the candidates of a type in a worker process
+def generate_and_filter(word):
+    candidates = _worker_generator.getCandidatesForWord(word)
+    if _worker_filter is not None:
+        candidates = _worker_filter.filterCandidates(word, candidates)
+    return (word, candidates)
+
+def get_referenced_files(settings):
+    """Get the size and modification time of the files referenced by
+    (string values of) the settings.
+    """
+
+    if isinstance(settings, dict):
+        values = settings.values()
+    elif isinstance(settings, list):
+        values = settings
+    elif isinstance(settings, str) and os.path.isfile(settings):
+        stat = os.stat(settings)
+        return {settings: [stat.st_size, stat.st_mtime_ns]}
+    else:
+        return {}
+
+    return {filename: stat for value in values for filename, stat in get_referenced_files(value).items()}
+
+def open_candidate_cache(pipeline_settings, checkpoint_dir=None):
+    """Get a cache for the candidates of the types.
+
+    If a checkpoint directory is given, the candidates are stored on disk and
+    reused by later runs of the same pipeline with unchanged files.
+    """
+
+    if checkpoint_dir is None:
+        return {}
+
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    settings_file = os.path.join(checkpoint_dir, 'pipeline')
+    settings = hashlib.sha1(json.dumps(
+        {'settings': pipeline_settings, 'files': get_referenced_files(pipeline_settings)},
+        sort_keys=True).encode('utf-8')).hexdigest()
+
+    ## the candidates of another pipeline are discarded
+    stored_settings = None
+    if os.path.exists(settings_file):
+        with open(settings_file, 'r') as infile:
+            stored_settings = infile.read()
+
+    flag = 'c'
+    if stored_settings != settings:
+        flag = 'n'
+        with open(settings_file, 'w') as outfile:
+            outfile.write(settings)
+
+    return shelve.open(os.path.join(checkpoint_dir, 'candidates'), flag=flag)
+
+@main.command('run')
+@click.pass_context
+@click.argument('pipeline_settings', type=JsonOption())
+@click.argument('tokens', type=JsonLinesOption())
+@click.option('-d', '--dictionary', type=JsonOption())
+@click.option('-o', '--output_file', type=click.File('w'))
+@click.option('-p', '--max_processes', type=click.INT, default=1)
+@click.option('-c', '--checkpoint_dir', type=click.Path(file_okay=False))
+@click.option('-s', '--statistics', default=False, is_flag=True)
+@click.option('--jsonl', default=False, is_flag=True)
+def run(ctx, pipeline_settings, tokens, dictionary, output_file, max_processes, checkpoint_dir, statistics, jsonl):
+    """Generate and filter the spelling variant candidates of tokens.
+
+    The pipeline is given as json with a generator and optionally a
+    type_filter, a token_filter and a dictionary.
+    """
+
+    generator = ctx.obj['factory'].create_from_name("generator", pipeline_settings['generator'])
+    type_filter = None
+    if pipeline_settings.get('type_filter') is not None:
+        type_filter = ctx.obj['factory'].create_from_name("type_filter", pipeline_settings['type_filter'])
+    token_filter = None
+    if pipeline_settings.get('token_filter') is not None:
+        token_filter = ctx.obj['factory'].create_from_name("token_filter", pipeline_settings['token_filter'])
+
+    if dictionary is None:
+        dictionary = pipeline_settings.get('dictionary')
+    if dictionary is not None:
+        with profiling.stage(profiling.DICTIONARY):
+            generator.setDictionary(load_from_file_if_string(dictionary))
+
+    ## 0 or negative numbers for allowing as many processes as cores
+    if max_processes < 1:
+        max_processes = multiprocessing.cpu_count()
+
+    run_statistics = {'tokens': 0, 'generated_types': 0}
+    candidate_cache = open_candidate_cache(
+        {'pipeline': pipeline_settings, 'dictionary': dictionary}, checkpoint_dir)
+
+    def process_chunk(chunk, pool=None):
+
+        ## candidates are generated (and filtered) once for each type
+        new_types = list(set([token['type'] for token in chunk if token['type'] not in candidate_cache]))
+        if pool is None:
+            candidate_items = profiling.timed_iter(generator.iterCandidatesForWords(new_types), profiling.GENERATION)
+            if type_filter is not None:
+                candidate_items = profiling.timed_iter(filter_candidate_items(candidate_items, type_filter), profiling.FILTERING)
+        else:
+            ## the types are generated and filtered in the same task, the time is counted as generation
+            candidate_items = profiling.timed_iter(
+                pool.imap(generate_and_filter, new_types, chunksize=max(1, len(new_types) // (4*max_processes))),
+                profiling.GENERATION)
+        for type_, candidates in candidate_items:
+            candidate_cache[type_] = list(candidates)
+
+        run_statistics['tokens'] += len(chunk)
+        run_statistics['generated_types'] += len(new_types)
+
+        if token_filter is not None:
+            with profiling.stage(profiling.FILTERING):
+                return filter_token_chunk(chunk, candidate_cache, token_filter)
+
+        return [
+            {**token, **{'candidates': candidate_cache[token['type']], 'filtered_candidates': candidate_cache[token['type']]}}
+            for token in chunk
+        ]
+
+    ## one pool is used for all chunks, the generator and the type filter are passed to each process once
+    pool_context = contextlib.nullcontext()
+    if max_processes > 1:
+        pool_context = multiprocessing.Pool(max_processes, initializer=_init_run_worker, initargs=(generator, type_filter))
+
+    try:
+        with pool_context as pool:
+            echo_tokens(
+                (token for chunk in chunked(tokens, _CHUNK_SIZE) for token in process_chunk(chunk, pool)),
+                output_file, jsonl)
+    finally:
+        if checkpoint_dir is not None:
+            candidate_cache.close()
+
+    if statistics:
+        if token_filter is not None:
+            run_statistics['token_filter'] = token_filter.getStatistics()
+        click.echo(json.dumps(run_statistics), err=True)
 
-    click.echo(
-        json.dumps(filtered),
-        file=output_file)
+
+@main.command('benchmark')
+@click.pass_context
+@click.option('-g', '--generator', 'generators', multiple=True, default=['levenshtein'])
+@click.option('-f', '--type_filter')
+@click.option('-n', '--types', type=click.INT, multiple=True, default=[10000])
+@click.option('-q', '--queries', type=click.INT, default=1000)
+@click.option('-v', '--variant_ratio', type=float, default=0.5)
+@click.option('-s', '--seed', type=click.INT, default=0)
+@click.option('-p', '--max_processes', type=click.INT, default=1)
+@click.option('-o', '--output_file', type=click.File('w'))
+def benchmark(ctx, generators, type_filter, types, queries, variant_ratio, seed, max_processes, output_file):
+    """Measure the performance of generators on synthetic data.
+
+    Generators (and the type filter) are given as json or by the name of a
+    preset. For each size, a dictionary with the given number of types is
+    generated and the candidates for a sample of queries are computed.
+    """
+
+    ## 0 or negative numbers for allowing as many processes as cores
+    if max_processes < 1:
+        max_processes = multiprocessing.cpu_count()
+
+    type_filter_settings = None
+    if type_filter is not None:
+        type_filter_settings = spellvardetection.util.benchmark.getSettings(
+            type_filter, spellvardetection.util.benchmark.BENCHMARK_TYPE_FILTERS)
+
+    results = []
+    for num_types in types:
+        ## the data only depends on the seed and the size
+        rng = random.Random(seed)
+        dictionary, spellvardict = spellvardetection.util.benchmark.generateSpellvarData(num_types, rng, variant_ratio)
+        sample = rng.sample(dictionary, min(queries, len(dictionary)))
+
+        for generator in generators:
+            generator_settings = spellvardetection.util.benchmark.getSettings(
+                generator, spellvardetection.util.benchmark.BENCHMARK_GENERATORS)
+            ## each generator is run in a new process to measure its memory usage
+            result = spellvardetection.util.benchmark.benchmarkGeneratorInProcess(
+                generator_settings, dictionary, sample, spellvardict, type_filter_settings, max_processes)
+            results.append({'types': num_types, 'queries': len(sample), 'generator': generator,
+                            'type_filter': type_filter, **result})
+
+    click.echo(json.dumps({
+        'version': spellvardetection.__version__,
+        'seed': seed,
+        'variant_ratio': variant_ratio,
+        'max_processes': max_processes,
+        'results': results,
+    }), file=output_file)
 
 
 @main.group()
@@ -153,8 +562,20 @@ def train():
 @click.argument('modelfile_name')
 @click.argument('positive_pairs', type=JsonOption())
 @click.argument('negative_pairs', type=JsonOption())
-@click.option('-c', '--feature_cache', type=JsonOption())
-def train_filter(ctx, filter_settings, modelfile_name, positive_pairs, negative_pairs, feature_cache=None):
+@click.option('-c', '--feature_cache', type=FeatureCacheOption())
+@click.option('--cache_max_entries', type=click.INT)
+@click.option('--cache_max_memory', type=click.INT)
+@click.option('--cache_statistics', default=False, is_flag=True)
+@click.option('-p', '--max_processes', type=click.INT, default=1)
+def train_filter(ctx, filter_settings, modelfile_name, positive_pairs, negative_pairs, feature_cache=None,
+                 cache_max_entries=None, cache_max_memory=None, cache_statistics=False, max_processes=1):
+
+    ## a feature store is used as read-through backend of the global cache
+    if isinstance(feature_cache, FeatureStore):
+        feature_cache = FeatureCache(max_entries=cache_max_entries, max_memory=cache_max_memory, backend=feature_cache)
+    ## bound the global feature cache (max. memory is given in bytes) - an empty cache is used if none is given
+    elif cache_max_entries is not None or cache_max_memory is not None:
+        feature_cache = FeatureCache(feature_cache, cache_max_entries, cache_max_memory)
 
     ## if global feature cache is set - add this cache to all feature extractors
     if feature_cache is not None and 'feature_extractors' in filter_settings['options']:
@@ -164,9 +585,20 @@ def train_filter(ctx, filter_settings, modelfile_name, positive_pairs, negative_
                 feature_extractor['options']['cache'] = feature_cache
 
     cand_filter = ctx.obj['factory'].create_from_name("trainable_type_filter", filter_settings)
+
+    ## 0 or negative numbers for allowing as many processes as cores
+    if max_processes < 1:
+        max_processes = multiprocessing.cpu_count()
+
+    if max_processes != 1:
+        cand_filter.setMaxProcesses(max_processes)
+
     cand_filter.train(positive_pairs, negative_pairs)
     cand_filter.save(modelfile_name)
 
+    if cache_statistics and isinstance(feature_cache, FeatureCache):
+        click.echo(json.dumps(feature_cache.getStatistics()), err=True)
+
 
 @train.command('token_filter')
 @click.pass_context
@@ -189,58 +621,94 @@ def train_token_filter(ctx, filter_settings, modelfile_name, annotated_tokens, s
 def utils():
     pass
 
+class JsonListWriter:
+    """Write a json list element by element."""
+
+    def __init__(self, outfile):
+
+        self.outfile = outfile
+        self.empty = True
+        self.outfile.write('[')
+
+    def write(self, element):
+
+        if not self.empty:
+            self.outfile.write(', ')
+        self.outfile.write(json.dumps(element))
+        self.empty = False
+
+    def close(self):
+
+        self.outfile.write(']')
+
 @utils.command('extract_training_data')
-@click.argument('gold_variants', type=JsonOption())
-@click.argument('generated_variants', type=JsonOption())
+@click.argument('gold_variants', type=JsonLinesOption())
+@click.argument('generated_variants', type=JsonLinesOption())
 @click.argument('outfile_positive', type=click.File('w'))
 @click.argument('outfile_negative', type=click.File('w'))
 @click.option('-f', '--frequency', type=(JsonOption(), int), default=(None, 1))
 @click.option('-r', '--resample', default=False, is_flag=True)
+@click.option('-s', '--seed', type=click.INT)
 def extract_training_data(gold_variants, generated_variants,
                           outfile_positive, outfile_negative,
-                          frequency, resample):
+                          frequency, resample, seed):
 
     freq_dict, freq_thresh = frequency
+    rng = random.Random(seed)
 
-    pos_pairs = set([])
-    neg_pairs = set([])
+    ## only hashes of the pairs are stored
+    spellvarpairs = HashedSet(iterPairsFromSpellvardict(gold_variants))
+    seen_pairs = HashedSet()
 
-    spellvarpairs = getPairsFromSpellvardict(gold_variants)
-    candidatepairs = getPairsFromSpellvardict(generated_variants)
+    pos_writer = JsonListWriter(outfile_positive)
+    neg_writer = JsonListWriter(outfile_negative)
+
+    ## for resampling, all positive pairs are kept - there are at most as many as gold pairs,
+    ## so a sample of this size of the negative pairs is sufficient
+    pos_pairs = []
+    neg_pairs = ReservoirSample(len(spellvarpairs), rng)
+
+    for pair in iterPairsFromSpellvardict(generated_variants):
+
+        if not seen_pairs.add(pair):
+            continue
 
-    for pair in candidatepairs:
         if pair in spellvarpairs:
-            pos_pairs.add(pair)
-        else:
-            neg_pairs.add(pair)
+            if resample:
+                pos_pairs.append(pair)
+            else:
+                pos_writer.write(pair)
 
-    if freq_dict is not None:
-        neg_pairs = set(
-            [neg_pair for neg_pair in neg_pairs
-             if freq_dict.get(neg_pair[0], 0) >= freq_thresh and freq_dict.get(neg_pair[1], 0) >= freq_thresh])
+        elif freq_dict is None or (freq_dict.get(pair[0], 0) >= freq_thresh and freq_dict.get(pair[1], 0) >= freq_thresh):
+            if resample:
+                neg_pairs.add(pair)
+            else:
+                neg_writer.write(pair)
 
     if resample:
-        if len(neg_pairs) > len(pos_pairs):
-            neg_pairs = random.sample(neg_pairs, len(pos_pairs))
-        elif len(pos_pairs) > len(neg_pairs):
-            pos_pairs = random.sample(pos_pairs, len(neg_pairs))
+        neg_sample = neg_pairs.elements
+        if neg_pairs.count > len(pos_pairs):
+            neg_sample = rng.sample(neg_sample, len(pos_pairs))
+        elif len(pos_pairs) > neg_pairs.count:
+            pos_pairs = rng.sample(pos_pairs, neg_pairs.count)
+
+        for pair in pos_pairs:
+            pos_writer.write(pair)
+        for pair in neg_sample:
+            neg_writer.write(pair)
 
-    json.dump(list(pos_pairs), outfile_positive)
-    json.dump(list(neg_pairs), outfile_negative)
+    pos_writer.close()
+    neg_writer.close()
 
 @utils.command('evaluate')
-@click.argument('gold_data', type=JsonOption())
-@click.option('-p', '--predictions', type=JsonOption())
+@click.argument('gold_data', type=JsonLinesOption())
+@click.option('-p', '--predictions', type=JsonLinesOption(), multiple=True)
+@click.option('-t', '--thresholds', type=JsonOption())
 @click.option('-d', '--dictionary', type=JsonOption())
 @click.option('-k', '--known_dictionary', type=JsonOption())
 @click.option('-f', '--freq_dict', type=JsonOption())
-def evaluate_command(gold_data, predictions=None, dictionary=None, known_dictionary=None, freq_dict=None):
-
-    # add type-based predictions to tokens
-    if predictions is not None:
-        tokens = [{**token, **{'filtered_candidates': predictions.get(token['type'], [])}} for token in gold_data]
-    else:
-        tokens = gold_data
+@click.option('--json', 'json_output', default=False, is_flag=True)
+def evaluate_command(gold_data, predictions=(), thresholds=None, dictionary=None, known_dictionary=None, freq_dict=None, json_output=False):
 
     if dictionary is not None:
         dictionary = set(dictionary)
@@ -255,9 +723,47 @@ def evaluate_command(gold_data, predictions=None, dictionary=None, known_diction
     if freq_dict is None:
         freq_dict = {}
 
-    print(
-        "{:.2f}|{:.2f}|{:.2f}|{:.2f}+-{:.2f}".format(
-            *evaluate(tokens, dictionary, known_dictionary, freq_dict)))
+    ## a single evaluation without thresholds is printed in the short format
+    if thresholds is None and len(predictions) <= 1 and not json_output:
+        tokens = gold_data
+        if predictions:
+            tokens = add_predictions_to_tokens(gold_data, predictions[0])
+        print(
+            "{:.2f}|{:.2f}|{:.2f}|{:.2f}+-{:.2f}".format(
+                *evaluate(tokens, dictionary, known_dictionary, freq_dict)))
+        return
+
+    if thresholds is None:
+        thresholds = [None]
+
+    ## all thresholds are evaluated in a single pass over the gold data for each set of predictions
+    rows = []
+    for predictions_id, prediction_set in enumerate(predictions or [None], 1):
+        tokens = gold_data
+        if prediction_set is not None:
+            tokens = add_predictions_to_tokens(gold_data, prediction_set)
+
+        for threshold, result in zip(thresholds, evaluate_thresholds(tokens, thresholds, dictionary, known_dictionary, freq_dict)):
+            rows.append({
+                'predictions': predictions_id, 'threshold': threshold,
+                'precision': result[0], 'recall': result[1], 'f1': result[2],
+                'candidates_mean': result[3], 'candidates_stdev': result[4]
+            })
+
+    if json_output:
+        click.echo(json.dumps(rows))
+    else:
+        click.echo("predictions\tthreshold\tprecision\trecall\tf1\tcandidates")
+        for row in rows:
+            click.echo(
+                "{}\t{}\t{:.2f}\t{:.2f}\t{:.2f}\t{:.2f}+-{:.2f}".format(
+                    row['predictions'], '-' if row['threshold'] is None else row['threshold'],
+                    row['precision'], row['recall'], row['f1'], row['candidates_mean'], row['candidates_stdev']))
+
+## add type-based predictions to tokens
+def add_predictions_to_tokens(tokens, predictions):
+    predictions = load_candidates(predictions)
+    return ({**token, **{'filtered_candidates': predictions.get(token['type'], [])}} for token in tokens)
 
 
 @utils.command('filter_similarity')
@@ -275,12 +781,34 @@ def filter_similarity_command(predictions, sim_thresh, output_file):
 
 @utils.command('extract_features')
 @click.argument('feature_extractors', type=JsonOption())
-@click.argument('datapoints', nargs=-1, required=True, type=JsonOption())
+@click.argument('datapoints', nargs=-1, required=True, type=JsonLinesOption())
 @click.option('-o', '--output_file', type=click.File('w'))
+@click.option('-s', '--store', type=click.Path(file_okay=False))
 @click.pass_context
-def extract_features(ctx, feature_extractors, datapoints, output_file):
+def extract_features(ctx, feature_extractors, datapoints, output_file, store):
+
+    ## datapoints from JSON Lines files are read lazily
+    datapoints = (datapoint for dps in datapoints for datapoint in dps)
+
+    if store is not None:
 
-    datapoints = [datapoint for dps in datapoints for datapoint in dps]
+        if not feature_extractors:
+            raise click.BadParameter('At least one feature extractor is needed for a feature store.', param_hint='feature_extractors')
+
+        ## write the features into a binary feature store - chunk by chunk
+        extractors = {extractor['key']: ctx.obj['factory'].create_from_name("extractor", extractor)
+                      for extractor in feature_extractors}
+        get_data_key = next(iter(extractors.values()))._getDataKey
+
+        with FeatureStoreWriter(store, extractors.keys()) as writer:
+            for chunk in chunked(datapoints, _CHUNK_SIZE):
+                features = {key: extractor.extractFeatures(chunk) for key, extractor in extractors.items()}
+                ## datapoints that have already been added are skipped by the writer
+                for idx, datapoint in enumerate(chunk):
+                    writer.add(get_data_key(datapoint), {key: key_features[idx] for key, key_features in features.items()})
+        return
+
+    datapoints = list(datapoints)
 
     feature_cache = dict()
 
@@ -312,6 +840,25 @@ def evaluate_command(ctx, input_file, rules, output_file):
             file=output_file)
 
 
+@utils.command('convert_embeddings')
+@click.argument('vector_type')
+@click.argument('vectorfile_name', type=click.Path(exists=True, dir_okay=False))
+@click.argument('outfile_name')
+def convert_embeddings(vector_type, vectorfile_name, outfile_name):
+
+    WordEmbeddings(vector_type, vectorfile_name).save(outfile_name)
+
+
+@utils.command('export_token_filter')
+@click.pass_context
+@click.argument('filter_settings', type=JsonOption())
+@click.argument('outfile_name')
+def export_token_filter(ctx, filter_settings, outfile_name):
+
+    cand_filter = ctx.obj['factory'].create_from_name("token_filter", filter_settings)
+    cand_filter.export(outfile_name)
+
+
 @utils.group()
 def learn():
     pass
@@ -341,13 +888,14 @@ def learn_simplification_rules(spellvar_dictionary, freq_thresh, prec_thresh, ma
 @click.argument('spellvar_dictionary', type=JsonOption())
 @click.option('-p', '--max_processes', type=click.INT, default=1)
 @click.option('-o', '--output_file', type=click.File('w'))
-def learn_edit_probabilities(spellvar_dictionary, max_processes, output_file):
+@click.option('-c', '--counts_file', type=click.Path(dir_okay=False))
+def learn_edit_probabilities(spellvar_dictionary, max_processes, output_file, counts_file):
 
     ## 0 or negative numbers for allowing as many processes as cores
     if max_processes < 1:
         max_processes = multiprocessing.cpu_count()
 
     probabilities = spellvardetection.util.learn_edit_probabilities.getProbabilitiesFromSpellvars(
-        spellvar_dictionary, max_processes)
+        spellvar_dictionary, max_processes, counts_file)
 
     click.echo(json.dumps(probabilities), file=output_file)
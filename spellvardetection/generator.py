@@ -6,8 +6,10 @@ import re
 import collections
 import math
 import functools
+import os
 from typing import Sequence
 
+import spellvardetection.lib.clusters
 from spellvardetection.lib.lev_aut import DictAutomaton
 import spellvardetection.lib.util
 from spellvardetection.type_filter import _AbstractTypeFilter
@@ -32,20 +34,28 @@ class _AbstractCandidateGenerator(metaclass=abc.ABCMeta):
 
         self.dictionary = dictionary
 
-    def getCandidatesForWords(self, words):
+    def iterCandidatesForWords(self, words, chunk_size=10000):
+        """Generate (word, candidates) pairs for the words.
+
+        The words are read lazily: with multiprocessing they are processed
+        in chunks of chunk_size words.
+        """
 
         ## only use multiprocessing if number of max_processes is not 1
         if self.max_processes == 1:
-            return {
-                word: candidates for word, candidates in map(self.__getWordCandidatesPair, words)
-            }
+            yield from map(self.__getWordCandidatesPair, words)
         else:
             with multiprocessing.Pool(self.max_processes) as pool:
-                return {
-                    word: candidates for word, candidates in pool.map(
+                for chunk in spellvardetection.lib.util.chunked(words, chunk_size):
+                    yield from pool.map(
                         functools.partial(spellvardetection.lib.util._unwrap_self, function_name="_AbstractCandidateGenerator__getWordCandidatesPair"),
-                        zip([self]*len(words), words))
-                }
+                        zip([self]*len(chunk), chunk))
+
+    def getCandidatesForWords(self, words):
+
+        return {
+            word: candidates for word, candidates in self.iterCandidatesForWords(words)
+        }
 
 class GeneratorUnion(_AbstractCandidateGenerator):
 
@@ -301,6 +311,81 @@ class LevenshteinNormalizedGenerator(_LevenshteinAutomatonGenerator):
         return super()._getCandidatesForWord(word, min(self.max_dist, dist))
 
 
+class ClusterGenerator(_AbstractCandidateGenerator):
+    """A spelling variant generator proposing the words of the same cluster.
+
+    Brown clusters are paths in a binary tree: the words of the dictionary
+    are indexed by the first prefix_length bits of the path of their
+    cluster (by the complete path if prefix_length is None), thus a short
+    prefix also proposes words from nearby clusters. With max_dist only
+    candidates within this Levenshtein distance are proposed.
+    """
+
+    name = 'cluster'
+
+    def create(cluster_type, cluster_file: os.PathLike, simplification_file=None, cache_file=None,
+               dictionary: set=None, prefix_length=None, max_dist=None,
+               transposition=False, merge_split=False, repetitions=False):
+
+        clusters = spellvardetection.lib.clusters.WordClusters(cluster_type, cluster_file, simplification_file, cache_file=cache_file)
+        return ClusterGenerator(clusters, dictionary, prefix_length, max_dist, transposition, merge_split, repetitions)
+
+    def __init__(self, clusters, dictionary: set=None, prefix_length=None, max_dist=None,
+                 transposition=False, merge_split=False, repetitions=False):
+
+        self.clusters = clusters
+        self.prefix_length = prefix_length
+        self.max_dist = max_dist
+        self.transposition = transposition
+        self.merge_split = merge_split
+        self.repetitions = repetitions
+
+        if dictionary is not None:
+            self.setDictionary(dictionary)
+
+    def _getBlock(self, word):
+
+        cluster = self.clusters.getCluster(word)
+        if cluster is None:
+            return None
+        return cluster[:self.prefix_length]
+
+    def _getBlockAutomaton(self, block):
+
+        ## automata are only created for the blocks that are used
+        if block not in self.block_automata:
+            self.block_automata[block] = DictAutomaton(self.blocks[block])
+        return self.block_automata[block]
+
+    def getCandidatesForWord(self, word):
+
+        if not hasattr(self, 'blocks'):
+            raise RuntimeError("Dictionary has to be set for generator of type " + self.name)
+
+        block = self._getBlock(word)
+        if block not in self.blocks:
+            return set()
+
+        if self.max_dist is None:
+            cands = set(self.blocks[block])
+        else:
+            cands = self._getBlockAutomaton(block).fuzzySearch(
+                word, self.max_dist, transposition=self.transposition, merge_split=self.merge_split, repetitions=self.repetitions)
+
+        cands.discard(word)
+        return cands
+
+    def setDictionary(self, dictionary: set):
+
+        self.blocks = {}
+        self.block_automata = {}
+
+        for word in dictionary:
+            block = self._getBlock(word)
+            if block is not None:
+                self.blocks.setdefault(block, set()).add(word)
+
+
 class _SetsimilarityGenerator(_AbstractCandidateGenerator):
 
     def __init__(self,
@@ -1,69 +1,115 @@
 # -*- coding: utf-8 -*-
 
 import csv
+import os
 
-class WordClusters:
+import numpy
 
-    def __init__(self, cluster_type, cluster_file, simplification_file=None, unknown_type=None):
+## cluster id of words without a cluster
+_NO_CLUSTER = -1
 
-        self.simplifications = {}
+class WordClusters:
+    """Clusters of words.
 
-        if simplification_file is not None:
-            with open(simplification_file, 'r', encoding='utf-8') as infile:
-                csvreader = csv.reader(infile, delimiter="\t", quoting=csv.QUOTE_NONE, quotechar="")
-                for row in csvreader:
-                    self.simplifications[row[0]] = row[1]
+    Each word of the vocabulary is mapped to an integer id of its cluster,
+    simplifications are compiled into this map, i.e. they are applied once
+    to the word that is looked up.
+
+    The parsed cluster file can be cached in a binary file (cache_file),
+    the cache is renewed if the cluster file changes.
+    """
 
-        self.cluster_words = {}
-        self.words_cluster = {}
+    def __init__(self, cluster_type, cluster_file, simplification_file=None, unknown_type=None, cache_file=None):
 
         self.cluster_type = cluster_type
         self.unknown_type = unknown_type
 
         if self.cluster_type == 'brown':
-            with open(cluster_file, 'r', encoding='utf-8') as infile:
-                csvreader = csv.reader(infile, delimiter="\t", quoting=csv.QUOTE_NONE, quotechar="")
-                for row in csvreader:
-                    self.words_cluster[row[1]] = row[0]
-                    self.cluster_words.setdefault(row[0] ,set()).add(row[1])
-
+            words, word_clusters, self.clusters = self._loadBrownClusters(cluster_file, cache_file)
         else:
             raise ValueError('Clusters of type "' + self.cluster_type + '" are not supported.')
 
-        if self.unknown_type is not None and self.unknown_type not in self.words_cluster:
+        self.cluster_ids = dict(zip(words, word_clusters))
+
+        if self.unknown_type is not None and self.unknown_type not in self.cluster_ids:
             raise ValueError('Unknown type ("' + self.unknown_type + '") must be in vocabulary.')
+        self.unknown_cluster = self.cluster_ids[self.unknown_type] if self.unknown_type is not None else _NO_CLUSTER
 
-    def isOOV(self, word):
+        ## a simplified word has the cluster of its simplification
+        if simplification_file is not None:
+            simplified_ids = {}
+            with open(simplification_file, 'r', encoding='utf-8') as infile:
+                csvreader = csv.reader(infile, delimiter="\t", quoting=csv.QUOTE_NONE)
+                for row in csvreader:
+                    simplified_ids[row[0]] = self.cluster_ids.get(row[1])
+            for word, cluster_id in simplified_ids.items():
+                if cluster_id is None:
+                    self.cluster_ids.pop(word, None)
+                else:
+                    self.cluster_ids[word] = cluster_id
 
-        if word in self.simplifications:
-            word = self.simplifications[word]
+    def _parseBrownClusters(self, cluster_file):
 
-        return word not in self.words_cluster
+        clusters = {}
+        words = []
+        word_clusters = []
 
-    def hasCluster(self, word):
+        with open(cluster_file, 'r', encoding='utf-8') as infile:
+            csvreader = csv.reader(infile, delimiter="\t", quoting=csv.QUOTE_NONE)
+            for row in csvreader:
+                words.append(row[1])
+                word_clusters.append(clusters.setdefault(row[0], len(clusters)))
 
-        return self.getCluster(word) is not None
+        return words, word_clusters, list(clusters.keys())
 
-    def getCluster(self, word):
+    def _loadBrownClusters(self, cluster_file, cache_file):
 
-        if word in self.simplifications:
-            word = self.simplifications[word]
+        if cache_file is None:
+            return self._parseBrownClusters(cluster_file)
 
-        if not self.isOOV(word):
-            return self.words_cluster[word]
+        source = [os.path.getsize(cluster_file), os.path.getmtime(cluster_file)]
 
-        elif self.unknown_type is not None:
-            return self.words_cluster[self.unknown_type]
+        if os.path.exists(cache_file):
+            with numpy.load(cache_file) as cache:
+                if cache['source'].tolist() == source:
+                    return str(cache['words']).split('\n'), cache['word_clusters'].tolist(), str(cache['clusters']).split('\n')
 
-        else:
-            return None
+        words, word_clusters, clusters = self._parseBrownClusters(cluster_file)
+        with open(cache_file, 'wb') as outfile:
+            numpy.savez(outfile, source=numpy.array(source), words='\n'.join(words),
+                        word_clusters=numpy.array(word_clusters, dtype=numpy.int32), clusters='\n'.join(clusters))
+
+        return words, word_clusters, clusters
+
+    def _getClusterId(self, word):
+
+        return self.cluster_ids.get(word, self.unknown_cluster)
+
+    def getClusterIds(self, words):
+
+        return numpy.fromiter((self.cluster_ids.get(word, self.unknown_cluster) for word in words), dtype=numpy.int64, count=len(words))
+
+    def isOOV(self, word):
+
+        return word not in self.cluster_ids
+
+    def hasCluster(self, word):
+
+        return self._getClusterId(word) != _NO_CLUSTER
+
+    def hasClusterMany(self, words):
+
+        return self.getClusterIds(words) != _NO_CLUSTER
+
+    def getCluster(self, word):
+
+        cluster_id = self._getClusterId(word)
+        return self.clusters[cluster_id] if cluster_id != _NO_CLUSTER else None
 
     def inSameCluster(self, word_a, word_b):
 
-        if word_a in self.simplifications:
-            word_a = self.simplifications[word_a]
+        return self._getClusterId(word_a) == self._getClusterId(word_b)
 
-        if word_b in self.simplifications:
-            word_b = self.simplifications[word_b]
+    def inSameClusterMany(self, word, candidates):
 
-        return self.getCluster(word_a) == self.getCluster(word_b)
+        return self.getClusterIds(candidates) == self._getClusterId(word)
@@ -1,10 +1,22 @@
 # -*- coding: utf-8 -*-
 
 import csv
+import os
 
 import numpy
 
+def _get_vocabulary_filename(embeddings_file):
+
+    return os.path.splitext(embeddings_file)[0] + '.vocab'
+
 class WordEmbeddings:
+    """Word embeddings stored as a matrix with one row per word.
+
+    Supported types are 'hyperwords' (a text file with a word and its vector
+    on each line) and 'binary' (a float32 matrix in a .npy file and the
+    words in a .vocab file next to it, see save). Binary embeddings are
+    memory-mapped, so they are loaded fast and shared by processes.
+    """
 
     def __init__(self, embeddings_type, embeddings_file, simplification_file=None, missing_words='zeros'):
 
@@ -12,37 +24,106 @@ class WordEmbeddings:
 
         if simplification_file is not None:
             with open(simplification_file, 'r', encoding='utf-8') as infile:
-                csvreader = csv.reader(infile, delimiter="\t", quoting=csv.QUOTE_NONE, quotechar="")
+                csvreader = csv.reader(infile, delimiter="\t", quoting=csv.QUOTE_NONE)
                 for row in csvreader:
                     self.simplifications[row[0]] = row[1]
 
         self.embeddings_type = embeddings_type
+        self.embeddings_file = embeddings_file
         if self.embeddings_type == 'hyperwords':
-            self.embeddings = {}
+            words = []
+            vectors = []
             with open(embeddings_file, 'r', encoding='utf-8') as embeddfile:
-                csvreader = csv.reader(embeddfile, delimiter=" ", quoting=csv.QUOTE_NONE, quotechar="")
+                csvreader = csv.reader(embeddfile, delimiter=" ", quoting=csv.QUOTE_NONE)
                 for row in csvreader:
-                    self.embeddings[row[0]] = numpy.array(row[1:]).astype(numpy.float)
+                    words.append(row[0])
+                    vectors.append(row[1:])
 
-            if len(self.embeddings.values()) == 0:
+            if len(vectors) == 0:
                 raise ValueError('Embedding file contains no embeddings.')
 
-            self.dim = len(list(self.embeddings.values())[0])
-            if missing_words == 'zeros':
-                self.missing = numpy.zeros(self.dim)
-            else:
-                self.missing = missing_words
+            self.vocabulary = {word: row for row, word in enumerate(words)}
+            self.vectors = numpy.array(vectors).astype(float)
+        elif self.embeddings_type == 'binary':
+            self._loadBinary()
         else:
             raise ValueError('Embeddings of type "' + self.embeddings_type + '" are not supported.')
 
+        self.dim = self.vectors.shape[1]
+        if missing_words == 'zeros':
+            self.missing = numpy.zeros(self.dim)
+        else:
+            self.missing = missing_words
+
+    def _loadBinary(self):
+
+        self.vectors = numpy.load(self.embeddings_file, mmap_mode='r')
+        with open(_get_vocabulary_filename(self.embeddings_file), 'r', encoding='utf-8', newline='') as vocfile:
+            self.vocabulary = {word: row for row, word in enumerate(vocfile.read().split('\n')[:len(self.vectors)])}
+
+    ## binary embeddings are not pickled but memory-mapped again
+    def __getstate__(self):
+
+        state = dict(self.__dict__)
+        if self.embeddings_type == 'binary':
+            del state['vectors']
+            del state['vocabulary']
+        return state
+
+    def __setstate__(self, state):
+
+        ## objects pickled with older versions store a dict of vectors
+        if 'embeddings' in state:
+            embeddings = state.pop('embeddings')
+            state['vocabulary'] = {word: row for row, word in enumerate(embeddings.keys())}
+            state['vectors'] = numpy.array(list(embeddings.values()))
+
+        self.__dict__.update(state)
+
+        if self.embeddings_type == 'binary':
+            self._loadBinary()
+
+    def save(self, outfile_name):
+        """Write the embeddings in the binary format (a .npy file and a .vocab
+        file with the same name)."""
+
+        words = sorted(self.vocabulary, key=self.vocabulary.get)
+        if any('\n' in word for word in words):
+            raise ValueError('Words must not contain newlines.')
+
+        if not outfile_name.endswith('.npy'):
+            outfile_name += '.npy'
+
+        numpy.save(outfile_name, numpy.asarray(self.vectors[[self.vocabulary[word] for word in words]], dtype=numpy.float32))
+        with open(_get_vocabulary_filename(outfile_name), 'w', encoding='utf-8', newline='') as vocfile:
+            vocfile.write('\n'.join(words))
+
+    def _getRow(self, word):
+
+        return self.vocabulary.get(self.simplifications.get(word, word))
 
     def get(self, word):
 
-        if word in self.simplifications:
-            word = self.simplifications[word]
+        row = self._getRow(word)
+        if row is None:
+            return self.missing
+        return self.vectors[row]
+
+    def getMany(self, words):
+        """Get a matrix with the embeddings of the words.
+
+        If missing words are not replaced (missing_words is None), their
+        rows are filled with NaN.
+        """
+
+        rows = numpy.array([self._getRow(word) for word in words], dtype=object)
+        known = numpy.array([row is not None for row in rows], dtype=bool)
+
+        embeddings = numpy.empty((len(words), self.dim), dtype=self.vectors.dtype)
+        embeddings[known] = self.vectors[rows[known].astype(numpy.int64)]
+        embeddings[~known] = numpy.nan if self.missing is None else self.missing
 
-        if self.embeddings_type == "hyperwords":
-            return self.embeddings.get(word, self.missing)
+        return embeddings
 
     def getDim(self):
 
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import collections.abc
+import contextlib
+import sys
+import threading
+
+
+def _estimate_size(value, depth=2):
+
+    size = sys.getsizeof(value)
+
+    if depth > 0:
+        if isinstance(value, dict):
+            size += sum(_estimate_size(key, depth - 1) + _estimate_size(item, depth - 1) for key, item in value.items())
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            size += sum(_estimate_size(item, depth - 1) for item in value)
+
+    return size
+
+
+class FeatureCache(collections.abc.MutableMapping):
+    """A feature cache that can be used instead of a plain dict.
+
+    The cache can be bounded by the number of entries (max_entries) and/or
+    by the estimated size of the cached features in bytes (max_memory). If
+    one of the bounds is exceeded, the least recently used entries are
+    evicted. Locking is only done if thread_safe is set, i.e. when the
+    cache is shared by multiple threads.
+
+    Reads that miss the cache can be forwarded to a read-only backend (e.g.
+    a precomputed feature store); features read from the backend are not
+    copied into the cache.
+    """
+
+    ## default for objects pickled without this attribute
+    thread_safe = False
+
+    def __init__(self, data=None, max_entries=None, max_memory=None, thread_safe=False, backend=None):
+
+        self.max_entries = max_entries
+        self.max_memory = max_memory
+        self.backend = backend
+
+        self.thread_safe = thread_safe
+        if thread_safe:
+            self._lock = threading.RLock()
+        else:
+            self._lock = contextlib.nullcontext()
+
+        self._entries = collections.OrderedDict()
+        self._sizes = {}
+        self.memory = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if data is not None:
+            self.update(data)
+
+    ## the lock cannot be pickled
+    def __getstate__(self):
+
+        state = dict(self.__dict__)
+        state['_lock'] = isinstance(self._lock, type(threading.RLock()))
+        return state
+
+    def __setstate__(self, state):
+
+        thread_safe = state.pop('_lock')
+        self.__dict__.update(state)
+        self._lock = threading.RLock() if thread_safe else contextlib.nullcontext()
+
+    def _evict(self):
+
+        while self._entries and (
+                (self.max_entries is not None and len(self._entries) > self.max_entries) or
+                (self.max_memory is not None and self.memory > self.max_memory)):
+            key, _ = self._entries.popitem(last=False)
+            self.memory -= self._sizes.pop(key)
+            self.evictions += 1
+
+    def __getitem__(self, key):
+
+        value = self.get(key, self)
+        if value is self:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+            if self.backend is not None:
+                value = self.backend.get(key, None)
+                if value is not None:
+                    self.hits += 1
+                    return value
+
+            self.misses += 1
+            return default
+
+    def getFeatures(self, data_key, key):
+        """Get the entry of a datapoint in a global cache (a dict with the
+        features for each extractor key) and the features for the given key.
+
+        Only requests that find the features for the key count as hits.
+        """
+
+        with self._lock:
+            entry = self._entries.get(data_key, None)
+            if entry is not None:
+                self._entries.move_to_end(data_key)
+                if key in entry:
+                    self.hits += 1
+                    return entry, entry[key]
+
+            if self.backend is not None:
+                if hasattr(self.backend, 'getFeatures'):
+                    ## only the features for the key are read from a feature store
+                    features = self.backend.getFeatures(data_key, key)
+                else:
+                    features = self.backend.get(data_key, {}).get(key, None)
+                if features is not None:
+                    self.hits += 1
+                    return entry, features
+
+            self.misses += 1
+            return entry, None
+
+    def peek(self, key, default=None):
+        """Get an entry without counting the request and without
+        reading from the backend."""
+
+        return self._entries.get(key, default)
+
+    def __setitem__(self, key, value):
+
+        with self._lock:
+            if key in self._entries:
+                self.memory -= self._sizes[key]
+            size = _estimate_size(key) + _estimate_size(value)
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._sizes[key] = size
+            self.memory += size
+            self._evict()
+
+    def __delitem__(self, key):
+
+        with self._lock:
+            del self._entries[key]
+            self.memory -= self._sizes.pop(key)
+
+    def __contains__(self, key):
+
+        return key in self._entries or (self.backend is not None and key in self.backend)
+
+    def __iter__(self):
+
+        return iter(list(self._entries.keys()))
+
+    def __len__(self):
+
+        return len(self._entries)
+
+    def clear(self):
+
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self.memory = 0
+
+    def getHitRate(self):
+
+        requests = self.hits + self.misses
+        return self.hits/requests if requests > 0 else 0.0
+
+    def getStatistics(self):
+
+        return {
+            'entries': len(self._entries),
+            'memory': self.memory,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.getHitRate(),
+            'evictions': self.evictions,
+        }
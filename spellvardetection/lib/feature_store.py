@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+
+import array
+import collections.abc
+import hashlib
+import json
+import numbers
+import os
+
+import numpy
+
+from spellvardetection.lib.hashed_set import HashedSet
+
+## a feature store is a directory containing
+## - datapoints: the keys of the datapoints, one per line (the line number is the row)
+## - datapoints.offsets: the start of each line in datapoints (and the end of the file) (int64)
+## - datapoints.hashes and datapoints.index: the sorted hashes of the keys (uint64) and their rows (int64),
+##   the index is memory-mapped, so the keys of the datapoints are not loaded into memory
+## - meta.json: the keys of the feature extractors and how their features are stored
+## for each feature extractor (numbered by its position in meta.json)
+## - features where each datapoint has a list or set of features are stored in CSR format
+##   with interned feature ids: <n>.indptr (int64), <n>.indices (int32) and <n>.vocabulary (one json-encoded feature per line)
+## - features where each datapoint has a single number are stored in <n>.values (float64)
+
+_DATAPOINTS_FILE = 'datapoints'
+_OFFSETS_FILE = 'datapoints.offsets'
+_HASHES_FILE = 'datapoints.hashes'
+_INDEX_FILE = 'datapoints.index'
+_META_FILE = 'meta.json'
+
+_INDPTR_TYPE = 'q'
+_INDICES_TYPE = 'i'
+_VALUES_TYPE = 'd'
+_HASH_TYPE = 'Q'
+
+
+def _hash_key(encoded_key):
+
+    ## python's hash is not stable across processes
+    return int.from_bytes(hashlib.blake2b(encoded_key, digest_size=8).digest(), 'little')
+
+def _get_kind(features):
+
+    if isinstance(features, numbers.Real):
+        return 'scalar'
+    return 'set' if isinstance(features, (set, frozenset)) else 'list'
+
+def _to_hashable(value):
+
+    if isinstance(value, list):
+        return tuple(_to_hashable(item) for item in value)
+    return value
+
+
+class FeatureStoreWriter:
+    """Writes features to a feature store while they are extracted.
+
+    Only the vocabulary of features and the hashes of the added datapoints
+    are kept in memory, the features of the datapoints are written to disk
+    in chunks. Datapoints that have already been added are skipped (very
+    rarely a new datapoint is skipped due to a hash collision).
+    """
+
+    def __init__(self, path, keys, buffer_size=1000000):
+
+        self.path = path
+        self.keys = list(keys)
+        self.buffer_size = buffer_size
+
+        os.makedirs(self.path, exist_ok=True)
+
+        self.rows = 0
+        self._added = HashedSet()
+        self._datapoints_file = open(os.path.join(self.path, _DATAPOINTS_FILE), 'wb')
+        self._offset = 0
+        self._index_files = {
+            'offsets': open(os.path.join(self.path, _OFFSETS_FILE), 'wb'),
+            'hashes': open(os.path.join(self.path, _HASHES_FILE), 'wb'),
+        }
+        self._index_buffers = {
+            'offsets': array.array(_INDPTR_TYPE, [0]),
+            'hashes': array.array(_HASH_TYPE),
+        }
+
+        self._kinds = [None] * len(self.keys)
+        self._vocabularies = [dict() for _ in self.keys]
+        self._files = [dict() for _ in self.keys]
+        self._buffers = [dict() for _ in self.keys]
+        self._nnz = [0] * len(self.keys)
+
+    def _filename(self, idx, suffix):
+
+        return os.path.join(self.path, str(idx) + '.' + suffix)
+
+    def _initKey(self, idx, kind):
+
+        self._kinds[idx] = kind
+        if kind == 'scalar':
+            self._buffers[idx]['values'] = array.array(_VALUES_TYPE)
+        else:
+            self._buffers[idx]['indptr'] = array.array(_INDPTR_TYPE, [0])
+            self._buffers[idx]['indices'] = array.array(_INDICES_TYPE)
+
+        for name in self._buffers[idx]:
+            self._files[idx][name] = open(self._filename(idx, name), 'wb')
+
+    def _flush(self, idx, force=False):
+
+        for name, buffer in self._buffers[idx].items():
+            if force or len(buffer) >= self.buffer_size:
+                buffer.tofile(self._files[idx][name])
+                del buffer[:]
+
+    def _flushIndex(self, force=False):
+
+        for name, buffer in self._index_buffers.items():
+            if force or len(buffer) >= self.buffer_size:
+                buffer.tofile(self._index_files[name])
+                del buffer[:]
+
+    def add(self, data_key, features_by_key):
+        """Add the features of a datapoint, returns False if the datapoint
+        has already been added."""
+
+        if '\n' in data_key:
+            raise ValueError('Keys of datapoints must not contain newlines.')
+
+        if set(features_by_key.keys()) != set(self.keys):
+            raise ValueError('Features have to be given for all keys of the feature store.')
+
+        ## all features are checked before the datapoint is written
+        kinds = [_get_kind(features_by_key[key]) for key in self.keys]
+        for idx, key in enumerate(self.keys):
+            if self._kinds[idx] is not None and kinds[idx] != self._kinds[idx]:
+                raise ValueError(
+                    'The features for key ' + str(key) + ' of datapoint ' + data_key + ' are of kind ' + kinds[idx] +
+                    ', but the features of the previous datapoints are of kind ' + self._kinds[idx] + '.')
+
+        encoded_key = data_key.encode('utf-8')
+        key_hash = _hash_key(encoded_key)
+        if not self._added.add(key_hash):
+            return False
+
+        for idx, key in enumerate(self.keys):
+
+            features = features_by_key[key]
+            if self._kinds[idx] is None:
+                self._initKey(idx, kinds[idx])
+
+            if self._kinds[idx] == 'scalar':
+                self._buffers[idx]['values'].append(float(features))
+            else:
+                vocabulary = self._vocabularies[idx]
+                ids = [vocabulary.setdefault(_to_hashable(feature), len(vocabulary)) for feature in features]
+                self._buffers[idx]['indices'].extend(ids)
+                self._nnz[idx] += len(ids)
+                self._buffers[idx]['indptr'].append(self._nnz[idx])
+
+            self._flush(idx)
+
+        self._datapoints_file.write(encoded_key + b'\n')
+        self._offset += len(encoded_key) + 1
+        self._index_buffers['offsets'].append(self._offset)
+        self._index_buffers['hashes'].append(key_hash)
+        self._flushIndex()
+        self.rows += 1
+
+        return True
+
+    def _writeIndex(self):
+
+        ## the hashes are sorted once all datapoints have been added
+        hashes = numpy.fromfile(os.path.join(self.path, _HASHES_FILE), dtype=numpy.uint64)
+        order = numpy.argsort(hashes, kind='stable')
+        hashes[order].tofile(os.path.join(self.path, _HASHES_FILE))
+        order.astype(numpy.int64).tofile(os.path.join(self.path, _INDEX_FILE))
+
+    def close(self):
+
+        meta = {'datapoints': self.rows, 'keys': []}
+
+        for idx, key in enumerate(self.keys):
+
+            if self._kinds[idx] is None:
+                ## no datapoints have been added
+                self._initKey(idx, 'list')
+
+            self._flush(idx, force=True)
+            for featfile in self._files[idx].values():
+                featfile.close()
+
+            if self._kinds[idx] != 'scalar':
+                with open(self._filename(idx, 'vocabulary'), 'w', encoding='utf-8') as vocfile:
+                    for feature in self._vocabularies[idx]:
+                        vocfile.write(json.dumps(feature) + '\n')
+
+            meta['keys'].append({'key': key, 'kind': self._kinds[idx]})
+
+        self._datapoints_file.close()
+        self._flushIndex(force=True)
+        for index_file in self._index_files.values():
+            index_file.close()
+        self._writeIndex()
+
+        with open(os.path.join(self.path, _META_FILE), 'w', encoding='utf-8') as metafile:
+            json.dump(meta, metafile)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class FeatureStore(collections.abc.Mapping):
+    """Read access to a feature store written by FeatureStoreWriter.
+
+    The arrays of the store are memory-mapped, features are converted into
+    python objects when they are requested. It maps keys of datapoints to
+    dicts with the features for each extractor key, i.e. it can be used
+    like a global feature cache.
+    """
+
+    def __init__(self, path):
+
+        self.path = path
+
+        with open(os.path.join(self.path, _META_FILE), 'r', encoding='utf-8') as metafile:
+            meta = json.load(metafile)
+
+        self.size = meta['datapoints']
+        self._datapoints = self._memmap(os.path.join(self.path, _DATAPOINTS_FILE), numpy.uint8)
+        self._offsets = self._memmap(os.path.join(self.path, _OFFSETS_FILE), numpy.int64)
+        self._hashes = self._memmap(os.path.join(self.path, _HASHES_FILE), numpy.uint64)
+        self._index = self._memmap(os.path.join(self.path, _INDEX_FILE), numpy.int64)
+
+        self.keys_info = {}
+        for idx, key_info in enumerate(meta['keys']):
+            info = {'kind': key_info['kind']}
+            if info['kind'] == 'scalar':
+                info['values'] = self._memmap(self._filename(idx, 'values'), numpy.float64)
+            else:
+                info['indptr'] = self._memmap(self._filename(idx, 'indptr'), numpy.int64)
+                info['indices'] = self._memmap(self._filename(idx, 'indices'), numpy.int32)
+                info['vocabulary_file'] = self._filename(idx, 'vocabulary')
+            self.keys_info[key_info['key']] = info
+
+    def _filename(self, idx, suffix):
+
+        return os.path.join(self.path, str(idx) + '.' + suffix)
+
+    def _memmap(self, filename, dtype):
+
+        ## empty files cannot be memory-mapped
+        if os.path.getsize(filename) == 0:
+            return numpy.zeros(0, dtype=dtype)
+        return numpy.memmap(filename, dtype=dtype, mode='r')
+
+    def _getVocabulary(self, info):
+
+        ## the vocabulary is only loaded when it is needed
+        if 'vocabulary' not in info:
+            with open(info['vocabulary_file'], 'r', encoding='utf-8') as vocfile:
+                info['vocabulary'] = [_to_hashable(json.loads(line)) for line in vocfile]
+        return info['vocabulary']
+
+    def getKeys(self):
+
+        return list(self.keys_info.keys())
+
+    def _getKeyOfRow(self, row):
+
+        return self._datapoints[self._offsets[row]:self._offsets[row + 1] - 1].tobytes().decode('utf-8')
+
+    def getRow(self, data_key):
+        """Get the row of a datapoint using the index, None if the datapoint
+        is not in the store."""
+
+        encoded_key = data_key.encode('utf-8')
+        key_hash = numpy.uint64(_hash_key(encoded_key))
+
+        position = int(numpy.searchsorted(self._hashes, key_hash))
+        while position < len(self._hashes) and self._hashes[position] == key_hash:
+            row = int(self._index[position])
+            ## different keys can have the same hash
+            if self._datapoints[self._offsets[row]:self._offsets[row + 1] - 1].tobytes() == encoded_key:
+                return row
+            position += 1
+
+        return None
+
+    def getFeatures(self, data_key, key, default=None):
+        """Get the features of a datapoint for a single extractor key, only
+        these features are decoded."""
+
+        row = self.getRow(data_key)
+        info = self.keys_info.get(key, None)
+        if row is None or info is None:
+            return default
+
+        if info['kind'] == 'scalar':
+            return float(info['values'][row])
+
+        vocabulary = self._getVocabulary(info)
+        features = [vocabulary[feature_id] for feature_id in info['indices'][info['indptr'][row]:info['indptr'][row + 1]]]
+        if info['kind'] == 'set':
+            return set(features)
+        return features
+
+    def __getitem__(self, data_key):
+
+        if self.getRow(data_key) is None:
+            raise KeyError(data_key)
+        return {key: self.getFeatures(data_key, key) for key in self.keys_info}
+
+    def __contains__(self, data_key):
+
+        return self.getRow(data_key) is not None
+
+    def __iter__(self):
+
+        return (self._getKeyOfRow(row) for row in range(self.size))
+
+    def __len__(self):
+
+        return self.size
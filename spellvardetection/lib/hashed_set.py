@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import numpy
+
+_HASH_MASK = 0xFFFFFFFFFFFFFFFF
+
+
+class HashedSet:
+    """A compact set that only stores 64 bit hashes of its elements.
+
+    An element takes 8 bytes, but (very rarely) an element that has not been
+    added is found due to a hash collision. The hashes are Python's hashes,
+    i.e. they are only valid in the process that created the set.
+
+    New hashes are collected in a buffer of buffer_size elements, full
+    buffers are merged into sorted arrays of decreasing size, so there are
+    only logarithmically many arrays to search.
+    """
+
+    def __init__(self, elements=(), buffer_size=100000):
+
+        self.buffer_size = buffer_size
+        self.buffer = set()
+        self.levels = []
+
+        for element in elements:
+            self.add(element)
+
+    def _hash(self, element):
+
+        return hash(element) & _HASH_MASK
+
+    def _containsHash(self, element_hash):
+
+        if element_hash in self.buffer:
+            return True
+
+        element_hash = numpy.uint64(element_hash)
+        for level in self.levels:
+            index = numpy.searchsorted(level, element_hash)
+            if index < len(level) and level[index] == element_hash:
+                return True
+
+        return False
+
+    def __contains__(self, element):
+
+        return self._containsHash(self._hash(element))
+
+    def add(self, element):
+        """Add an element, returns False if it was already in the set."""
+
+        element_hash = self._hash(element)
+        if self._containsHash(element_hash):
+            return False
+
+        self.buffer.add(element_hash)
+        if len(self.buffer) >= self.buffer_size:
+            self._flush()
+
+        return True
+
+    def _flush(self):
+
+        level = numpy.array(sorted(self.buffer), dtype=numpy.uint64)
+        self.buffer = set()
+
+        ## the levels are disjoint, merging them is just sorting
+        while self.levels and len(self.levels[-1]) <= len(level):
+            level = numpy.sort(numpy.concatenate([self.levels.pop(), level]), kind='mergesort')
+
+        self.levels.append(level)
+
+    def __len__(self):
+
+        return len(self.buffer) + sum(len(level) for level in self.levels)
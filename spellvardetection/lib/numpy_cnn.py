@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import numpy
+
+## forward pass of the networks built by CNNTokenFilter using only numpy
+
+
+def relu(x):
+
+    return numpy.maximum(x, 0)
+
+
+def sigmoid(x):
+
+    return 1/(1 + numpy.exp(-x))
+
+
+def conv1d_same(x, kernel, bias):
+    """1D convolution with padding 'same' (as in Keras).
+
+    x has the shape (batch, length, channels), kernel has the shape
+    (width, channels, filters).
+    """
+
+    width = kernel.shape[0]
+    ## for even widths the additional padding is on the right
+    pad_left = (width - 1)//2
+    x = numpy.pad(x, ((0, 0), (pad_left, width - 1 - pad_left), (0, 0)))
+
+    length = x.shape[1] - width + 1
+    output = numpy.broadcast_to(bias, (x.shape[0], length, kernel.shape[2])).copy()
+    for offset in range(width):
+        output += x[:, offset:offset + length, :] @ kernel[offset]
+
+    return output
+
+
+def conv_max_pooling(x, convolutions):
+
+    return numpy.concatenate([relu(conv1d_same(x, kernel, bias)).max(axis=1) for kernel, bias in convolutions], axis=1)
+
+
+class ConvolutionalNetwork:
+    """Convolutional network over a sequence of words.
+
+    The words are represented by given embeddings and/or by features
+    from convolutions over character embeddings.
+    """
+
+    def __init__(self, convolutions, dense, char_embedding=None, char_convolutions=None):
+
+        self.convolutions = convolutions
+        self.dense = dense
+        self.char_embedding = char_embedding
+        self.char_convolutions = char_convolutions
+
+    def predict(self, embedding_sequences=None, char_sequences=None):
+        """Returns the predicted probabilities.
+
+        embedding_sequences has the shape (batch, sequence length,
+        embedding dim), char_sequences (batch, sequence length, word length).
+        """
+
+        sequence = []
+
+        if embedding_sequences is not None:
+            sequence.append(numpy.asarray(embedding_sequences, dtype='float32'))
+
+        if char_sequences is not None:
+            batch_size, sequence_len, word_len = char_sequences.shape
+            char_embeddings = self.char_embedding[char_sequences.reshape(batch_size*sequence_len, word_len)]
+            sequence.append(conv_max_pooling(char_embeddings, self.char_convolutions).reshape(batch_size, sequence_len, -1))
+
+        features = conv_max_pooling(numpy.concatenate(sequence, axis=2), self.convolutions)
+
+        kernel, bias = self.dense
+        return sigmoid(features @ kernel + bias).reshape(-1)
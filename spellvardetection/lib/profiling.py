@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+import contextlib
+import datetime
+import json
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+## stages used in the code base
+DICTIONARY = 'dictionary'
+GENERATION = 'generation'
+FILTERING = 'filtering'
+FEATURE_EXTRACTION = 'feature_extraction'
+INFERENCE = 'inference'
+IO = 'io'
+
+_NULL_CONTEXT = contextlib.nullcontext()
+
+## the active timer, stages are only timed if there is one
+_timer = None
+
+
+def get_peak_memory():
+
+    if resource is None:  # pragma: no cover
+        return None
+    ## kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class StageTimer:
+    """Measure the time spent in the stages of a run.
+
+    Stages can be nested, the time of a nested stage is not counted for the
+    enclosing stage. Only stages entered in the thread that created the
+    timer are measured; work done in other threads or processes is counted
+    for the stage that waits for it.
+    """
+
+    def __init__(self):
+
+        self.stages = {}
+        self.stack = []
+        self.thread_id = threading.get_ident()
+        self.started = datetime.datetime.now().isoformat()
+        self.start_time = time.perf_counter()
+        self.last_switch = self.start_time
+
+    def _switch(self):
+
+        now = time.perf_counter()
+        if self.stack:
+            self.stages[self.stack[-1]][1] += now - self.last_switch
+        self.last_switch = now
+
+    @contextlib.contextmanager
+    def stage(self, name):
+
+        self._switch()
+        self.stages.setdefault(name, [0, 0.0])[0] += 1
+        self.stack.append(name)
+        try:
+            yield
+        finally:
+            self._switch()
+            self.stack.pop()
+
+    def getCurrentStage(self):
+
+        return self.stack[-1] if self.stack else None
+
+    def getReport(self):
+
+        ## the copy of the dict is atomic, so a report can be created from another thread
+        stages = {name: {'calls': calls, 'seconds': seconds} for name, (calls, seconds) in dict(self.stages).items()}
+        total = time.perf_counter() - self.start_time
+
+        return {
+            'started': self.started,
+            'total_seconds': total,
+            'other_seconds': total - sum(stage['seconds'] for stage in stages.values()),
+            'peak_memory_kb': get_peak_memory(),
+            'stages': stages,
+        }
+
+
+class Sampler(threading.Thread):
+    """Append a report of the timer (and the current stage) to a JSON Lines
+    file every interval seconds."""
+
+    def __init__(self, timer, outfile_name, interval=10.0):
+
+        super().__init__(daemon=True)
+        self.timer = timer
+        self.outfile_name = outfile_name
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def sample(self):
+
+        with open(self.outfile_name, 'a', encoding='utf-8') as outfile:
+            outfile.write(json.dumps({**self.timer.getReport(), 'current_stage': self.timer.getCurrentStage()}) + '\n')
+
+    def run(self):
+
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+
+        self.stopped.set()
+        self.join()
+        self.sample()
+
+
+def enable():
+
+    global _timer
+    _timer = StageTimer()
+    return _timer
+
+def disable():
+
+    global _timer
+    _timer = None
+
+def stage(name):
+    """Context manager timing a stage, does nothing if profiling is not enabled."""
+
+    if _timer is None or _timer.thread_id != threading.get_ident():
+        return _NULL_CONTEXT
+    return _timer.stage(name)
+
+def timed_iter(iterable, name):
+    """Iterate over iterable, the time for getting the elements is counted
+    for the given stage (but not the time the consumer needs)."""
+
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            try:
+                element = next(iterator)
+            except StopIteration:
+                return
+        yield element
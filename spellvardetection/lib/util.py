@@ -1,11 +1,16 @@
 # -*- coding: utf-8 -*-
 
+import collections
+import itertools
+import random
 import statistics
 import inspect
 
 import jsonpickle
 import numpy
 
+from spellvardetection.lib import profiling
+
 def load_from_file_if_string(option):
     if isinstance(option, str):
         try:
@@ -17,6 +22,55 @@ def load_from_file_if_string(option):
     else:
         return option
 
+class JsonLinesFile:
+    """A JSON Lines file, i.e. a file with one json document per line.
+
+    The documents are read one after another whenever the file is iterated.
+    """
+
+    def __init__(self, filename):
+
+        self.filename = filename
+
+    def __iter__(self):
+
+        with open(self.filename, 'r', encoding='utf-8') as jsonfile:
+            for line in profiling.timed_iter(jsonfile, profiling.IO):
+                if line.strip():
+                    with profiling.stage(profiling.IO):
+                        document = jsonpickle.decode(line)
+                    yield document
+
+def get_candidate_items(candidates):
+    """Get (type, candidates) pairs from a dict or from records of the form
+    {"type": ..., "candidates": [...]} (as in a JSON Lines file)."""
+
+    if isinstance(candidates, dict):
+        return candidates.items()
+    return ((record['type'], record['candidates']) for record in candidates)
+
+def chunked(iterable, size):
+    """Split an iterable into lists with (at most) size elements."""
+
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def count_in_chunks(count_function, elements, pool=None, chunk_size=10000):
+    """Apply count_function (returning a Counter) to chunks of the elements
+    and merge the counts, the chunks are distributed to the pool if given."""
+
+    chunks = chunked(elements, chunk_size)
+
+    counts = collections.Counter()
+    for chunk_counts in (pool.imap_unordered(count_function, chunks) if pool is not None else map(count_function, chunks)):
+        counts.update(chunk_counts)
+
+    return counts
+
 ### this function is used to allow to use an instance method in pool.map
 ### based on http://www.rueckstiess.net/research/snippets/show/ca1d7d90
 def _unwrap_self(arg, function_name, **kwarg):
@@ -27,21 +81,20 @@ def nw_alignment(type_a, type_b, empty_char='-'):
     mismatch_cost = 1
 
     ### initalize cost matrix
-    cost_matrix = numpy.zeros((len(type_a) + 1, len(type_b) + 1), dtype = int)
-
-    for i in range(len(type_a) + 1):
-        cost_matrix[i][0] = i*mismatch_cost
-
-    for i in range(len(type_b) + 1):
-        cost_matrix[0][i] = i*mismatch_cost
+    ### (nested lists are much faster than a numpy array for accessing single cells)
+    cost_matrix = [[i*mismatch_cost] + [0]*len(type_b) for i in range(len(type_a) + 1)]
+    cost_matrix[0] = [i*mismatch_cost for i in range(len(type_b) + 1)]
 
     for i in range(1, len(type_a) + 1):
+        previous_row = cost_matrix[i-1]
+        row = cost_matrix[i]
+        char_a = type_a[i-1]
         for j in range(1, len(type_b) + 1):
-            if type_a[i-1] == type_b[j-1]:
+            if char_a == type_b[j-1]:
                 align_cost = 0
             else:
                 align_cost = mismatch_cost
-            cost_matrix[i][j] = min(cost_matrix[i-1][j-1] + align_cost, cost_matrix[i-1][j] + mismatch_cost, cost_matrix[i][j-1] + mismatch_cost)
+            row[j] = min(previous_row[j-1] + align_cost, previous_row[j] + mismatch_cost, row[j-1] + mismatch_cost)
 
     ### backtrack
     alignment = []
@@ -97,57 +150,111 @@ def get_alignment(type_a, type_b, directed=False, conflate_id_pairs=False, empty
 
 def evaluate(tokens, dictionary={}, known_dict={}, freq_dict={}):
 
-    def isFrequent(toktext):
-        return freq_dict.get(toktext, 0) > 9
+    return evaluate_thresholds(tokens, [None], dictionary, known_dict, freq_dict)[0]
+
+def evaluate_thresholds(tokens, thresholds, dictionary={}, known_dict={}, freq_dict={}):
+    """Evaluate predictions with scores for multiple thresholds at once.
 
-    tp = 0
-    fp = 0
-    fn = 0
+    The filtered candidates of the tokens are either variants or pairs of a
+    variant and its score. Variants without a score are always predicted,
+    a threshold of None predicts all variants. For each threshold,
+    precision, recall, f1 and the mean and standard deviation of the number
+    of predicted variants per token are returned.
+    """
 
-    number_of_candidates = []
+    frequent = set([word for word, freq in freq_dict.items() if freq > 9])
+
+    ## all predicted pairs with their score, whether they are gold pairs and their token
+    scores = []
+    is_gold = []
+    token_ids = []
+    number_of_gold = 0
+    number_of_tokens = 0
 
     for token in tokens:
         type_text = token['type']
 
-        ## skip known words
-        if type_text in known_dict:
-            continue
-
-        ## skip frequent words
-        if isFrequent(type_text):
+        ## skip known and frequent words
+        if type_text in known_dict or type_text in frequent:
             continue
 
         gold_variants = set(token['variants'])
-        pred_variants = set(token['filtered_candidates'])
-
         if dictionary:
-            gold_variants = gold_variants.intersection(dictionary)
-            pred_variants = pred_variants.intersection(dictionary)
-
+            gold_variants.intersection_update(dictionary)
         ## filter frequent spelling variants
-        gold_variants = set([variant for variant in gold_variants if not isFrequent(variant)])
-        pred_variants = set([variant for variant in pred_variants if not isFrequent(variant)])
+        gold_variants.difference_update(frequent)
+
+        pred_variants = {}
+        for candidate in token['filtered_candidates']:
+            variant, score = (candidate, float('inf')) if isinstance(candidate, str) else candidate
+            pred_variants[variant] = max(score, pred_variants.get(variant, score))
+
+        for variant, score in pred_variants.items():
+            if (dictionary and variant not in dictionary) or variant in frequent:
+                continue
+            scores.append(score)
+            is_gold.append(variant in gold_variants)
+            token_ids.append(number_of_tokens)
+
+        number_of_gold += len(gold_variants)
+        number_of_tokens += 1
+
+    scores = numpy.array(scores, dtype=float)
+    is_gold = numpy.array(is_gold, dtype=bool)
+    token_ids = numpy.array(token_ids, dtype=numpy.int64)
 
-        tp += len(gold_variants.intersection(pred_variants))
-        fp += len(pred_variants.difference(gold_variants))
-        fn += len(gold_variants.difference(pred_variants))
+    results = []
+    for threshold in thresholds:
+        predicted = numpy.ones(len(scores), dtype=bool) if threshold is None else scores >= threshold
 
-        number_of_candidates.append(len(pred_variants))
+        tp = int(numpy.count_nonzero(predicted & is_gold))
+        fp = int(numpy.count_nonzero(predicted)) - tp
+        fn = number_of_gold - tp
 
+        precision = tp/(tp + fp) if tp + fp > 0 else 1
+        recall = tp/(tp + fn) if tp + fn > 0 else 1
+        f1 = 2*(precision * recall)/(precision + recall) if precision + recall > 0 else 0
 
-    precision = tp/(tp + fp) if tp + fp > 0 else 1
-    recall = tp/(tp + fn) if tp + fn > 0 else 1
-    f1 = 2*(precision * recall)/(precision + recall) if precision + recall > 0 else 0
+        number_of_candidates = numpy.bincount(token_ids[predicted], minlength=number_of_tokens).tolist()
 
-    return [precision, recall, f1,
-            statistics.mean(number_of_candidates),
-            statistics.stdev(number_of_candidates)]
+        results.append([precision, recall, f1,
+                        statistics.mean(number_of_candidates),
+                        statistics.stdev(number_of_candidates)])
+
+    return results
+
+def iterPairsFromSpellvardict(spellvardict):
+    """Generate the (sorted) pairs of a spelling variant dictionary (or of
+    its records), pairs can be generated more than once."""
+
+    for word, spellvars in get_candidate_items(spellvardict):
+        for spellvar in spellvars:
+            yield tuple(sorted((word, spellvar)))
 
 def getPairsFromSpellvardict(spellvardict):
 
-    return set([
-        tuple(sorted((word, spellvar))) for word, spellvars in spellvardict.items() for spellvar in spellvars
-    ])
+    return set(iterPairsFromSpellvardict(spellvardict))
+
+class ReservoirSample:
+    """A uniform random sample of at most size elements from a stream of
+    elements (reservoir sampling)."""
+
+    def __init__(self, size, rng=random):
+
+        self.size = size
+        self.rng = rng
+        self.elements = []
+        self.count = 0
+
+    def add(self, element):
+
+        self.count += 1
+        if len(self.elements) < self.size:
+            self.elements.append(element)
+        else:
+            index = self.rng.randrange(self.count)
+            if index < self.size:
+                self.elements[index] = element
 
 def getTrueAndFalsePairs(spellvardict, generator, max_processes=None):
 
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+import importlib
+import os
+import typing
+
+import joblib
+from sklearn.base import ClassifierMixin
+from sklearn.pipeline import Pipeline, FeatureUnion
+from sklearn.utils.metaestimators import _BaseComposition
+from sklearn.svm import SVC
+from sklearn.utils import shuffle
+
+from imblearn.ensemble import BalancedBaggingClassifier
+
+from spellvardetection.lib import profiling
+from spellvardetection.type_filter import _AbstractTrainableTypeFilter
+from spellvardetection.util.feature_extractor import FeatureExtractorMixin
+from spellvardetection.util.sklearn_feature_extractor import SurfaceExtractor
+
+
+class SKLearnClassifierBasedTypeFilter(_AbstractTrainableTypeFilter, _BaseComposition, ClassifierMixin):
+
+    name = 'sklearn'
+
+    def create(modelfile_name: os.PathLike, max_processes=1):
+        filter_ = SKLearnClassifierBasedTypeFilter.load(modelfile_name)
+        ## the model may have been trained with multiple processes
+        filter_.setMaxProcesses(max_processes)
+        return filter_
+
+
+    def create_for_training(classifier_clsname,
+                            feature_extractors: typing.Sequence[FeatureExtractorMixin],
+                            classifier_params=None,
+                            chunk_size=None,
+                            max_processes=1,
+                            seed=0):
+
+        ## instantiate classifier
+        if classifier_clsname == '__svm__':
+            classifier = SVC(gamma=0.1, C=2)
+        elif classifier_clsname == '__bagging_svm__':
+            classifier = BalancedBaggingClassifier(
+                base_estimator=SVC(gamma=0.1, C=2),
+                n_estimators=10,
+                bootstrap=False,
+                sampling_strategy='majority'
+            )
+        elif '.' in classifier_clsname:
+            module_name, cls_name = classifier_clsname.rsplit('.', 1)
+            module = importlib.import_module(module_name)
+            classifier = getattr(module, cls_name)()
+        else:
+            classifier = globals()[classifier_clsname]()
+
+        extractors = [(str(idx), extractor) for idx, extractor in enumerate(feature_extractors)]
+        filter_ = SKLearnClassifierBasedTypeFilter(classifier, extractors, chunk_size, max_processes, seed)
+
+        ## set after the number of processes, so that explicitly given parameters (e.g. n_jobs) are kept
+        if classifier_params is not None:
+            filter_.classifier.set_params(**classifier_params)
+
+        return filter_
+
+    ## defaults for objects pickled without these attributes
+    chunk_size = None
+    seed = 0
+
+    def __init__(self, classifier=None, feature_extractors=None, chunk_size=None, max_processes=1, seed=0):
+
+        if classifier is None:
+            self.classifier = SVC()
+        else:
+            self.classifier = classifier
+
+        if feature_extractors is None:
+            self.feature_extractors = [('surface', SurfaceExtractor())]
+        else:
+            self.feature_extractors = feature_extractors
+
+        ## if chunk_size is set, the classifier is trained incrementally on chunks of this size
+        self.chunk_size = chunk_size
+        ## seed for shuffling the training data before it is split into chunks (None for a random order)
+        self.seed = seed
+
+        self.setMaxProcesses(max_processes)
+
+    def _getNJobs(self):
+
+        return self.max_processes if self.max_processes != 1 else None
+
+    def setMaxProcesses(self, processes):
+
+        super().setMaxProcesses(processes)
+
+        ## ensemble classifiers (e.g. __bagging_svm__) train and predict in parallel
+        ## n_jobs is also reset for a single process, so no nested pools are started in filter workers
+        if 'n_jobs' in self.classifier.get_params(deep=False):
+            self.classifier.set_params(n_jobs=self._getNJobs())
+        if hasattr(self, '_clf'):
+            self._clf.named_steps['features'].set_params(n_jobs=self._getNJobs())
+
+
+    def fit(self, X_data, Y_data=None):
+        ## feature extractors are run in parallel processes if max_processes is not 1
+        ## (extractors get their feature cache back when they are returned to this process,
+        ## in the worker processes only a feature store used as backend of the cache is available)
+        self._clf = Pipeline([
+            ('features', FeatureUnion(transformer_list=self.feature_extractors, n_jobs=self._getNJobs())),
+            ('clf', self.classifier),
+        ])
+        self._clf.fit(X_data, Y_data)
+
+        return self
+
+    def partial_fit(self, X_data, Y_data, classes=None):
+
+        ## feature extractors are fitted on the first chunk
+        ## use stateless extractors (e.g. hashed surface features) for out-of-core training
+        if not hasattr(self, '_clf'):
+            features = FeatureUnion(transformer_list=self.feature_extractors, n_jobs=self._getNJobs())
+            features.fit(X_data, Y_data)
+            self._clf = Pipeline([
+                ('features', features),
+                ('clf', self.classifier),
+            ])
+
+        self.classifier.partial_fit(self._clf.named_steps['features'].transform(X_data), Y_data, classes=classes)
+
+        return self
+
+    def predict(self, X_data):
+        try:
+            getattr(self, "_clf")
+        except AttributeError:
+            raise RuntimeError("Classifier has to be trained!")
+
+        with profiling.stage(profiling.INFERENCE):
+            return(self._clf.predict(X_data))
+
+    def get_params(self, deep=True):
+
+        features = self._get_params('feature_extractors', deep=deep)
+        if deep:
+            features = {**features, **{'classifier__' + key: value for key, value in self.classifier.get_params(deep=deep).items()}}
+
+        return features
+
+    def set_params(self, **params):
+
+        self._set_params('feature_extractors', **params)
+
+
+    def train(self, positive_pairs, negative_pairs):
+
+        X = (positive_pairs + negative_pairs)
+        Y = [1]*len(positive_pairs) + [0]*len(negative_pairs)
+
+        if self.chunk_size is None:
+            self.fit(X, Y)
+        else:
+            X, Y = shuffle(X, Y, random_state=self.seed)
+            for start in range(0, len(X), self.chunk_size):
+                self.partial_fit(X[start:start + self.chunk_size], Y[start:start + self.chunk_size], classes=[0, 1])
+
+    def isPair(self, word, candidate):
+
+        if self.predict([(word, candidate)]) == 1:
+            return True
+        else:
+            return False
+
+    def filterCandidates(self, word, candidates):
+
+        ## classify all candidates at once
+        candidates = list(candidates)
+        if not candidates:
+            return set()
+
+        predictions = self.predict([(word, candidate) for candidate in candidates])
+        return set([candidate for candidate, prediction in zip(candidates, predictions) if prediction == 1])
+
+    def load(modelfile_name):
+        return joblib.load(modelfile_name)
+
+    def save(self, modelfile_name):
+        joblib.dump(self, modelfile_name)
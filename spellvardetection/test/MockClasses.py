@@ -1,3 +1,5 @@
+import numpy
+
 from spellvardetection.generator import _AbstractCandidateGenerator
 from spellvardetection.type_filter import _AbstractTypeFilter
 
@@ -33,3 +35,11 @@ class Cluster:
     def inSameCluster(self, word, candidate):
 
         return (word, candidate) in self.pairs
+
+    def hasClusterMany(self, words):
+
+        return numpy.array([bool(self.hasCluster(word)) for word in words])
+
+    def inSameClusterMany(self, word, candidates):
+
+        return numpy.array([self.inSameCluster(word, candidate) for candidate in candidates])
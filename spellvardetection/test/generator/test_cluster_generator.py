@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+
+from spellvardetection.generator import ClusterGenerator
+from spellvardetection.lib.clusters import WordClusters
+from spellvardetection.util.spellvarfactory import create_base_factory
+
+class TestClusterGenerator(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cluster_file = os.path.join(self.tmpdir.name, 'clusters')
+        with open(self.cluster_file, 'w', encoding='utf-8') as f:
+            f.write('0\tthe\t6\n1100\tcat\t2\n1100\tcot\t2\n1100\tdog\t2\n1101\tkat\t2\n1110\tmouse\t2\n')
+        self.clusters = WordClusters('brown', self.cluster_file)
+        self.dictionary = ['the', 'cat', 'cot', 'dog', 'kat', 'mouse', 'unknown']
+
+    def tearDown(self):
+
+        self.tmpdir.cleanup()
+
+    def test_without_dictionary(self):
+
+        generator = ClusterGenerator(self.clusters)
+        with self.assertRaises(RuntimeError):
+            generator.getCandidatesForWords(['cat'])
+
+    def test_getCandidates(self):
+
+        generator = ClusterGenerator(self.clusters, self.dictionary)
+        self.assertEqual(generator.getCandidatesForWords(['cat', 'mouse', 'unknown']),
+                         {'cat': set(['cot', 'dog']), 'mouse': set(), 'unknown': set()})
+
+    def test_getCandidates_with_prefix(self):
+
+        generator = ClusterGenerator(self.clusters, self.dictionary, prefix_length=3)
+        self.assertEqual(generator.getCandidatesForWord('cat'), set(['cot', 'dog', 'kat']))
+        generator = ClusterGenerator(self.clusters, self.dictionary, prefix_length=2)
+        self.assertEqual(generator.getCandidatesForWord('cat'), set(['cot', 'dog', 'kat', 'mouse']))
+
+    def test_getCandidates_with_max_dist(self):
+
+        generator = ClusterGenerator(self.clusters, self.dictionary, prefix_length=3, max_dist=1)
+        self.assertEqual(generator.getCandidatesForWord('cat'), set(['cot', 'kat']))
+        self.assertEqual(generator.getCandidatesForWord('dog'), set())
+
+    def test_set_dictionary(self):
+
+        generator = ClusterGenerator(self.clusters, self.dictionary, max_dist=1)
+        self.assertEqual(generator.getCandidatesForWord('cat'), set(['cot']))
+        generator.setDictionary(['cat', 'dog'])
+        self.assertEqual(generator.getCandidatesForWord('cat'), set())
+
+    def test_factory(self):
+
+        generator = create_base_factory().create_from_name('generator', {
+            'type': 'cluster', 'options': {'cluster_type': 'brown', 'cluster_file': self.cluster_file, 'prefix_length': 3}})
+
+        self.assertIsInstance(generator, ClusterGenerator)
+        generator.setDictionary(self.dictionary)
+        self.assertEqual(generator.getCandidatesForWord('kat'), set(['cat', 'cot', 'dog']))
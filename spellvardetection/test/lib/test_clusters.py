@@ -1,3 +1,5 @@
+import os
+import tempfile
 import unittest
 from unittest import mock
 
@@ -62,3 +64,62 @@ class TestWordEmbeddings(unittest.TestCase):
     def test_has_cluster_unknown_without_unknown_type(self):
 
         self.assertFalse(WordClusters('brown', 'brown_file').hasCluster('unknown type'))
+
+    def test_in_same_cluster_many(self):
+
+        clusters = WordClusters('brown', 'brown_file')
+        self.assertEqual(clusters.inSameClusterMany('cat', ['dog', 'mouse', 'cat', 'unknown type']).tolist(), [True, False, True, False])
+        self.assertEqual(clusters.hasClusterMany(['dog', 'unknown type']).tolist(), [True, False])
+
+    def test_get_cluster(self):
+
+        clusters = WordClusters('brown', 'brown_file', unknown_type="<UNK>")
+        self.assertEqual(clusters.getCluster('mouse'), '1110')
+        self.assertEqual(clusters.getCluster('unknown type'), '110')
+
+
+class TestWordClustersFromFile(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cluster_file = os.path.join(self.tmpdir.name, 'clusters')
+        with open(self.cluster_file, 'w', encoding='utf-8') as f:
+            f.write('0\tthe\t6\n110\tdog\t2\n1110\tmouse\t2\n110\tcat\t2\n')
+        self.simplification_file = os.path.join(self.tmpdir.name, 'simplifications')
+        with open(self.simplification_file, 'w', encoding='utf-8') as f:
+            f.write('ſhe\tthe\nkat\tcat\ndog\tdogge\n')
+
+    def tearDown(self):
+
+        self.tmpdir.cleanup()
+
+    def test_simplifications(self):
+
+        clusters = WordClusters('brown', self.cluster_file, self.simplification_file)
+
+        self.assertTrue(clusters.inSameCluster('kat', 'cat'))
+        self.assertEqual(clusters.getCluster('ſhe'), '0')
+        ## simplified to an unknown word
+        self.assertFalse(clusters.hasCluster('dog'))
+        self.assertTrue(clusters.isOOV('dog'))
+
+    def test_cache(self):
+
+        cache_file = os.path.join(self.tmpdir.name, 'clusters.cache')
+
+        WordClusters('brown', self.cluster_file, cache_file=cache_file)
+        self.assertTrue(os.path.exists(cache_file))
+
+        with mock.patch.object(WordClusters, '_parseBrownClusters') as parse:
+            clusters = WordClusters('brown', self.cluster_file, cache_file=cache_file)
+            parse.assert_not_called()
+
+        self.assertTrue(clusters.inSameCluster('cat', 'dog'))
+        self.assertEqual(clusters.getCluster('mouse'), '1110')
+
+        ## the cache is renewed if the cluster file changes
+        with open(self.cluster_file, 'a', encoding='utf-8') as f:
+            f.write('1110\thorse\t1\n')
+        clusters = WordClusters('brown', self.cluster_file, cache_file=cache_file)
+        self.assertTrue(clusters.inSameCluster('mouse', 'horse'))
@@ -1,6 +1,11 @@
+import os
+import pickle
+import tempfile
 import unittest
 from unittest import mock
 
+import numpy
+
 from spellvardetection.lib.embeddings import WordEmbeddings
 
 def my_open_mock(filename, rw, encoding=None):
@@ -40,3 +45,46 @@ class TestWordEmbeddings(unittest.TestCase):
         self.assertEquals([0.,0.], WordEmbeddings('hyperwords', 'embedd_file').get('z').tolist())
         self.assertIsNone(WordEmbeddings('hyperwords', 'embedd_file', missing_words=None).get('z'))
 
+
+
+class TestBinaryWordEmbeddings(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.textfile = os.path.join(self.tmpdir.name, 'embeddings.txt')
+        with open(self.textfile, 'w', encoding='utf-8') as f:
+            f.write("a 1 2\nb 0.5 -1\nſ 3 4\n")
+        self.binaryfile = os.path.join(self.tmpdir.name, 'embeddings.npy')
+        WordEmbeddings('hyperwords', self.textfile).save(self.binaryfile)
+
+    def tearDown(self):
+
+        self.tmpdir.cleanup()
+
+    def test_binary_embeddings_are_the_same(self):
+
+        text_embeddings = WordEmbeddings('hyperwords', self.textfile)
+        binary_embeddings = WordEmbeddings('binary', self.binaryfile)
+
+        self.assertEqual(binary_embeddings.getDim(), 2)
+        for word in ['a', 'b', 'ſ', 'z']:
+            self.assertEqual(binary_embeddings.get(word).tolist(), text_embeddings.get(word).tolist())
+
+    def test_binary_embeddings_are_memory_mapped(self):
+
+        embeddings = WordEmbeddings('binary', self.binaryfile)
+        self.assertIsInstance(embeddings.vectors, numpy.memmap)
+
+        ## not pickled but mapped again
+        self.assertNotIn('vectors', embeddings.__getstate__())
+        self.assertIsInstance(pickle.loads(pickle.dumps(embeddings)).vectors, numpy.memmap)
+
+    def test_get_many(self):
+
+        embeddings = WordEmbeddings('binary', self.binaryfile)
+        self.assertEqual(embeddings.getMany(['b', 'z', 'a']).tolist(), [[0.5, -1], [0, 0], [1, 2]])
+        self.assertEqual(embeddings.getMany([]).shape, (0, 2))
+
+        embeddings = WordEmbeddings('binary', self.binaryfile, missing_words=None)
+        self.assertTrue(numpy.isnan(embeddings.getMany(['z', 'a'])[0]).all())
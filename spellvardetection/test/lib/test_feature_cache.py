@@ -0,0 +1,80 @@
+import pickle
+import unittest
+
+from spellvardetection.lib.feature_cache import FeatureCache
+
+class TestFeatureCache(unittest.TestCase):
+
+    def test_get_and_set(self):
+
+        cache = FeatureCache({'a': 1})
+        cache['b'] = 2
+
+        self.assertEqual(cache['a'], 1)
+        self.assertEqual(cache.get('b'), 2)
+        self.assertIsNone(cache.get('c'))
+        with self.assertRaises(KeyError):
+            cache['c']
+
+    def test_lru_eviction_by_entries(self):
+
+        cache = FeatureCache(max_entries=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        ## access a - b is now the least recently used entry
+        cache.get('a')
+        cache['c'] = 3
+
+        self.assertEqual(set(cache.keys()), set(['a', 'c']))
+        self.assertEqual(cache.evictions, 1)
+
+    def test_eviction_by_memory(self):
+
+        cache = FeatureCache(max_memory=1000)
+        for i in range(100):
+            cache[str(i)] = [str(i)]
+
+        self.assertLessEqual(cache.memory, 1000)
+        self.assertLess(len(cache), 100)
+        self.assertIn('99', cache)
+
+    def test_statistics(self):
+
+        cache = FeatureCache({'a': 1})
+        cache.get('a')
+        cache.get('a')
+        cache.get('b')
+
+        statistics = cache.getStatistics()
+        self.assertEqual(statistics['entries'], 1)
+        self.assertEqual(statistics['hits'], 2)
+        self.assertEqual(statistics['misses'], 1)
+        self.assertAlmostEqual(statistics['hit_rate'], 2/3)
+
+    def test_statistics_for_keys(self):
+
+        cache = FeatureCache({'a': {'ngrams': 1}})
+
+        self.assertEqual(cache.getFeatures('a', 'ngrams'), ({'ngrams': 1}, 1))
+        ## the entry exists, but not the features for the key
+        self.assertEqual(cache.getFeatures('a', 'surface'), ({'ngrams': 1}, None))
+        self.assertEqual(cache.getFeatures('b', 'ngrams'), (None, None))
+
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 2)
+
+    def test_backend(self):
+
+        cache = FeatureCache(backend={'a': 1})
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIn('a', cache)
+        self.assertEqual(len(cache), 0)
+
+    def test_pickle_thread_safe_cache(self):
+
+        cache = FeatureCache({'a': 1}, thread_safe=True)
+        cache = pickle.loads(pickle.dumps(cache))
+        cache['b'] = 2
+
+        self.assertEqual(dict(cache.items()), {'a': 1, 'b': 2})
@@ -0,0 +1,105 @@
+import math
+import os
+import tempfile
+import unittest
+
+from spellvardetection.lib.feature_store import FeatureStore, FeatureStoreWriter
+from spellvardetection.util.feature_extractor import NGramExtractor
+
+class TestFeatureStore(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'store')
+
+    def tearDown(self):
+
+        self.tmpdir.cleanup()
+
+    def test_write_and_read(self):
+
+        with FeatureStoreWriter(self.path, ['ngrams', 'surface', 'sim'], buffer_size=2) as writer:
+            writer.add('["hand", "hans"]', {'ngrams': set([('a', 'b'), ('b', 'c')]), 'surface': [['ds'], ['$$', 'ds']], 'sim': 0.5})
+            writer.add('["und", "vnd"]', {'ngrams': set([('b', 'c')]), 'surface': [], 'sim': float('nan')})
+            writer.add('["dyt", "dit"]', {'ngrams': set(), 'surface': [['iy']], 'sim': 1})
+
+        store = FeatureStore(self.path)
+
+        self.assertEqual(len(store), 3)
+        self.assertIn('["und", "vnd"]', store)
+        self.assertNotIn('["und", "uns"]', store)
+
+        self.assertEqual(store['["hand", "hans"]'], {'ngrams': set([('a', 'b'), ('b', 'c')]), 'surface': [('ds',), ('$$', 'ds')], 'sim': 0.5})
+        self.assertEqual(store.getFeatures('["und", "vnd"]', 'ngrams'), set([('b', 'c')]))
+        self.assertEqual(store.getFeatures('["und", "vnd"]', 'surface'), [])
+        self.assertTrue(math.isnan(store.getFeatures('["und", "vnd"]', 'sim')))
+        self.assertEqual(store.getFeatures('["dyt", "dit"]', 'ngrams'), set())
+        self.assertIsNone(store.get('unknown'))
+        self.assertIsNone(store.getFeatures('unknown', 'ngrams'))
+        self.assertIsNone(store.getFeatures('["und", "vnd"]', 'unknown'))
+
+    def test_index(self):
+
+        with FeatureStoreWriter(self.path, ['sim'], buffer_size=3) as writer:
+            for i in range(100):
+                writer.add('["a", "' + str(i) + '"]', {'sim': i})
+            ## datapoints are only added once
+            self.assertFalse(writer.add('["a", "5"]', {'sim': 0}))
+
+        store = FeatureStore(self.path)
+
+        self.assertEqual(len(store), 100)
+        self.assertEqual(list(store)[:2], ['["a", "0"]', '["a", "1"]'])
+        self.assertTrue(all(store.getFeatures('["a", "' + str(i) + '"]', 'sim') == i for i in range(100)))
+        self.assertIsNone(store.getRow('["a", "100"]'))
+
+    def test_different_kinds(self):
+
+        with FeatureStoreWriter(self.path, ['ngrams']) as writer:
+            writer.add('a', {'ngrams': set([('a',)])})
+            with self.assertRaisesRegex(ValueError, 'of kind list'):
+                writer.add('b', {'ngrams': [('b',)]})
+
+        self.assertEqual(len(FeatureStore(self.path)), 1)
+
+    def test_empty_store(self):
+
+        with FeatureStoreWriter(self.path, ['ngrams']):
+            pass
+
+        self.assertEqual(len(FeatureStore(self.path)), 0)
+
+    def test_missing_key(self):
+
+        with FeatureStoreWriter(self.path, ['ngrams', 'surface']) as writer:
+            with self.assertRaises(ValueError):
+                writer.add('a', {'ngrams': set()})
+
+    def test_store_as_feature_cache(self):
+
+        with FeatureStoreWriter(self.path, ['ngrams']) as writer:
+            writer.add('abc', {'ngrams': set([('x', 'y')])})
+
+        ext = NGramExtractor(min_ngram_size=2, max_ngram_size=2, bow='', eow='')
+        ext.setFeatureCache(FeatureStore(self.path), 'ngrams')
+
+        ## read from the store
+        self.assertEqual(ext.extractFeaturesFromDatapoint('abc'), set([('x', 'y')]))
+        ## not in the store - extracted and cached
+        self.assertEqual(ext.extractFeaturesFromDatapoint('bcd'), set([('b', 'c'), ('c', 'd')]))
+        self.assertEqual(ext.getCacheStatistics()['hits'], 1)
+        self.assertEqual(ext.feature_cache['bcd'], {'ngrams': set([('b', 'c'), ('c', 'd')])})
+
+    def test_store_as_feature_cache_reads_only_key(self):
+
+        with FeatureStoreWriter(self.path, ['ngrams', 'surface']) as writer:
+            writer.add('abc', {'ngrams': set([('x', 'y')]), 'surface': [('a',)]})
+
+        store = FeatureStore(self.path)
+        ext = NGramExtractor(min_ngram_size=2, max_ngram_size=2, bow='', eow='')
+        ext.setFeatureCache(store, 'ngrams')
+
+        self.assertEqual(ext.extractFeaturesFromDatapoint('abc'), set([('x', 'y')]))
+        ## the features of other keys are not decoded
+        self.assertNotIn('vocabulary', store.keys_info['surface'])
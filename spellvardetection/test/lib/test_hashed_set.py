@@ -0,0 +1,33 @@
+import unittest
+
+from spellvardetection.lib.hashed_set import HashedSet
+
+class TestHashedSet(unittest.TestCase):
+
+    def test_contains(self):
+
+        pairs = HashedSet([('und', 'vnd'), ('und', 'unde')])
+
+        self.assertIn(('und', 'vnd'), pairs)
+        self.assertNotIn(('und', 'uns'), pairs)
+        self.assertEqual(len(pairs), 2)
+
+    def test_add(self):
+
+        pairs = HashedSet()
+
+        self.assertTrue(pairs.add(('und', 'vnd')))
+        self.assertFalse(pairs.add(('und', 'vnd')))
+        self.assertEqual(len(pairs), 1)
+
+    def test_merged_levels(self):
+
+        numbers = HashedSet(range(0, 1000, 2), buffer_size=7)
+
+        self.assertEqual(len(numbers), 500)
+        ## the number of levels grows logarithmically
+        self.assertLessEqual(len(numbers.levels), 7)
+        self.assertTrue(all(number in numbers for number in range(0, 1000, 2)))
+        self.assertFalse(any(number in numbers for number in range(1, 1000, 2)))
+        self.assertFalse(numbers.add(998))
+        self.assertEqual(len(numbers), 500)
@@ -0,0 +1,74 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from spellvardetection.lib import profiling
+
+class TestProfiling(unittest.TestCase):
+
+    def tearDown(self):
+
+        profiling.disable()
+
+    def test_nested_stages(self):
+
+        timer = profiling.enable()
+
+        with profiling.stage(profiling.GENERATION):
+            time.sleep(0.02)
+            with profiling.stage(profiling.IO):
+                time.sleep(0.05)
+        with profiling.stage(profiling.IO):
+            pass
+
+        report = timer.getReport()
+        self.assertEqual(report['stages']['generation']['calls'], 1)
+        self.assertEqual(report['stages']['io']['calls'], 2)
+        ## the time of the nested stage is not counted for the enclosing stage
+        self.assertLess(report['stages']['generation']['seconds'], 0.05)
+        self.assertGreaterEqual(report['stages']['io']['seconds'], 0.05)
+        self.assertGreaterEqual(report['total_seconds'], 0.07)
+
+    def test_timed_iter(self):
+
+        timer = profiling.enable()
+
+        def slow_range(n):
+            for i in range(n):
+                time.sleep(0.01)
+                yield i
+
+        for i in profiling.timed_iter(slow_range(3), profiling.GENERATION):
+            time.sleep(0.02)
+
+        report = timer.getReport()
+        self.assertEqual(report['stages']['generation']['calls'], 4)
+        self.assertGreaterEqual(report['stages']['generation']['seconds'], 0.03)
+        self.assertLess(report['stages']['generation']['seconds'], 0.06)
+
+    def test_disabled(self):
+
+        with profiling.stage(profiling.IO):
+            pass
+        self.assertEqual(list(profiling.timed_iter(range(3), profiling.IO)), [0, 1, 2])
+
+    def test_sampler(self):
+
+        timer = profiling.enable()
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            samples_file = os.path.join(tmpdir, 'samples.jsonl')
+            sampler = profiling.Sampler(timer, samples_file, 0.01)
+            sampler.start()
+            with profiling.stage(profiling.FILTERING):
+                time.sleep(0.05)
+            sampler.stop()
+
+            with open(samples_file) as infile:
+                samples = [json.loads(line) for line in infile]
+
+        self.assertGreater(len(samples), 1)
+        self.assertIn('filtering', [sample['current_stage'] for sample in samples])
+        self.assertIsNone(samples[-1]['current_stage'])
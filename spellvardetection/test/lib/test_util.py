@@ -102,6 +102,20 @@ class TestEvaluate(unittest.TestCase):
 
         self.assertEquals(result, [0, 0, 0, 1, 0])
 
+    def test_evaluate_thresholds(self):
+        tokens = [
+            {'type': 'dyt', 'variants': ['dit', 'dat'], 'filtered_candidates': [['dit', 0.9], ['ist', 0.4], 'dat']},
+            {'type': 'is', 'variants': ['ist'], 'filtered_candidates': [['dit', 0.2], ['ist', 0.6], ['ist', 0.1]]},
+            {'type': 'vnd', 'variants': ['und'], 'filtered_candidates': [['und', 0.9]]}
+        ]
+
+        results = evaluate_thresholds(tokens, [None, 0.5, 1.0], known_dict=set(['vnd']), freq_dict={'dat': 10})
+
+        self.assertEquals(results[0], evaluate([{**token, 'filtered_candidates': [candidate if isinstance(candidate, str) else candidate[0] for candidate in token['filtered_candidates']]} for token in tokens],
+                                               known_dict=set(['vnd']), freq_dict={'dat': 10}))
+        self.assertEquals(results[1], [1, 1, 1, 1, 0])
+        self.assertEquals(results[2], [1, 0, 0, 0, 0])
+
     def test_getPairsFromSpellvardict(self):
 
         self.assertEqual(
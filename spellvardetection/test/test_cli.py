@@ -1,6 +1,9 @@
 import json
+import os
+import multiprocessing
 
 import unittest
+from unittest import mock
 
 import click
 from click.testing import CliRunner
@@ -9,6 +12,7 @@ import joblib
 from sklearn.dummy import DummyClassifier
 
 import spellvardetection.cli
+from spellvardetection.lib.feature_store import FeatureStore
 from spellvardetection.util.spellvarfactory import create_base_factory
 
 class TestCLI(unittest.TestCase):
@@ -17,7 +21,9 @@ class TestCLI(unittest.TestCase):
 
         runner = CliRunner()
         result = runner.invoke(spellvardetection.cli.main, ['generate', '["vnd"]', '{"type": "levenshtein", "options": {"max_dist": 1}}'])
-        self.assertEquals('Dictionary has to be set for generator of type levenshtein\n', result.output)
+        self.assertEquals('Dictionary has to be set for generator of type levenshtein\n', result.stderr)
+        self.assertEqual(result.exit_code, 1)
+        self.assertEqual(result.stdout, '')
 
     def test_generate_candidates(self):
 
@@ -28,6 +34,56 @@ class TestCLI(unittest.TestCase):
         result_dict["vnd"] = set(result_dict["vnd"])
         self.assertEquals(result_dict, {"vnd": set(["und", "vnde", "vns"])})
 
+    def test_generate_candidates_with_timing_report(self):
+
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            result = runner.invoke(spellvardetection.cli.main, [
+                '--timing_report', 'timing.json', '--profile_file', 'profile.pstats',
+                'generate', '["vnd"]', '{"type": "levenshtein", "options": {"max_dist": 1}}', '-d', '["und", "unde", "vnde", "vns"]'])
+
+            ## the output is not changed by profiling
+            self.assertEqual(set(json.loads(result.stdout)["vnd"]), set(["und", "vnde", "vns"]))
+
+            with open('timing.json') as f:
+                report = json.load(f)
+            self.assertTrue(os.path.getsize('profile.pstats') > 0)
+
+        self.assertEqual(report['command'], 'generate')
+        self.assertTrue({'dictionary', 'generation', 'io'}.issubset(report['stages'].keys()))
+
+    def test_failed_generation_with_timing_report(self):
+
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            result = runner.invoke(spellvardetection.cli.main, [
+                '--timing_report', 'timing.json',
+                'generate', '["vnd"]', '{"type": "levenshtein", "options": {"max_dist": 1}}'])
+
+            ## the error is not mixed into the output, the report is still written
+            self.assertEqual(result.exit_code, 1)
+            self.assertEqual(result.stdout, '')
+            with open('timing.json') as f:
+                report = json.load(f)
+
+        self.assertEqual(report['command'], 'generate')
+        self.assertIn('generation', report['stages'])
+
+    def test_benchmark(self):
+
+        runner = CliRunner()
+        result = runner.invoke(spellvardetection.cli.main, [
+            'benchmark', '-g', 'levenshtein', '-g', '{"type": "levenshtein", "options": {"max_dist": 2}}',
+            '-n', '200', '-n', '400', '-q', '50'])
+
+        report = json.loads(result.stdout)
+        self.assertEqual(
+            [(row['types'], row['queries'], row['generator']) for row in report['results']],
+            [(200, 50, 'levenshtein'), (200, 50, '{"type": "levenshtein", "options": {"max_dist": 2}}'),
+             (400, 50, 'levenshtein'), (400, 50, '{"type": "levenshtein", "options": {"max_dist": 2}}')])
+        ## a larger distance finds more candidates on the same data
+        self.assertLessEqual(report['results'][0]['candidates_per_query'], report['results'][1]['candidates_per_query'])
+
     def test_generate_candidates_with_lookup_generator(self):
 
         runner = CliRunner()
@@ -93,6 +149,172 @@ class TestCLI(unittest.TestCase):
             result_dict["vnd"] = set(result_dict["vnd"])
             self.assertEquals(result_dict, {"vnd": set(["und"])})
 
+    def test_filter_candidates_with_multiple_processes(self):
+
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            with open('brown.txt', 'w') as f:
+                f.write('1010	und	14\n1010	vnd	16\n1010	vnde	1604\n1010	unde	897\n11110	vns	31\n')
+
+            candidates = {"vnd": ["und", "vns"], "vns": ["und", "vnd"], "unde": ["vnde", "vns"]}
+            result = runner.invoke(spellvardetection.cli.main, ['filter', json.dumps(candidates), '{"type": "cluster", "options": {"cluster_type": "brown", "cluster_file": "brown.txt"}}',
+                                                                '-p', '2', '-s', '--jsonl'])
+
+            self.assertEqual([json.loads(line) for line in result.stdout.splitlines()],
+                             [{"type": "vnd", "candidates": ["und"]}, {"type": "vns", "candidates": []}, {"type": "unde", "candidates": ["vnde"]}])
+
+            worker_statistics = json.loads(result.stderr)
+            self.assertEqual(sum(stats['types'] for stats in worker_statistics.values()), 3)
+            self.assertEqual(sum(stats['candidates'] for stats in worker_statistics.values()), 6)
+
+    def test_generate_and_filter_candidates_with_jsonl(self):
+
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            with open('vocabulary.jsonl', 'w') as f:
+                f.write('"vnd"\n"uns"\n')
+            with open('brown.txt', 'w') as f:
+                f.write('1010	und	14\n1010	vnd	16\n1010	vnde	1604\n1010	unde	897\n11110	vns	31\n')
+
+            result = runner.invoke(spellvardetection.cli.main, ['generate', 'vocabulary.jsonl', '{"type": "levenshtein", "options": {"max_dist": 1}}',
+                                                                '-d', '["und", "vns"]', '-o', 'candidates.jsonl', '--jsonl'])
+            self.assertEqual(result.exit_code, 0)
+
+            with open('candidates.jsonl') as f:
+                records = [json.loads(line) for line in f]
+            self.assertEqual([record['type'] for record in records], ['vnd', 'uns'])
+            self.assertEqual(set(records[0]['candidates']), set(['und', 'vns']))
+            self.assertEqual(set(records[1]['candidates']), set(['und', 'vns']))
+
+            ## the default output is a single json document
+            result = runner.invoke(spellvardetection.cli.main, ['filter', 'candidates.jsonl', '{"type": "cluster", "options": {"cluster_type": "brown", "cluster_file": "brown.txt"}}'])
+            result_dict = {word: set(candidates) for word, candidates in json.loads(result.output).items()}
+            self.assertEqual(result_dict, {"vnd": set(["und"]), "uns": set(["und", "vns"])})
+
+            result = runner.invoke(spellvardetection.cli.main, ['filter', 'candidates.jsonl', '{"type": "cluster", "options": {"cluster_type": "brown", "cluster_file": "brown.txt"}}', '--jsonl'])
+            records = [json.loads(line) for line in result.output.splitlines()]
+            self.assertEqual([(record['type'], set(record['candidates'])) for record in records], [("vnd", set(["und"])), ("uns", set(["und", "vns"]))])
+
+    def test_filter_tokens_with_multiple_processes(self):
+
+        from spellvardetection.token_filter import CNNTokenFilter
+
+        cand_filter = CNNTokenFilter(2, 2, nb_filter=5, epochs=1, batch_size=2, seed=42)
+        cand_filter.train(
+            [('in', 'jn', ['dat', 'is'], ['deme', 'hove']), ('in', 'yn', ['so', 'wy'], ['der', 'stad'])],
+            [('in', 'en', ['he', 'was'], ['man', 'de']), ('in', 'ene', ['dat', 'is'], ['vrouwe', '.'])])
+
+        tokens = [
+            {'type': 'in', 'left_context': ['dat', 'is'], 'right_context': ['deme', 'hove']},
+            {'type': 'vnd', 'left_context': ['he'], 'right_context': []},
+            {'type': 'in', 'left_context': ['he', 'was'], 'right_context': ['man']},
+            {'type': 'dat', 'left_context': [], 'right_context': ['is']},
+        ]
+        candidates = {'in': ['jn', 'yn', 'en', 'ene'], 'vnd': ['und'], 'dat': []}
+
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            cand_filter.export('model.npz')
+            filter_settings = json.dumps({'type': 'numpy_cnn', 'options': {'modelfile_name': 'model.npz'}})
+
+            result = runner.invoke(spellvardetection.cli.main, ['filter_tokens', json.dumps(tokens), json.dumps(candidates), filter_settings])
+            filtered = json.loads(result.stdout)
+
+            result = runner.invoke(spellvardetection.cli.main, ['filter_tokens', json.dumps(tokens), json.dumps(candidates), filter_settings, '-p', '2', '-s'])
+            self.assertEqual(json.loads(result.stdout), filtered)
+            self.assertEqual(sum(stats['inputs'] for stats in json.loads(result.stderr).values()), 9)
+
+        self.assertEqual([token['type'] for token in filtered], ['in', 'vnd', 'in', 'dat'])
+        self.assertEqual([token['candidates'] for token in filtered], [candidates['in'], candidates['vnd'], candidates['in'], []])
+        self.assertEqual(filtered[3]['filtered_candidates'], [])
+        expected = cand_filter.filterCandidatesForTokens([(token['type'], candidates[token['type']], token['left_context'], token['right_context']) for token in tokens])
+        self.assertEqual([set(token['filtered_candidates']) for token in filtered], expected)
+
+    def test_run(self):
+
+        tokens = [
+            {'type': 'vnd', 'left_context': [], 'right_context': ['vns']},
+            {'type': 'vns', 'left_context': ['vnd'], 'right_context': []},
+            {'type': 'vnd', 'left_context': ['vns'], 'right_context': []}
+        ]
+
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            with open('brown.txt', 'w') as f:
+                f.write('1010	und	14\n1010	vnd	16\n1010	vnde	1604\n1010	unde	897\n11110	vns	31\n')
+            pipeline = {
+                'generator': {'type': 'levenshtein', 'options': {'max_dist': 1}},
+                'type_filter': {'type': 'cluster', 'options': {'cluster_type': 'brown', 'cluster_file': 'brown.txt'}},
+                'dictionary': ['und', 'vnd', 'vns', 'uns']
+            }
+
+            for _ in range(2):
+                result = runner.invoke(spellvardetection.cli.main, ['run', json.dumps(pipeline), json.dumps(tokens), '-c', 'checkpoints', '-s'])
+                self.assertEqual(result.exit_code, 0)
+
+                filtered = json.loads(result.stdout)
+                self.assertEqual([token['type'] for token in filtered], ['vnd', 'vns', 'vnd'])
+                self.assertEqual(filtered[0]['candidates'], ['und'])
+                self.assertEqual(filtered[0]['filtered_candidates'], ['und'])
+                self.assertEqual(filtered[1]['candidates'], ['uns'])
+                self.assertEqual(filtered[2]['right_context'], [])
+
+            ## the candidates of the first run are reused
+            self.assertEqual(json.loads(result.stderr), {'tokens': 3, 'generated_types': 0})
+
+    def test_run_with_multiple_processes(self):
+
+        tokens = [
+            {'type': 'vnd', 'left_context': [], 'right_context': ['vns']},
+            {'type': 'vns', 'left_context': ['vnd'], 'right_context': []},
+            {'type': 'vnd', 'left_context': ['vns'], 'right_context': []}
+        ]
+
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            with open('brown.txt', 'w') as f:
+                f.write('1010	und	14\n1010	vnd	16\n1010	vnde	1604\n1010	unde	897\n11110	vns	31\n')
+            pipeline = {
+                'generator': {'type': 'levenshtein', 'options': {'max_dist': 1}},
+                'type_filter': {'type': 'cluster', 'options': {'cluster_type': 'brown', 'cluster_file': 'brown.txt'}},
+                'dictionary': ['und', 'vnd', 'vns', 'uns']
+            }
+
+            with mock.patch('spellvardetection.cli._CHUNK_SIZE', 1), \
+                 mock.patch('multiprocessing.Pool', wraps=multiprocessing.Pool) as pool:
+                result = runner.invoke(spellvardetection.cli.main, ['run', json.dumps(pipeline), json.dumps(tokens), '-p', '2'])
+            self.assertEqual(result.exit_code, 0)
+            ## one pool is used for all chunks
+            self.assertEqual(pool.call_count, 1)
+
+            expected = runner.invoke(spellvardetection.cli.main, ['run', json.dumps(pipeline), json.dumps(tokens)])
+            self.assertEqual(json.loads(result.stdout), json.loads(expected.stdout))
+            self.assertEqual([token['candidates'] for token in json.loads(result.stdout)], [['und'], ['uns'], ['und']])
+
+    def test_run_checkpoint_with_changed_file(self):
+
+        tokens = [{'type': 'vnd', 'left_context': [], 'right_context': []}]
+
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            pipeline = {
+                'generator': {'type': 'levenshtein', 'options': {'max_dist': 1}},
+                'type_filter': {'type': 'cluster', 'options': {'cluster_type': 'brown', 'cluster_file': 'brown.txt'}},
+                'dictionary': ['und', 'vnd']
+            }
+
+            results = []
+            for clusters in ['1010	und	14\n1010	vnd	16\n', '1010	und	14\n1011	vnd	16\n1011	vns	3\n']:
+                with open('brown.txt', 'w') as f:
+                    f.write(clusters)
+                result = runner.invoke(spellvardetection.cli.main, ['run', json.dumps(pipeline), json.dumps(tokens), '-c', 'checkpoints', '-s'])
+                self.assertEqual(result.exit_code, 0)
+                results.append((json.loads(result.stdout)[0]['filtered_candidates'], json.loads(result.stderr)['generated_types']))
+
+            ## the candidates are generated again if the cluster file has changed
+            self.assertEqual(results[0], (['und'], 1))
+            self.assertEqual(results[1], ([], 1))
+
     def test_train_filter(self):
 
         runner = CliRunner()
@@ -127,6 +349,26 @@ class TestCLI(unittest.TestCase):
             self.assertTrue(isinstance(clf.classifier, DummyClassifier))
 
 
+    def test_train_filter_with_converted_embeddings(self):
+
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            with open('embeddings.txt', 'w') as f:
+                f.write('under 1 0 0\nvnder 1 0 0\nhans 0 1 0\nhand 0 0 1\n')
+
+            result = runner.invoke(spellvardetection.cli.main, ['utils', 'convert_embeddings', 'hyperwords', 'embeddings.txt', 'embeddings.npy'])
+            self.assertEqual(result.exit_code, 0)
+
+            result = runner.invoke(spellvardetection.cli.main, [
+                'train', 'filter',
+                '{"type": "sklearn", "options": {"classifier_clsname": "sklearn.dummy.DummyClassifier", "classifier_params": {"strategy": "constant", "constant": 0}, "feature_extractors": [{"type": "context", "options": {"vector_type": "binary", "vectorfile_name": "embeddings.npy"}}]}}',
+                'dummy.model',
+                '[["under", "vnder"]]',
+                '[["hans", "hand"]]'])
+
+            clf = joblib.load('dummy.model')
+            self.assertEqual(clf.feature_extractors[0][1].embeddings.get('hans').tolist(), [0, 1, 0])
+
     def _train_filter(self, runner, feature_extractor_options, global_cache=None, positive_pairs=None, negative_pairs=None):
 
         if positive_pairs is None:
@@ -210,6 +452,63 @@ class TestCLI(unittest.TestCase):
             )
             self._evaluate_trained_filter("sklearn", "dummy.model")
 
+    def test_train_filter_with_bounded_global_feature_cache(self):
+
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+
+            result = runner.invoke(spellvardetection.cli.main, [
+                'train', 'filter', '--cache_max_entries', '1',
+                '{"type": "sklearn", "options": {"classifier_clsname": "__svm__", "feature_extractors": [{"type": "surface", "options": {"key": "ngrams"}}]}}',
+                'dummy.model',
+                '[["under", "vnder"]]',
+                '[["hans", "hand"]]'])
+
+            self.assertEqual(result.exit_code, 0)
+            self._evaluate_trained_filter("sklearn", "dummy.model")
+
+    def test_train_filter_with_feature_store(self):
+
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+
+            result = runner.invoke(spellvardetection.cli.main, [
+                'utils', 'extract_features', '[{"type": "surface", "key": "ngrams"}]',
+                '[["under", "vnder"], ["hans", "hand"]]', '-s', 'feature_store'])
+            self.assertEqual(result.exit_code, 0)
+
+            self._train_filter(runner,
+                               '"options": {"key": "ngrams"}',
+                               'feature_store',
+                               positive_pairs='[["under", "vnder"]]',
+                               negative_pairs='[["hans", "hand"]]'
+            )
+            self._evaluate_trained_filter("sklearn", "dummy.model")
+
+    def test_feature_store_from_jsonl(self):
+
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            with open('pairs.jsonl', 'w') as f:
+                f.write('["under", "vnder"]\n["hans", "hand"]\n["under", "vnder"]\n')
+
+            result = runner.invoke(spellvardetection.cli.main, [
+                'utils', 'extract_features', '[{"type": "ngram", "key": "ngrams"}]', 'pairs.jsonl', '-s', 'feature_store'])
+            self.assertEqual(result.exit_code, 0)
+
+            store = FeatureStore('feature_store')
+            self.assertEqual(list(store), ['["under", "vnder"]', '["hand", "hans"]'])
+
+    def test_feature_store_without_extractors(self):
+
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+
+            result = runner.invoke(spellvardetection.cli.main, [
+                'utils', 'extract_features', '[]', '[["under", "vnder"]]', '-s', 'feature_store'])
+            self.assertEqual(result.exit_code, 2)
+            self.assertIn('At least one feature extractor', result.output)
+
     def test_pipeline(self):
 
         runner = CliRunner()
@@ -254,6 +553,33 @@ class TestCLI(unittest.TestCase):
         )
 
 
+    def test_extract_training_data_with_resampling(self):
+
+        variants = {'und': ['vnd', 'unde', 'vnnde'], 'vns': ['uns']}
+        predictions = {'und': ['vnd', 'uns', 'vns', 'unnd'], 'uns': ['und', 'vnde', 'vns'], 'vnd': ['und']}
+
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            with open('predictions.jsonl', 'w') as f:
+                for word, candidates in predictions.items():
+                    f.write(json.dumps({'type': word, 'candidates': candidates}) + '\n')
+
+            samples = []
+            for _ in range(2):
+                result = runner.invoke(spellvardetection.cli.utils,
+                                       ['extract_training_data', json.dumps(variants), 'predictions.jsonl', 'pos.json', 'neg.json', '-r', '-s', '42'])
+                self.assertEqual(result.exit_code, 0)
+
+                samples.append((json.load(open('pos.json', 'r')), json.load(open('neg.json', 'r'))))
+
+        pos_pairs, neg_pairs = samples[0]
+        self.assertEqual(samples[1], samples[0])
+
+        self.assertEqual(set([tuple(pair) for pair in pos_pairs]), set([("und", "vnd"), ("uns", "vns")]))
+        self.assertEqual(len(neg_pairs), 2)
+        self.assertLessEqual(set([tuple(pair) for pair in neg_pairs]), set([("und", "uns"), ("und", "vns"), ("und", "unnd"), ("uns", "vnde")]))
+
+
     def test_evaluate(self):
 
         tokens = [
@@ -268,6 +594,47 @@ class TestCLI(unittest.TestCase):
         self.assertEquals(result.output, '0.50|1.00|0.67|2.00+-0.00\n')
 
 
+    def test_evaluate_with_thresholds(self):
+
+        tokens = [
+            {'type': 'dyt', 'variants': ['dit']},
+            {'type': 'is', 'variants': ['ist']}
+        ]
+        predictions = {'dyt': [['dit', 0.9], ['ist', 0.4]], 'is': [['dit', 0.2], ['ist', 0.6]]}
+        other_predictions = {'dyt': ['dit', 'ist'], 'is': ['dit', 'ist']}
+
+        runner = CliRunner()
+        result = runner.invoke(spellvardetection.cli.utils, ['evaluate', json.dumps(tokens), '-p', json.dumps(predictions), '-p', json.dumps(other_predictions),
+                                                             '-t', '[0.1, 0.5, 1.0]'])
+
+        self.assertEquals(result.output.splitlines(), [
+            'predictions\tthreshold\tprecision\trecall\tf1\tcandidates',
+            '1\t0.1\t0.50\t1.00\t0.67\t2.00+-0.00',
+            '1\t0.5\t1.00\t1.00\t1.00\t1.00+-0.00',
+            '1\t1.0\t1.00\t0.00\t0.00\t0.00+-0.00',
+            '2\t0.1\t0.50\t1.00\t0.67\t2.00+-0.00',
+            '2\t0.5\t0.50\t1.00\t0.67\t2.00+-0.00',
+            '2\t1.0\t0.50\t1.00\t0.67\t2.00+-0.00',
+        ])
+
+        result = runner.invoke(spellvardetection.cli.utils, ['evaluate', json.dumps(tokens), '-p', json.dumps(predictions), '-t', '[0.5]', '--json'])
+        self.assertEquals(json.loads(result.output), [{
+            'predictions': 1, 'threshold': 0.5, 'precision': 1.0, 'recall': 1.0, 'f1': 1.0, 'candidates_mean': 1.0, 'candidates_stdev': 0.0}])
+
+    def test_evaluate_with_jsonl(self):
+
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            with open('tokens.jsonl', 'w') as f:
+                f.write('{"type": "dyt", "variants": ["dit"]}\n{"type": "is", "variants": ["ist"]}\n')
+            with open('predictions.jsonl', 'w') as f:
+                f.write('{"type": "dyt", "candidates": ["dit", "ist"]}\n{"type": "is", "candidates": ["dit", "ist"]}\n')
+
+            result = runner.invoke(spellvardetection.cli.utils, ['evaluate', 'tokens.jsonl', '-p', 'predictions.jsonl'])
+
+        self.assertEquals(result.output, '0.50|1.00|0.67|2.00+-0.00\n')
+
+
     def test_evaluate_with_dict(self):
 
         tokens = [
@@ -0,0 +1,77 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import unittest
+
+## libraries that take long to import and should only be imported if they are used
+HEAVY_MODULES = ['sklearn', 'imblearn', 'tensorflow']
+
+def get_heavy_modules(code):
+    """Run code in a new python process and return the heavy modules imported by it."""
+
+    code = code + "\nimport sys, json\nprint(json.dumps([module for module in " + repr(HEAVY_MODULES) + " if module in sys.modules]))"
+    output = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+    return json.loads(output.strip().split('\n')[-1])
+
+def run_cli(args):
+
+    return "from click.testing import CliRunner\nimport spellvardetection.cli\nresult = CliRunner().invoke(spellvardetection.cli.main, " + repr(args) + ")\nassert result.exit_code == 0, result.output"
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_import_cli(self):
+
+        self.assertEqual(get_heavy_modules("import spellvardetection.cli"), [])
+
+    def test_generate_with_levenshtein(self):
+
+        self.assertEqual(get_heavy_modules(run_cli(
+            ['generate', '["vnd"]', '{"type": "levenshtein", "options": {"max_dist": 1}}', '-d', '["und", "vns"]'])), [])
+
+    def test_generate_with_type_filter(self):
+
+        self.assertEqual(get_heavy_modules(run_cli(
+            ['generate', '["vnd"]',
+             '{"type": "pipeline", "options": {"generator": {"type": "levenshtein", "options": {"max_dist": 1}}, "type_filter": {"type": "edit_probabilities", "options": {"probabilities": []}}}}',
+             '-d', '["und", "vns"]'])), [])
+
+    def test_simplify(self):
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            input_file = os.path.join(tmpdir, 'input.txt')
+            with open(input_file, 'w') as f:
+                f.write("Test")
+
+            self.assertEqual(get_heavy_modules(run_cli(['utils', 'simplify', input_file, '[["s", "z"]]'])), [])
+
+    def test_sklearn_is_imported_when_used(self):
+
+        self.assertEqual(get_heavy_modules(
+            "from spellvardetection.util.spellvarfactory import create_base_factory\n" +
+            "create_base_factory().create_from_name('extractor', {'type': 'surface'})"), ['sklearn'])
+
+
+def benchmark(repeat=5):
+    """Measure the time for starting the command line interface."""
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'import spellvardetection.cli'], check=True)
+        timings.append(time.perf_counter() - start)
+
+    return {
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'heavy_modules': get_heavy_modules('import spellvardetection.cli'),
+    }
+
+
+if __name__ == '__main__':
+    print(json.dumps(benchmark(), indent=2))
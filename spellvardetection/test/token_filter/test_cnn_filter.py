@@ -0,0 +1,225 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy
+from tensorflow.keras.preprocessing.sequence import pad_sequences
+
+from spellvardetection.lib import profiling
+from spellvardetection.token_filter import CNNTokenFilter, NumpyCNNTokenFilter
+
+class TestCNNTokenFilter(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+
+        positive_pairs = [
+            ('in', 'jn', ['dat', 'is'], ['deme', 'hove']),
+            ('in', 'yn', ['so', 'wy'], ['der', 'stad']),
+            ('in', 'en', ['vnde'], ['deme', 'lande']),
+        ]
+        negative_pairs = [
+            ('in', 'en', ['he', 'was'], ['man', 'de']),
+            ('in', 'ene', ['dat', 'is'], ['vrouwe', '.']),
+            ('in', 'jn', ['he', 'hadde'], ['kint', 'vnde']),
+        ]
+
+        cls.filter = CNNTokenFilter(2, 2, nb_filter=5, epochs=1, batch_size=2, seed=42)
+        cls.filter.train(positive_pairs, negative_pairs)
+
+        cls.tokens = [
+            ('in', ['jn', 'yn', 'en', 'ene'], ['dat', 'is'], ['deme', 'hove', 'to']),
+            ('in', [], ['he'], ['was']),
+            ('in', ['en'], [], []),
+            ('in', ['ene', 'jn'], ['a', 'b', 'c'], ['d']),
+        ]
+
+    def test_filter_candidates_for_tokens(self):
+
+        expected = [
+            set([candidate for candidate in candidates if self.filter.isPair(word, candidate, left_context, right_context)])
+            for word, candidates, left_context, right_context in self.tokens
+        ]
+
+        self.assertEqual(self.filter.filterCandidatesForTokens(self.tokens), expected)
+
+    def test_filter_candidates_for_tokens_in_small_batches(self):
+
+        expected = self.filter.filterCandidatesForTokens(self.tokens)
+
+        self.filter.prediction_batch_size = 2
+        try:
+            self.assertEqual(self.filter.filterCandidatesForTokens(self.tokens), expected)
+        finally:
+            self.filter.prediction_batch_size = CNNTokenFilter.prediction_batch_size
+
+    def test_prediction_stages(self):
+
+        timer = profiling.enable()
+        try:
+            self.filter.filterCandidatesForTokens(self.tokens)
+        finally:
+            profiling.disable()
+
+        ## the inputs are encoded as feature extraction, only the model is timed as inference
+        stages = timer.getReport()['stages']
+        self.assertEqual(stages['feature_extraction']['calls'], stages['inference']['calls'])
+        self.assertGreater(stages['inference']['calls'], 0)
+
+    def test_filter_candidates_without_candidates(self):
+
+        self.assertEqual(self.filter.filterCandidatesForTokens([('in', [], ['he'], ['was'])]), [set()])
+        self.assertEqual(self.filter.filterCandidatesForTokens([]), [])
+
+    def test_identical_inputs_are_classified_once(self):
+
+        tokens = [
+            ('in', ['jn', 'yn'], ['x', 'dat', 'is'], ['deme', 'hove', 'y']),
+            ('in', ['jn', 'yn'], ['z', 'dat', 'is'], ['deme', 'hove', 'z']),
+            ('ine', ['jn'], ['dat', 'is'], ['deme', 'hove']),
+            ('in', ['jn'], ['dat', 'was'], ['deme', 'hove']),
+        ]
+
+        self.filter.statistics = {'inputs': 0, 'unique_inputs': 0}
+
+        with mock.patch.object(self.filter, '_predict', wraps=self.filter._predict) as predict:
+            result = self.filter.filterCandidatesForTokens(tokens)
+
+        self.assertEqual(len(predict.call_args[0][0]), 3)
+        self.assertEqual(result[0], result[1])
+        self.assertEqual(result[2], set(['jn']) & result[0])
+        self.assertEqual(self.filter.getStatistics(), {'inputs': 6, 'unique_inputs': 3, 'dedup_ratio': 2.0})
+
+    def test_identical_inputs_without_left_context(self):
+
+        tokens = [
+            ('in', ['jn'], ['x', 'dat', 'is'], ['deme']),
+            ('in', ['jn'], ['z', 'dat', 'was'], ['deme']),
+        ]
+
+        with mock.patch.object(self.filter, 'left_context_len', 0), \
+             mock.patch.object(self.filter, '_predict', return_value=numpy.array([1.0])) as predict:
+            result = self.filter.filterCandidatesForTokens(tokens)
+
+        predict.assert_called_once_with([('jn', [], ['deme'])])
+        self.assertEqual(result, [set(['jn']), set(['jn'])])
+
+    def test_cached_encodings(self):
+
+        X = self.filter._getInputs([('jn', ['a', 'dat', 'is'], ['deme']), ('en', [], ['deme', 'hove', 'to'])])
+
+        def encode(word):
+            return pad_sequences(self.filter.char_tokenizer.texts_to_sequences([word]),
+                                 maxlen=self.filter.max_word_len, padding='post', truncating='post')[0]
+
+        ## character sequences of the left context, the candidate and the right context
+        self.assertEqual(len(X), 5)
+        self.assertEqual(X[0].shape, (2, self.filter.max_word_len))
+        for i, word in enumerate(['dat', 'is', 'jn', 'deme', '']):
+            numpy.testing.assert_array_equal(X[i][0], encode(word))
+        for i, word in enumerate(['', '', 'en', 'deme', 'hove']):
+            numpy.testing.assert_array_equal(X[i][1], encode(word))
+
+    def test_bounded_encoding_cache(self):
+
+        expected = self.filter.filterCandidatesForTokens(self.tokens)
+
+        self.filter.encoding_cache_size = 3
+        self.filter._resetEncodings()
+        try:
+            self.assertEqual(self.filter.filterCandidatesForTokens(self.tokens), expected)
+            self.assertEqual(self.filter.filterCandidatesForTokens(self.tokens[:1]), expected[:1])
+            self.assertLessEqual(len(self.filter._encoding_rows) - 1, 11)
+        finally:
+            self.filter.encoding_cache_size = CNNTokenFilter.encoding_cache_size
+            self.filter._resetEncodings()
+
+    def test_training_data_cache(self):
+
+        positive_pairs = [('in', 'jn', ['dat', 'is'], ['deme', 'hove']), ('in', 'yn', ['so', 'wy'], ['der', 'stad'])]
+        negative_pairs = [('in', 'en', ['he', 'was'], ['man', 'de'])]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+
+            datacache_name = os.path.join(tmpdir, 'data.npz')
+            filter_ = CNNTokenFilter(2, 2, nb_filter=5, epochs=1, batch_size=2, seed=42, datacache_name=datacache_name)
+            filter_.train(positive_pairs, negative_pairs)
+            self.assertTrue(os.path.exists(datacache_name))
+
+            ## the encoded data is read from the cache
+            with mock.patch.object(filter_, '_getInputRows', wraps=filter_._getInputRows) as get_rows:
+                filter_.train(positive_pairs, negative_pairs)
+                get_rows.assert_not_called()
+                ## but not for other data
+                filter_.train(positive_pairs, negative_pairs + [('in', 'ene', ['dat', 'is'], ['vrouwe', '.'])])
+                get_rows.assert_called_once()
+
+    def test_training_data_hash(self):
+
+        filter_ = CNNTokenFilter(2, 2, nb_filter=5, epochs=1, batch_size=2, seed=42)
+        pair_a = ('in', 'jn', ['dat', 'is'], ['deme', 'hove'])
+        pair_b = ('in', 'en', ['he', 'was'], ['man', 'de'])
+
+        self.assertEqual(filter_._getTrainingDataHash([pair_a], [pair_b]), filter_._getTrainingDataHash([pair_a], [pair_b]))
+        self.assertNotEqual(filter_._getTrainingDataHash([pair_a], [pair_b]), filter_._getTrainingDataHash([pair_a, pair_b], []))
+
+        ## the hash is only computed if the data is cached
+        with mock.patch.object(filter_, '_getTrainingDataHash') as get_hash:
+            filter_.train([pair_a], [pair_b])
+            get_hash.assert_not_called()
+
+    def test_balanced_training_batches(self):
+
+        filter_ = CNNTokenFilter(1, 1, nb_filter=5, epochs=1, batch_size=2, seed=42)
+        filter_.char_tokenizer = self.filter.char_tokenizer
+        filter_._resetEncodings()
+        data = filter_._getTrainingData(
+            [('in', 'jn', ['dat'], ['deme']), ('in', 'yn', ['so'], ['der']), ('in', 'en', ['vnde'], ['deme'])],
+            [('in', 'en', ['was'], ['man'])])
+
+        X, Y = next(iter(filter_._getTrainingDataset(data, 2)))
+
+        self.assertEqual(list(Y.numpy()), [1, 1, 0, 0])
+        self.assertEqual(len(X), 3)
+        self.assertEqual(X[1].shape, (4, filter_.max_word_len))
+        numpy.testing.assert_array_equal(X[1][2], X[1][3])
+
+    def test_export_to_numpy(self):
+
+        inputs = [(candidate, left_context, right_context) for _, candidates, left_context, right_context in self.tokens for candidate in candidates]
+        ## unknown characters
+        inputs.append(('JNX', ['Dat'], ['#']))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            modelfile_name = os.path.join(tmpdir, 'model.npz')
+            self.filter.export(modelfile_name)
+            numpy_filter = NumpyCNNTokenFilter.create(modelfile_name, prediction_batch_size=3)
+
+        numpy.testing.assert_allclose(numpy_filter._predict(inputs), self.filter._predict(inputs), atol=1e-5)
+        self.assertEqual(numpy_filter.filterCandidatesForTokens(self.tokens), self.filter.filterCandidatesForTokens(self.tokens))
+
+    def test_export_with_context_embeddings(self):
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, 'embeddings.txt'), 'w') as f:
+                f.write("dat 0.5 1.0 -1.0\nis 0.0 0.2 0.1\ndeme 1.0 0.3 0.2\n")
+            with open(os.path.join(tmpdir, 'simplifications.txt'), 'w') as f:
+                f.write("js\tis\n")
+
+            filter_ = CNNTokenFilter(1, 1, nb_filter=5, epochs=1, batch_size=2, seed=42, filter_lengths=[2, 3],
+                                     vector_type='hyperwords', vectorfile_name=os.path.join(tmpdir, 'embeddings.txt'),
+                                     simplfile_name=os.path.join(tmpdir, 'simplifications.txt'))
+
+        filter_.train(
+            [('in', 'jn', ['dat'], ['deme']), ('in', 'yn', ['is'], ['hove'])],
+            [('in', 'en', ['js'], ['man']), ('in', 'ene', ['dat'], ['de'])])
+
+        inputs = [('jn', ['dat'], ['deme']), ('en', ['js'], ['xyz']), ('yn', [], [])]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            modelfile_name = os.path.join(tmpdir, 'model.npz')
+            filter_.export(modelfile_name)
+            numpy_filter = NumpyCNNTokenFilter(modelfile_name)
+
+        numpy.testing.assert_allclose(numpy_filter._predict(inputs), filter_._predict(inputs), atol=1e-5)
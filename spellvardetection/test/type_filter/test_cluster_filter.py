@@ -1,7 +1,10 @@
+import os
+import tempfile
 import unittest
 
 import spellvardetection.test.MockClasses as MockClasses
 
+from spellvardetection.lib.clusters import WordClusters
 from spellvardetection.type_filter import ClusterTypeFilter
 
 class TestClusterBasedTypeFilter(unittest.TestCase):
@@ -33,3 +36,19 @@ class TestClusterBasedTypeFilter(unittest.TestCase):
         filter_ = ClusterTypeFilter(self.cluster_mock, True)
         self.assertEquals(filter_.filterCandidates('cat', {'dog', 'hat', 'flat'}),
                           {'dog'})
+
+    def test_filter_candidates_with_word_clusters(self):
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cluster_file = os.path.join(tmpdir, 'clusters')
+            with open(cluster_file, 'w', encoding='utf-8') as f:
+                f.write('110\tdog\t2\n1110\tmouse\t2\n110\tcat\t2\n')
+            clusters = WordClusters('brown', cluster_file)
+
+        filter_ = ClusterTypeFilter(clusters)
+        self.assertEqual(filter_.filterCandidates('cat', ['dog', 'mouse', 'rat']), {'dog', 'rat'})
+        self.assertEqual(filter_.filterCandidates('cat', []), set())
+        self.assertEqual(filter_.filterCandidates('rat', ['dog', 'mouse']), {'dog', 'mouse'})
+
+        filter_ = ClusterTypeFilter(clusters, True)
+        self.assertEqual(filter_.filterCandidates('cat', ['dog', 'mouse', 'rat']), {'dog'})
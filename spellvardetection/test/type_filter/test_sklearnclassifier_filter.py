@@ -1,8 +1,13 @@
+import os
+import tempfile
 import unittest
 
 from spellvardetection.type_filter import SKLearnClassifierBasedTypeFilter
 from spellvardetection.util.feature_extractor import SurfaceExtractor
+from spellvardetection.lib.feature_cache import FeatureCache
+from spellvardetection.lib.feature_store import FeatureStore, FeatureStoreWriter
 from sklearn.dummy import DummyClassifier
+from sklearn.linear_model import SGDClassifier
 from sklearn.svm import SVC
 
 from imblearn.ensemble import BalancedBaggingClassifier
@@ -46,3 +51,70 @@ class TestSKLearnClassifierBasedTypeFilter(unittest.TestCase):
         params = clf.get_params()
         self.assertEquals(params['classifier__C'], 2)
         self.assertEquals(params['classifier__gamma'], 0.1)
+
+    def test_train_in_chunks(self):
+        clf = SKLearnClassifierBasedTypeFilter.create_for_training(
+            'sklearn.linear_model.SGDClassifier', [SurfaceExtractor(n_features=2**10)], {'random_state': 0}, chunk_size=1)
+        clf.train([('under', 'vnder'), ('vnd', 'und')], [('hans', 'hand'), ('uns', 'und')])
+
+        self.assertTrue(isinstance(clf.classifier, SGDClassifier))
+        self.assertEqual(clf.filterCandidates('vnde', ['unde', 'vnds']), set(['unde']))
+
+    def test_train_in_chunks_with_seed(self):
+
+        orders = []
+        def record_order(X_data, Y_data, classes=None):
+            orders.append(list(X_data))
+            return clf
+
+        for seed in [0, 1]:
+            clf = SKLearnClassifierBasedTypeFilter.create_for_training(
+                'sklearn.linear_model.SGDClassifier', [SurfaceExtractor(n_features=2**10)], chunk_size=2, seed=seed)
+            clf.partial_fit = record_order
+            clf.train([('under', 'vnder'), ('vnd', 'und'), ('dyt', 'dit')], [('hans', 'hand'), ('uns', 'und'), ('in', 'en')])
+
+        self.assertEqual(clf.seed, 1)
+        self.assertNotEqual(orders[:3], orders[3:])
+
+    def test_train_with_multiple_processes(self):
+        extractor = SurfaceExtractor()
+        extractor.setFeatureCache()
+        clf = SKLearnClassifierBasedTypeFilter.create_for_training('__svm__', [extractor], max_processes=2)
+        clf.train([('under', 'vnder'), ('vnd', 'und')], [('hans', 'hand'), ('uns', 'und')])
+
+        self.assertEqual(clf._clf.named_steps['features'].n_jobs, 2)
+        self.assertEqual(clf.filterCandidates('vnde', ['unde', 'vnds']), set(['unde']))
+        ## the extractor keeps its cache
+        self.assertTrue(hasattr(clf.feature_extractors[0][1], 'feature_cache'))
+
+    def test_train_with_multiple_processes_and_feature_store(self):
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            ## the features of one pair are precomputed
+            with FeatureStoreWriter(tmpdir, ['surface']) as writer:
+                writer.add('["under", "vnder"]', {'surface': [('xx',)]})
+
+            extractor = SurfaceExtractor()
+            extractor.setFeatureCache(FeatureCache(backend=FeatureStore(tmpdir)), key='surface')
+            clf = SKLearnClassifierBasedTypeFilter.create_for_training('__svm__', [extractor], max_processes=2)
+            clf.train([('under', 'vnder'), ('vnd', 'und')], [('hans', 'hand'), ('uns', 'und')])
+
+        ## the worker has read the features from the store
+        fitted_extractor = clf._clf.named_steps['features'].transformer_list[0][1]
+        self.assertIn(('xx',), fitted_extractor.vec.vocabulary_)
+        ## and the extractor has its cache back
+        self.assertIs(fitted_extractor.feature_cache, extractor.feature_cache)
+
+    def test_reset_processes_of_trained_model(self):
+
+        clf = SKLearnClassifierBasedTypeFilter.create_for_training(
+            'sklearn.linear_model.LogisticRegression', [SurfaceExtractor()], max_processes=2)
+        clf.train([('under', 'vnder'), ('vnd', 'und')], [('hans', 'hand'), ('uns', 'und')])
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            modelfile_name = os.path.join(tmpdir, 'model')
+            clf.save(modelfile_name)
+            loaded = SKLearnClassifierBasedTypeFilter.create(modelfile_name)
+
+        self.assertIsNone(loaded.classifier.n_jobs)
+        self.assertIsNone(loaded._clf.named_steps['features'].n_jobs)
@@ -0,0 +1,54 @@
+import random
+import unittest
+
+import spellvardetection.util.benchmark as benchmark
+from spellvardetection.util.spellvarfactory import create_base_factory
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_generateSpellvarData(self):
+
+        dictionary, spellvardict = benchmark.generateSpellvarData(500, random.Random(1))
+
+        self.assertEqual(len(dictionary), 500)
+        self.assertEqual(len(set(dictionary)), 500)
+        self.assertTrue(spellvardict)
+        ## variants are symmetric and part of the dictionary
+        for word, variants in spellvardict.items():
+            self.assertIn(word, dictionary)
+            for variant in variants:
+                self.assertIn(word, spellvardict[variant])
+
+        ## the data is reproducible
+        self.assertEqual(benchmark.generateSpellvarData(500, random.Random(1)), (dictionary, spellvardict))
+
+    def test_getSettings(self):
+
+        self.assertEqual(benchmark.getSettings('levenshtein', benchmark.BENCHMARK_GENERATORS),
+                         {'type': 'levenshtein', 'options': {'max_dist': 1}})
+        self.assertEqual(benchmark.getSettings('{"type": "levenshtein", "options": {"max_dist": 2}}', benchmark.BENCHMARK_GENERATORS),
+                         {'type': 'levenshtein', 'options': {'max_dist': 2}})
+
+    def test_benchmarkGenerator(self):
+
+        result = benchmark.benchmarkGenerator(
+            create_base_factory(), benchmark.BENCHMARK_GENERATORS['simplification'],
+            ['und', 'vnd', 'in', 'jn', 'dat'], ['vnd', 'in', 'dat'], {'und': ['vnd'], 'vnd': ['und'], 'in': ['jn'], 'jn': ['in']},
+            benchmark.BENCHMARK_TYPE_FILTERS['edit_probabilities'])
+
+        self.assertEqual(result['candidates_per_query'], 2/3)
+        self.assertEqual(result['precision'], 1)
+        self.assertEqual(result['recall'], 1)
+        self.assertGreater(result['queries_per_second'], 0)
+
+    def test_benchmarkGeneratorInProcess(self):
+
+        result = benchmark.benchmarkGeneratorInProcess(
+            benchmark.BENCHMARK_GENERATORS['levenshtein'], ['und', 'vnd', 'in', 'jn'], ['vnd', 'in'],
+            {'und': ['vnd'], 'vnd': ['und'], 'in': ['jn'], 'jn': ['in']})
+
+        self.assertEqual(result['recall'], 1)
+        ## the memory is measured in the new process
+        self.assertGreater(result['peak_memory_kb'], 0)
+        self.assertGreaterEqual(result['peak_memory_increase_kb'], 0)
+        self.assertLessEqual(result['peak_memory_increase_kb'], result['peak_memory_kb'])
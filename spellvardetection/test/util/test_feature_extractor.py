@@ -1,7 +1,10 @@
 import unittest
+from unittest import mock
 import math
+import pickle
 
 from spellvardetection.util.feature_extractor import SurfaceExtractor, ContextExtractor, NGramExtractor
+from spellvardetection.lib.feature_cache import FeatureCache
 
 class TestSurfaceExtractor(unittest.TestCase):
 
@@ -78,6 +81,48 @@ class TestSurfaceExtractor(unittest.TestCase):
             set([('ft',), ('$$', 'ft'), ('ft', 'ee'), ('$$', 'ft', 'ee'), ('ft', 'ee', 'ss')])
         )
 
+    def test_feature_extractor_bounded_cache(self):
+
+        ext = NGramExtractor(min_ngram_size=2, max_ngram_size=2, bow='', eow='')
+
+        ext.setFeatureCache(max_entries=1)
+        ext.extractFeaturesFromDatapoint('abc')
+        ext.extractFeaturesFromDatapoint('abc')
+        ext.extractFeaturesFromDatapoint('bcd')
+
+        self.assertEqual(list(ext.feature_cache.keys()), ['bcd'])
+        statistics = ext.getCacheStatistics()
+        self.assertEqual(statistics['hits'], 1)
+        self.assertEqual(statistics['misses'], 2)
+
+    def test_feature_extractor_shared_bounded_cache(self):
+
+        feature_cache = FeatureCache()
+        ext1 = NGramExtractor(min_ngram_size=2, max_ngram_size=2, bow='', eow='')
+        ext1.setFeatureCache(feature_cache, key='ext1')
+        ext2 = NGramExtractor(min_ngram_size=3, max_ngram_size=3, bow='', eow='')
+        ext2.setFeatureCache(feature_cache, key='ext2')
+
+        ext1.extractFeaturesFromDatapoint('abc')
+        ## the entry exists, but without the features of ext2
+        ext2.extractFeaturesFromDatapoint('abc')
+        ext2.extractFeaturesFromDatapoint('abc')
+
+        statistics = feature_cache.getStatistics()
+        self.assertEqual(statistics['hits'], 1)
+        self.assertEqual(statistics['misses'], 2)
+        self.assertEqual(feature_cache['abc'], {'ext1': set([('a', 'b'), ('b', 'c')]), 'ext2': set([('a', 'b', 'c')])})
+
+    def test_feature_extractor_create_with_cache_options(self):
+
+        ext = NGramExtractor.create(min_ngram_size=2, max_ngram_size=2, key='ngrams', cache_options={'max_entries': 10})
+
+        self.assertEqual(
+            ext.extractFeaturesFromDatapoint('abc'),
+            set([('$', 'a'), ('a', 'b'), ('b', 'c'), ('c', '$')])
+        )
+        self.assertEqual(ext.feature_cache['abc'], {'ngrams': set([('$', 'a'), ('a', 'b'), ('b', 'c'), ('c', '$')])})
+
     def test_feature_extractor_pickle(self):
 
         ext = SurfaceExtractor()
@@ -88,6 +133,13 @@ class TestSurfaceExtractor(unittest.TestCase):
 
         self.assertTrue('feature_cache' not in ext.__getstate__())
 
+    def test_feature_extractor_unpickle_in_same_process(self):
+
+        ext = SurfaceExtractor()
+        ext.setFeatureCache({'a': 'b'})
+
+        self.assertIs(pickle.loads(pickle.dumps(ext)).feature_cache, ext.feature_cache)
+
     def test_extract_all_ngrams(self):
 
         ext = SurfaceExtractor(only_mismatch_ngrams=False)
@@ -127,6 +179,65 @@ class TestSurfaceExtractor(unittest.TestCase):
         )
 
 
+    def test_hashed_features(self):
+
+        ext = SurfaceExtractor(n_features=2**10)
+        ext.fit([])
+        features = ext.transform([self.data_point, ('test', 'test')])
+
+        self.assertEqual(features.shape, (2, 2**10))
+        self.assertEqual(features[0].sum(), 5)
+        self.assertEqual(features[1].sum(), 0)
+
+    def test_hashed_features_with_repeated_ngrams(self):
+
+        ## e.g. features from a precomputed cache
+        data = [('vnd', 'und')]
+        cache = {'["und", "vnd"]': [('uv',), ('uv',), ('$$', 'uv')]}
+
+        hashed = SurfaceExtractor(n_features=2**10)
+        hashed.setFeatureCache(dict(cache))
+        vectorized = SurfaceExtractor()
+        vectorized.setFeatureCache(dict(cache))
+
+        self.assertEqual(sorted(hashed.fit(data).transform(data).data), [1, 1])
+        self.assertEqual(sorted(vectorized.fit(data).transform(data).data), [1, 1])
+
+    def test_hashed_features_partial_fit(self):
+
+        with self.assertRaises(ValueError):
+            SurfaceExtractor().partial_fit([self.data_point])
+
+        ext = SurfaceExtractor(n_features=2**10).partial_fit([self.data_point])
+        self.assertEqual(ext.transform([self.data_point]).sum(), 5)
+
+    def test_set_params_clears_cache(self):
+
+        feature_cache = {'["fest", "test"]': {'surface': [('ft',)], 'other': [('x',)]}}
+        ext = SurfaceExtractor()
+        ext.setFeatureCache(feature_cache, key='surface')
+
+        ## hashing does not change the extracted features
+        ext.set_params(n_features=2**10)
+        self.assertEqual(ext.extractFeaturesFromDatapoint(self.data_point), [('ft',)])
+
+        ext.set_params(max_ngram_size=2)
+        self.assertEqual(feature_cache, {'["fest", "test"]': {'other': [('x',)]}})
+        self.assertEqual(set(ext.extractFeaturesFromDatapoint(self.data_point)), set([('ft',), ('$$', 'ft'), ('ft', 'ee')]))
+
+    def test_get_and_set_params(self):
+
+        ext = SurfaceExtractor(n_features=2**10)
+        self.assertEqual(ext.get_params(),
+                         {'min_ngram_size': 1, 'max_ngram_size': 3, 'only_mismatch_ngrams': True, 'padding_char': '$', 'n_features': 2**10})
+
+        ext.set_params(max_ngram_size=1, n_features=None)
+        self.assertEqual(
+            set(ext.extractFeaturesFromDatapoint(self.data_point)),
+            set([('ft',)])
+        )
+        self.assertEqual(ext.fit([self.data_point]).transform([self.data_point]).shape, (1, 1))
+
 class TestContextExtractor(unittest.TestCase):
 
     def setUp(self):
@@ -160,6 +271,33 @@ class TestContextExtractor(unittest.TestCase):
         self.assertTrue(math.isnan(ext.extractFeaturesFromDatapoint(self.data_point)))
 
 
+    def test_extract_batch(self):
+
+        ext = ContextExtractor({'test': [2,0], 'fest': [1,1], 'nest': [0,0], 'west': None})
+        ext.batch_size = 2
+
+        features = ext.extractFeatures([('test', 'fest'), ('test', 'test'), ('test', 'nest'), ('west', 'test'), ('fest', 'fest')])
+
+        self.assertAlmostEqual(features[0], math.sqrt(0.5))
+        self.assertAlmostEqual(features[1], 1)
+        self.assertEqual(features[2], 0)
+        self.assertTrue(math.isnan(features[3]))
+        self.assertAlmostEqual(features[4], 1)
+
+    def test_extract_batch_with_cache(self):
+
+        ext = ContextExtractor({'test': [2,0], 'fest': [1,1]})
+        ext.setFeatureCache({'["fest", "test"]': 0.5}, None)
+
+        with mock.patch.object(ext, '_featureExtractionBatch', wraps=ext._featureExtractionBatch) as extract:
+            features = ext.extractFeatures([('test', 'fest'), ('test', 'test'), ('test', 'test')])
+
+        ## cached features are used, identical datapoints are extracted once
+        self.assertEqual(features, [0.5, 1, 1])
+        extract.assert_called_once_with([('test', 'test')])
+        self.assertEqual(ext.feature_cache['["test", "test"]'], 1)
+
+
 class TestNGramExtractor(unittest.TestCase):
 
     def setUp(self):
@@ -372,3 +510,28 @@ class TestNGramExtractor(unittest.TestCase):
                 tuple('#'), tuple('a'), tuple('b'), tuple('c'), tuple('d'), tuple('#'),
             ])
         )
+
+    def test_extract_2_skip_four_grams_with_gap(self):
+
+        ext = NGramExtractor(min_ngram_size=4, max_ngram_size=4, skip_size=2, gap='|', bow='', eow='')
+
+        self.assertEqual(
+            ext.extractFeaturesFromDatapoint('abcdef'),
+            set([
+                tuple('abcd'), tuple('bcde'), tuple('cdef'),
+                tuple('a|cde'), tuple('ab|de'), tuple('b|def'), tuple('bc|ef'),
+                tuple('abc|e'), tuple('bcd|f'),
+                tuple('a||def'), tuple('a|c|ef'), tuple('a|cd|f'), tuple('ab||ef'), tuple('ab|d|f'), tuple('abc||f')
+            ])
+        )
+
+    def test_extract_interned_features(self):
+
+        ext = NGramExtractor(min_ngram_size=2, max_ngram_size=2, skip_size=0, bow='', eow='', intern_features=True)
+
+        features_a = ext.extractFeaturesFromDatapoint('abc')
+        features_b = ext.extractFeaturesFromDatapoint('bcd')
+
+        self.assertTrue(all(isinstance(feature, int) for feature in features_a | features_b))
+        self.assertEqual(set([ext.getFeature(feature) for feature in features_a]), set([('a', 'b'), ('b', 'c')]))
+        self.assertEqual(set([ext.getFeature(feature) for feature in features_a & features_b]), set([('b', 'c')]))
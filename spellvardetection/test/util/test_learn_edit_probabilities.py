@@ -1,3 +1,6 @@
+import json
+import os
+import tempfile
 import unittest
 
 import spellvardetection.util.learn_edit_probabilities as probs
@@ -10,3 +13,27 @@ class TestLearnEditProbabilities(unittest.TestCase):
             probs.getProbabilitiesFromSpellvars({'aa': ['ac'], 'ac': []}),
             [{'char1': 'a', 'char2': 'c', 'probability': 2/3}]
         )
+
+    def test_getEditOpCounts(self):
+
+        true_pairs = [('dyt', 'dit'), ('hit', 'hyt'), ('vnd', 'und')]
+        false_pairs = iter([('dit', 'hit'), ('jn', 'yn')])
+        expected = {'iy': {'correct': 2, 'false': 0}, 'uv': {'correct': 1, 'false': 0},
+                    'dh': {'correct': 0, 'false': 1}, 'jy': {'correct': 0, 'false': 1}}
+
+        self.assertEqual(probs.getEditOpCounts(true_pairs, false_pairs, max_processes=1, chunk_size=2), expected)
+        self.assertEqual(probs.getEditOpCounts(true_pairs, [('dit', 'hit'), ('jn', 'yn')], max_processes=2, chunk_size=1), expected)
+
+    def test_accumulate_counts(self):
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            counts_file = os.path.join(tmpdir, 'counts.json')
+
+            probs.getProbabilitiesFromSpellvars({'aa': ['ac'], 'ac': []}, max_processes=1, counts_file=counts_file)
+            self.assertEqual(
+                probs.getProbabilitiesFromSpellvars({'ba': ['bc'], 'bc': []}, max_processes=1, counts_file=counts_file),
+                [{'char1': 'a', 'char2': 'c', 'probability': 3/4}]
+            )
+
+            with open(counts_file) as f:
+                self.assertEqual(json.load(f), {'ac': {'correct': 2, 'false': 0}})
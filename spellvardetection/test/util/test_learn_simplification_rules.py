@@ -48,3 +48,19 @@ class TestLearnSimplificationRules(unittest.TestCase):
             simpl.getRulesAndFreqFromSpellvars({'aad': ['cad'], 'aat': [], 'cat': []}),
             {('a', 'c'): {'tp': 1, 'fp': 1}}
         )
+
+    def test_countRules(self):
+
+        pairs = [('ein', 'eyn'), ('bei', 'bey'), ('ghe', 'ge')]
+
+        self.assertEqual(simpl.countRules(pairs), {('i', 'y'): 2, ('gh', 'g'): 1})
+        self.assertEqual(simpl.countRules(pairs, rules=[('i', 'y')]), {('i', 'y'): 2})
+
+    def test_getRulesAndFreqFromPairs(self):
+
+        true_pairs = [('ein', 'eyn'), ('bei', 'bey'), ('ghe', 'ge')]
+        false_pairs = iter([('in', 'yn'), ('a', 'b'), ('gat', 'gt')])
+        expected = {('i', 'y'): {'tp': 2, 'fp': 1}, ('gh', 'g'): {'tp': 1, 'fp': 0}}
+
+        self.assertEqual(simpl.getRulesAndFreqFromPairs(true_pairs, false_pairs, max_processes=1, chunk_size=2), expected)
+        self.assertEqual(simpl.getRulesAndFreqFromPairs(true_pairs, [('in', 'yn'), ('a', 'b')], max_processes=2, chunk_size=1), expected)
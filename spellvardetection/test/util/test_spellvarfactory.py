@@ -0,0 +1,51 @@
+import importlib
+import inspect
+import unittest
+
+import factory_manager.factory_manager
+
+from spellvardetection.util.spellvarfactory import create_base_factory, _OBJECT_HIERARCHIES
+import spellvardetection.generator
+import spellvardetection.type_filter
+
+class TestSpellvarFactory(unittest.TestCase):
+
+    def test_registry_contains_all_types(self):
+
+        for type_name, (base_cls_name, _, modules_for_types) in _OBJECT_HIERARCHIES.items():
+
+            module_name, cls_name = base_cls_name.rsplit('.', 1)
+            base_cls = getattr(importlib.import_module(module_name), cls_name)
+            for module in modules_for_types.values():
+                importlib.import_module(module)
+
+            types = {
+                cls.name: cls.__module__
+                for cls in factory_manager.factory_manager.all_subclasses(base_cls)
+                if not inspect.isabstract(cls) and getattr(cls, 'name', None) is not None}
+            self.assertEqual(types, modules_for_types, type_name)
+
+    def test_registered_names_match_class_names(self):
+
+        for type_name, (base_cls_name, _, modules_for_types) in _OBJECT_HIERARCHIES.items():
+
+            module_name, cls_name = base_cls_name.rsplit('.', 1)
+            base_cls = getattr(importlib.import_module(module_name), cls_name)
+            for name, module_name in modules_for_types.items():
+                with self.subTest(type_name=type_name, name=name):
+                    module = importlib.import_module(module_name)
+                    names = [
+                        getattr(cls, 'name', None) for _, cls in inspect.getmembers(module, inspect.isclass)
+                        if cls.__module__ == module_name and issubclass(cls, base_cls) and not inspect.isabstract(cls)]
+                    self.assertIn(name, names)
+
+    def test_nested_objects_from_lazy_hierarchies(self):
+
+        generator = create_base_factory().create_from_name('generator', {
+            'type': 'pipeline',
+            'options': {
+                'generator': {'type': 'levenshtein', 'options': {'dictionary': ['und', 'vns'], 'max_dist': 1}},
+                'type_filter': {'type': 'edit_probabilities', 'options': {'probabilities': []}}}})
+
+        self.assertIsInstance(generator, spellvardetection.generator.GeneratorPipeline)
+        self.assertIsInstance(generator.type_filter, spellvardetection.type_filter.EditProbabilitiesTypeFilter)
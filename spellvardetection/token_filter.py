@@ -1,25 +1,21 @@
 import abc
-import csv
-import multiprocessing
 import os
-import functools
+import hashlib
+import json
+import math
 import random
-import pickle
 
 import numpy
 import numpy.random
 
-import tensorflow
-
-from tensorflow.keras.preprocessing.sequence import pad_sequences
-from tensorflow.keras.preprocessing.text import Tokenizer
-from tensorflow.keras.models import load_model, Model
-from tensorflow.keras.layers import Input, Embedding, Conv1D, GlobalMaxPooling1D, Dense, concatenate, Reshape
-
 import joblib
 
 import spellvardetection.lib.util
 import spellvardetection.lib.embeddings
+import spellvardetection.lib.numpy_cnn
+from spellvardetection.lib import profiling
+
+## TensorFlow is only imported when a CNNTokenFilter is trained or loaded
 
 class _AbstractTokenFilter(metaclass=abc.ABCMeta):
 
@@ -31,6 +27,21 @@ class _AbstractTokenFilter(metaclass=abc.ABCMeta):
 
         return set([candidate for candidate in candidates if self.isPair(word, candidate, left_context, right_context)])
 
+    def filterCandidatesForTokens(self, tokens_candidates):
+        """Filter the candidates for multiple tokens.
+
+        tokens_candidates is an iterable of tuples (word, candidates,
+        left_context, right_context), a list with the set of filtered
+        candidates for each token is returned.
+        """
+
+        return [self.filterCandidates(word, candidates, left_context, right_context)
+                for word, candidates, left_context, right_context in tokens_candidates]
+
+    def getStatistics(self):
+
+        return {}
+
 
 class _AbstractTrainableTokenFilter(_AbstractTokenFilter):
 
@@ -53,23 +64,204 @@ class _AbstractTrainableTokenFilter(_AbstractTokenFilter):
     def save(self, modelfile_name):  # pragma: no cover
         pass
 
-class CNNTokenFilter(_AbstractTrainableTokenFilter):
+class _AbstractCNNTokenFilter(_AbstractTokenFilter):
+    """Common base of token filters that classify a candidate in its context
+    with a convolutional neural network.
+
+    Inputs are encoded as the character sequences and/or the word
+    embeddings of the context words and the candidate.
+    """
+
+    ## number of candidates that are classified at once
+    prediction_batch_size = 1024
+    ## maximal number of words whose encodings are cached
+    encoding_cache_size = 100000
+
+    @abc.abstractmethod
+    def _encodeCharacters(self, words):  # pragma: no cover
+        pass
+
+    @abc.abstractmethod
+    def _getEmbeddings(self, words):  # pragma: no cover
+        pass
+
+    @abc.abstractmethod
+    def _getEmbeddingDim(self):  # pragma: no cover
+        pass
+
+    @abc.abstractmethod
+    def _predictBatch(self, X):  # pragma: no cover
+        pass
+
+    def _resetEncodings(self, capacity=None):
+
+        if capacity is None:
+            capacity = self.encoding_cache_size
+
+        ## row 0 is the encoding of padding positions (all zeros)
+        self._encoding_rows = {None: 0}
+        if self.use_form_embedding:
+            self._char_encodings = numpy.zeros((capacity + 1, self.max_word_len), dtype='int32')
+        if self.use_context_embedding:
+            self._embedding_encodings = numpy.zeros((capacity + 1, self._getEmbeddingDim()), dtype='float32')
+
+    def _getEncodingRows(self, words):
+
+        if not hasattr(self, '_encoding_rows'):
+            self._resetEncodings()
+
+        new_words = list(dict.fromkeys(word for word in words if word not in self._encoding_rows))
+
+        if new_words:
+
+            ## the cache is bounded: it is cleared if it is full, and enlarged for batches
+            ## with more distinct words than fit into the cache
+            capacity = len(self._char_encodings if self.use_form_embedding else self._embedding_encodings) - 1
+            if len(self._encoding_rows) - 1 + len(new_words) > capacity:
+                new_words = list(dict.fromkeys(word for word in words if word is not None))
+                self._resetEncodings(max(self.encoding_cache_size, len(new_words)))
+
+            rows = numpy.arange(len(self._encoding_rows), len(self._encoding_rows) + len(new_words))
+
+            if self.use_form_embedding:
+                self._char_encodings[rows] = self._encodeCharacters(new_words)
+            if self.use_context_embedding:
+                self._embedding_encodings[rows] = self._getEmbeddings(new_words)
+
+            self._encoding_rows.update(zip(new_words, rows.tolist()))
+
+        return numpy.array([self._encoding_rows[word] for word in words], dtype='int64')
+
+
+    def _getInputRows(self, inputs):
+
+        ## every input is a sequence of the left context, the candidate and the right context,
+        ## padded with None to a fixed length
+        words = []
+        for candidate, left_context, right_context in inputs:
+            left_context = list(left_context[max(len(left_context) - self.left_context_len, 0):])
+            right_context = list(right_context[:self.right_context_len])
+            words += [None]*(self.left_context_len - len(left_context)) + left_context + [candidate] \
+                + right_context + [None]*(self.right_context_len - len(right_context))
+
+        return self._getEncodingRows(words).reshape(len(inputs), self.left_context_len + self.right_context_len + 1)
+
+    def _getInputs(self, inputs):
+
+        rows = self._getInputRows(inputs)
+
+        X = []
+
+        if self.use_context_embedding:
+            X.append(self._embedding_encodings[rows])
+
+        if self.use_form_embedding:
+            char_sequences = self._char_encodings[rows]
+            X += [char_sequences[:, i, :] for i in range(rows.shape[1])]
+
+        return X
+
+
+    def _predict(self, inputs):
+
+        scores = []
+        for start in range(0, len(inputs), self.prediction_batch_size):
+
+            ## encoding the characters and embeddings is timed as feature extraction
+            with profiling.stage(profiling.FEATURE_EXTRACTION):
+                X = self._getInputs(inputs[start:start + self.prediction_batch_size])
+            with profiling.stage(profiling.INFERENCE):
+                scores.append(numpy.asarray(self._predictBatch(X)).reshape(-1))
+
+        return numpy.concatenate(scores)
+
+    def isPair(self, word, candidate, left_context, right_context):
+
+        return self._predict([(candidate, left_context[max(len(left_context) - self.left_context_len, 0):], right_context[:self.right_context_len])])[0] > 0.5
+
+    def filterCandidates(self, word, candidates, left_context, right_context):
+
+        return self.filterCandidatesForTokens([(word, candidates, left_context, right_context)])[0]
+
+    def filterCandidatesForTokens(self, tokens_candidates):
+
+        ## collect the candidates of all tokens to classify them in large batches
+        ## the input only depends on the candidate and the (truncated) context,
+        ## so identical inputs (e.g. for frequent types in the same context) are only classified once
+        tokens_candidates = [(list(candidates), tuple(left_context[max(len(left_context) - self.left_context_len, 0):]), tuple(right_context[:self.right_context_len]))
+                             for _, candidates, left_context, right_context in tokens_candidates]
+
+        input_ids = {}
+        token_input_ids = [
+            [input_ids.setdefault((candidate, left_context, right_context), len(input_ids)) for candidate in candidates]
+            for candidates, left_context, right_context in tokens_candidates]
+
+        self._updateStatistics(sum(map(len, token_input_ids)), len(input_ids))
+
+        if not input_ids:
+            return [set() for _ in tokens_candidates]
+
+        is_pair = self._predict([(candidate, list(left_context), list(right_context))
+                                 for candidate, left_context, right_context in input_ids.keys()]) > 0.5
+
+        ## fan out the results to the tokens
+        return [
+            set([candidate for candidate, input_id in zip(candidates, ids) if is_pair[input_id]])
+            for (candidates, _, _), ids in zip(tokens_candidates, token_input_ids)
+        ]
+
+    def __getstate__(self):
+
+        state = self.__dict__.copy()
+        state.pop('statistics', None)
+        for cache in ['_encoding_rows', '_char_encodings', '_embedding_encodings']:
+            state.pop(cache, None)
+        return state
+
+    def _updateStatistics(self, inputs, unique_inputs):
+
+        if not hasattr(self, 'statistics'):
+            self.statistics = {'inputs': 0, 'unique_inputs': 0}
+
+        self.statistics['inputs'] += inputs
+        self.statistics['unique_inputs'] += unique_inputs
+
+    def getStatistics(self):
+
+        statistics = dict(getattr(self, 'statistics', {'inputs': 0, 'unique_inputs': 0}))
+        ## number of inputs per classified input
+        statistics['dedup_ratio'] = statistics['inputs']/statistics['unique_inputs'] if statistics['unique_inputs'] > 0 else 1.0
+        return statistics
+
+
+class CNNTokenFilter(_AbstractCNNTokenFilter, _AbstractTrainableTokenFilter):
 
     name = 'cnn'
 
-    def create(modelfile_name: os.PathLike):
-        return CNNTokenFilter.load(modelfile_name)
+    ## defaults for objects pickled without these attributes
+    seed = None
+    datacache_name = None
+
+    def create(modelfile_name: os.PathLike, prediction_batch_size=1024, encoding_cache_size=100000):
+        filter_ = CNNTokenFilter.load(modelfile_name)
+        filter_.prediction_batch_size = prediction_batch_size
+        filter_.encoding_cache_size = encoding_cache_size
+        return filter_
 
 
     def __init__(self, left_context_len, right_context_len,
                  use_form_embedding=True, vector_type=None, vectorfile_name: os.PathLike = None,  simplfile_name: os.PathLike = None,
                  filter_lengths: list = None, char_filter_lengths: list = None, nb_filter=50, max_word_len=12, char_embedding_dim=10,
-                 batch_size=20, epochs=10, seed=None
+                 batch_size=20, epochs=10, seed=None, datacache_name: os.PathLike = None
     ):
 
+        self.seed = seed
+        self.datacache_name = datacache_name
+
         if seed is not None:
             numpy.random.seed(seed)
             random.seed(seed)
+            import tensorflow
             tensorflow.random.set_seed(seed)
 
         self.left_context_len = left_context_len
@@ -103,44 +295,30 @@ class CNNTokenFilter(_AbstractTrainableTokenFilter):
         if not self.use_context_embedding and not self.use_form_embedding:
             raise ValueError("Needs to use form embeddings and/or pretrained word embeddings.")
 
+    def _encodeCharacters(self, words):
 
-    def _getSequence(self, word, left_context, right_context):
+        from tensorflow.keras.preprocessing.sequence import pad_sequences
+        return pad_sequences(self.char_tokenizer.texts_to_sequences(words),
+                             maxlen=self.max_word_len, padding='post', truncating='post')
 
-        left_sequence = [self.embeddings.get(cword) for cword in left_context[-self.left_context_len:]]
-        if len(left_sequence) < self.left_context_len:
-            left_sequence = [numpy.zeros(self.embeddings.getDim())]*(self.left_context_len - len(left_sequence)) + left_sequence
+    def _getEmbeddings(self, words):
 
-        right_sequence = [self.embeddings.get(cword) for cword in right_context[:self.right_context_len]]
-        if len(right_sequence) < self.right_context_len:
-            right_sequence = right_sequence + [numpy.zeros(self.embeddings.getDim())]*(self.right_context_len - len(right_sequence))
+        return self.embeddings.getMany(words)
 
-        return numpy.concatenate((
-            left_sequence,
-            [self.embeddings.get(word)],
-            right_sequence), axis=0)
+    def _getEmbeddingDim(self):
 
+        return self.embeddings.getDim()
 
-    def _getInput(self, candidate, left_context, right_context):
+    def _predictBatch(self, X):
 
-        X = []
-
-        if self.use_context_embedding:
-            X .append(numpy.array([self._getSequence(candidate, left_context, right_context)]))
-
-        if self.use_form_embedding:
-
-            left_context = ['']*(self.left_context_len-len(left_context)) + left_context[-self.left_context_len:]
-            right_context = right_context[:self.right_context_len] + ['']*(self.right_context_len-len(right_context))
-            word_sequences = [pad_sequences([seq], maxlen=self.max_word_len, padding='post', truncating='post')
-                              for seq in self.char_tokenizer.texts_to_sequences(left_context + [candidate] + right_context)]
-
-            X += word_sequences
-
-        return X
+        return self._getClassifier().predict_on_batch(X if len(X) > 1 else X[0])
 
 
     def _buildNetwork(self, nb_filter, filter_lengths, char_filter_lengths):
 
+        from tensorflow.keras.models import Model
+        from tensorflow.keras.layers import Input, Embedding, Conv1D, GlobalMaxPooling1D, Dense, concatenate, Reshape
+
         input_list = []
         sequence = []
 
@@ -201,37 +379,119 @@ class CNNTokenFilter(_AbstractTrainableTokenFilter):
             return Model(inputs=input_list[0], outputs=predictions)
 
 
+    def _getTrainingDataHash(self, positive_pairs, negative_pairs):
+
+        ## the pairs are hashed one after another, so no large string is built
+        data_hash = hashlib.sha1(json.dumps([
+            self.left_context_len, self.right_context_len, self.max_word_len, self.use_form_embedding, self.use_context_embedding
+        ]).encode('utf-8'))
+        for label, pairs in [('positive', positive_pairs), ('negative', negative_pairs)]:
+            data_hash.update(label.encode('utf-8'))
+            for pair in pairs:
+                data_hash.update(('\n' + json.dumps(pair)).encode('utf-8'))
+
+        return data_hash.hexdigest()
+
+    def _getTrainingData(self, positive_pairs, negative_pairs):
+
+        ## the encoded dataset can be cached on disk, it is only reused
+        ## if it has been computed for the same pairs and settings
+        ## (changes to the embedding files are not detected)
+        data_hash = None
+        if self.datacache_name is not None:
+            data_hash = self._getTrainingDataHash(positive_pairs, negative_pairs)
+
+        if self.datacache_name is not None and os.path.exists(self.datacache_name):
+            with numpy.load(self.datacache_name) as datacache:
+                if str(datacache['hash']) == data_hash:
+                    return {name: datacache[name] for name in datacache.files if name != 'hash'}
+
+        ## all pairs are encoded at once, i.e. the encoding cache is large enough for all words
+        rows = self._getInputRows([(pair[1], pair[2], pair[3]) for pair in positive_pairs + negative_pairs])
+        nb_encodings = len(self._encoding_rows)
+
+        data = {
+            'positive_rows': rows[:len(positive_pairs)],
+            'negative_rows': rows[len(positive_pairs):],
+        }
+        if self.use_form_embedding:
+            data['char_encodings'] = self._char_encodings[:nb_encodings]
+        if self.use_context_embedding:
+            data['embedding_encodings'] = self._embedding_encodings[:nb_encodings]
+
+        if self.datacache_name is not None:
+            with open(self.datacache_name, 'wb') as datacache:
+                numpy.savez(datacache, hash=data_hash, **data)
+
+        return data
+
+    def _getTrainingDataset(self, data, positive_batch_size):
+
+        import tensorflow
+
+        char_encodings = tensorflow.constant(data['char_encodings']) if self.use_form_embedding else None
+        embedding_encodings = tensorflow.constant(data['embedding_encodings']) if self.use_context_embedding else None
+        sequence_len = self.left_context_len + self.right_context_len + 1
+
+        def sample(rows, seed):
+            return tensorflow.data.Dataset.from_tensor_slices(rows).shuffle(
+                len(rows), seed=seed, reshuffle_each_iteration=True).repeat().batch(positive_batch_size)
+
+        def encode(positive_rows, negative_rows):
+
+            rows = tensorflow.concat([positive_rows, negative_rows], axis=0)
+
+            X = []
+            if self.use_context_embedding:
+                X.append(tensorflow.gather(embedding_encodings, rows))
+            if self.use_form_embedding:
+                char_sequences = tensorflow.gather(char_encodings, rows)
+                X += [char_sequences[:, i, :] for i in range(sequence_len)]
+
+            Y = tensorflow.concat([
+                tensorflow.ones(tensorflow.shape(positive_rows)[0]),
+                tensorflow.zeros(tensorflow.shape(negative_rows)[0])], axis=0)
+
+            return (tuple(X) if len(X) > 1 else X[0]), Y
+
+        ## balanced batches: each batch contains the same number of positive and negative pairs
+        seed = self.seed
+        return tensorflow.data.Dataset.zip((
+            sample(data['positive_rows'], seed),
+            sample(data['negative_rows'], None if seed is None else seed + 1),
+        )).map(encode, num_parallel_calls=tensorflow.data.AUTOTUNE).prefetch(tensorflow.data.AUTOTUNE)
+
     def train(self, positive_pairs, negative_pairs):
 
         if self.use_form_embedding:
+            from tensorflow.keras.preprocessing.text import Tokenizer
             self.char_tokenizer = Tokenizer(num_words=None, filters='', lower=True, split="", char_level=True)
             self.char_tokenizer.fit_on_texts(
                 ["".join([pair[1]] + pair[2] + pair[3]) for pair in positive_pairs + negative_pairs]
             )
 
+        ## encodings depend on the character vocabulary
+        self._resetEncodings()
+
         self.clf = self._buildNetwork(self.nb_filter, self.filter_lengths, self.char_filter_lengths)
 
         self.clf.compile(optimizer='adam',
                          loss='binary_crossentropy')
 
+        dataset = self._getTrainingDataset(
+            self._getTrainingData(positive_pairs, negative_pairs),
+            min(self.batch_size, len(positive_pairs)))
 
-        def batch_generator(positive_pairs, negative_pairs, positive_batch_size):
-            while True:
-                batch = (random.sample(positive_pairs, k=positive_batch_size) + random.sample(negative_pairs, k=positive_batch_size))
-                input_list = [self._getInput(pair[1], pair[2], pair[3]) for pair in batch]
-                X = [numpy.concatenate(inp) for inp in zip(*input_list)]
-
-                Y = numpy.array([1]*positive_batch_size + [0]*positive_batch_size)
-                yield (X, Y)
-
-        gen = batch_generator(positive_pairs, negative_pairs, min(self.batch_size, len(positive_pairs)))
         self.clf.fit(
-            x=batch_generator(positive_pairs, negative_pairs, min(self.batch_size, len(positive_pairs))),
-            steps_per_epoch=len(positive_pairs)/self.batch_size, epochs=self.epochs)
+            x=dataset,
+            steps_per_epoch=max(1, math.ceil(len(positive_pairs)/self.batch_size)), epochs=self.epochs)
+
+        ## free the encodings of the training data
+        self._resetEncodings()
 
     def __getstate__(self):
 
-        state = self.__dict__.copy()
+        state = super().__getstate__()
         del state['clf']
         return state
 
@@ -240,15 +500,127 @@ class CNNTokenFilter(_AbstractTrainableTokenFilter):
         self.clf.save(modelfile_name + '.tf')
 
     def load(modelfile_name):
+        import tensorflow
         obj = joblib.load(modelfile_name)
         obj.clf = tensorflow.keras.models.load_model(modelfile_name + '.tf')
         return obj
 
+    def export(self, outfile_name):
+        """Write the settings and the weights of the trained network to a npz
+        file that can be used by NumpyCNNTokenFilter."""
 
-    def isPair(self, word, candidate, left_context, right_context):
+        from tensorflow.keras.layers import Embedding, Conv1D, Dense
+
+        clf = self._getClassifier()
+
+        settings = {
+            'left_context_len': self.left_context_len,
+            'right_context_len': self.right_context_len,
+            'max_word_len': self.max_word_len,
+            'use_form_embedding': self.use_form_embedding,
+            'use_context_embedding': self.use_context_embedding,
+        }
+        weights = {}
+
+        ## the layers are ordered as they are connected in _buildNetwork:
+        ## first the convolutions over the characters, then over the words
+        convolutions = [layer.get_weights() for layer in clf.layers if isinstance(layer, Conv1D)]
+        char_filter_lengths = list(self.char_filter_lengths) if self.use_form_embedding else []
+        filter_lengths = char_filter_lengths + list(self.filter_lengths)
+        if [kernel.shape[0] for kernel, _ in convolutions] != filter_lengths:
+            raise ValueError("Unexpected structure of the network.")
+
+        for idx, (kernel, bias) in enumerate(convolutions):
+            prefix = 'char_conv_' + str(idx) if idx < len(char_filter_lengths) else 'conv_' + str(idx - len(char_filter_lengths))
+            weights[prefix + '_kernel'] = kernel
+            weights[prefix + '_bias'] = bias
+        settings['char_convolutions'] = len(char_filter_lengths)
+        settings['convolutions'] = len(self.filter_lengths)
+
+        weights['dense_kernel'], weights['dense_bias'] = [layer for layer in clf.layers if isinstance(layer, Dense)][0].get_weights()
+
+        if self.use_form_embedding:
+            weights['char_embedding'] = [layer for layer in clf.layers if isinstance(layer, Embedding)][0].get_weights()[0]
+            weights['char_index'] = json.dumps(self.char_tokenizer.word_index)
+
+        if self.use_context_embedding:
+            words = sorted(self.embeddings.vocabulary, key=self.embeddings.vocabulary.get)
+            weights['embedding_words'] = json.dumps(words)
+            weights['embedding_vectors'] = numpy.asarray(self.embeddings.vectors[[self.embeddings.vocabulary[word] for word in words]], dtype='float32')
+            weights['embedding_missing'] = numpy.zeros(self.embeddings.getDim()) if self.embeddings.missing is None else self.embeddings.missing
+            weights['embedding_simplifications'] = json.dumps(self.embeddings.simplifications)
+
+        with open(outfile_name, 'wb') as outfile:
+            numpy.savez(outfile, settings=json.dumps(settings), **weights)
+
+
+class NumpyCNNTokenFilter(_AbstractCNNTokenFilter):
+    """Applies a CNNTokenFilter exported to a npz file without TensorFlow."""
+
+    name = 'numpy_cnn'
+
+    def create(modelfile_name: os.PathLike, prediction_batch_size=1024, encoding_cache_size=100000):
+        filter_ = NumpyCNNTokenFilter(modelfile_name)
+        filter_.prediction_batch_size = prediction_batch_size
+        filter_.encoding_cache_size = encoding_cache_size
+        return filter_
+
+    def __init__(self, modelfile_name):
+
+        with numpy.load(modelfile_name) as model:
+
+            settings = json.loads(str(model['settings']))
+            self.left_context_len = settings['left_context_len']
+            self.right_context_len = settings['right_context_len']
+            self.max_word_len = settings['max_word_len']
+            self.use_form_embedding = settings['use_form_embedding']
+            self.use_context_embedding = settings['use_context_embedding']
+
+            char_embedding = None
+            char_convolutions = None
+            if self.use_form_embedding:
+                self.char_index = json.loads(str(model['char_index']))
+                char_embedding = model['char_embedding']
+                char_convolutions = [(model['char_conv_' + str(idx) + '_kernel'], model['char_conv_' + str(idx) + '_bias'])
+                                     for idx in range(settings['char_convolutions'])]
+
+            if self.use_context_embedding:
+                self.embedding_rows = {word: row for row, word in enumerate(json.loads(str(model['embedding_words'])))}
+                ## the last row is used for missing words
+                self.embedding_vectors = numpy.concatenate(
+                    (model['embedding_vectors'], [model['embedding_missing']]), axis=0).astype('float32')
+                self.simplifications = json.loads(str(model['embedding_simplifications']))
+
+            self.network = spellvardetection.lib.numpy_cnn.ConvolutionalNetwork(
+                [(model['conv_' + str(idx) + '_kernel'], model['conv_' + str(idx) + '_bias'])
+                 for idx in range(settings['convolutions'])],
+                (model['dense_kernel'], model['dense_bias']),
+                char_embedding, char_convolutions)
+
+    def _encodeCharacters(self, words):
+
+        ## same as the character-level tokenizer of CNNTokenFilter
+        sequences = numpy.zeros((len(words), self.max_word_len), dtype='int32')
+        for idx, word in enumerate(words):
+            sequence = [self.char_index[char] for char in word.lower() if char in self.char_index][:self.max_word_len]
+            sequences[idx, :len(sequence)] = sequence
+
+        return sequences
+
+    def _getEmbeddings(self, words):
+
+        missing = len(self.embedding_vectors) - 1
+        return self.embedding_vectors[[self.embedding_rows.get(self.simplifications.get(word, word), missing) for word in words]]
+
+    def _getEmbeddingDim(self):
+
+        return self.embedding_vectors.shape[1]
+
+    def _predictBatch(self, X):
+
+        embedding_sequences = X[0] if self.use_context_embedding else None
+        char_sequences = numpy.stack(X[1:] if self.use_context_embedding else X, axis=1) if self.use_form_embedding else None
+
+        return self.network.predict(embedding_sequences, char_sequences)
 
-        input_sequence = self._getInput(candidate, left_context[-self.left_context_len:], right_context[:self.right_context_len])
-        if len(input_sequence) == 1:
-            input_sequence = input_sequence[0]
 
-        return self._getClassifier().predict(input_sequence)[0][0] > 0.5
@@ -1,31 +1,37 @@
 # -*- coding: utf-8 -*-
 
 import abc
-import importlib
 import math
 import os
 try:
     import cPickle as pickle
 except ImportError:
     import pickle
-import typing
 
-import joblib
-from sklearn.base import ClassifierMixin
-from sklearn.pipeline import Pipeline, FeatureUnion
-from sklearn.utils.metaestimators import _BaseComposition
-from sklearn.svm import SVC
-
-from imblearn.ensemble import BalancedBaggingClassifier
-
-from spellvardetection.util.feature_extractor import FeatureExtractorMixin, SurfaceExtractor
 import spellvardetection.lib.clusters
 from spellvardetection.lib.undir_spsim import UndirSpSim
 import spellvardetection.lib.util
 
 
+## the type filter based on scikit-learn is defined in sklearn_type_filter,
+## it is available here (e.g. for unpickling older models) but scikit-learn
+## is only imported when it is used
+def __getattr__(name):
+
+    if name == 'SKLearnClassifierBasedTypeFilter':
+        import spellvardetection.sklearn_type_filter
+        return spellvardetection.sklearn_type_filter.SKLearnClassifierBasedTypeFilter
+
+    raise AttributeError("module '" + __name__ + "' has no attribute '" + name + "'")
+
+
 class _AbstractTypeFilter(metaclass=abc.ABCMeta):
 
+    max_processes = 1
+
+    def setMaxProcesses(self, processes):
+        self.max_processes = processes
+
     @abc.abstractmethod
     def isPair(self, word, candidate):  # pragma: no cover
         pass
@@ -50,114 +56,14 @@ class _AbstractTrainableTypeFilter(_AbstractTypeFilter):
         pass
 
 
-class SKLearnClassifierBasedTypeFilter(_AbstractTrainableTypeFilter, _BaseComposition, ClassifierMixin):
-
-    name = 'sklearn'
-
-    def create(modelfile_name: os.PathLike):
-        return SKLearnClassifierBasedTypeFilter.load(modelfile_name)
-
-
-    def create_for_training(classifier_clsname,
-                            feature_extractors: typing.Sequence[FeatureExtractorMixin],
-                            classifier_params=None):
-
-        ## instantiate classifier
-        if classifier_clsname == '__svm__':
-            classifier = SVC(gamma=0.1, C=2)
-        elif classifier_clsname == '__bagging_svm__':
-            classifier = BalancedBaggingClassifier(
-                base_estimator=SVC(gamma=0.1, C=2),
-                n_estimators=10,
-                bootstrap=False,
-                sampling_strategy='majority'
-            )
-        elif '.' in classifier_clsname:
-            module_name, cls_name = classifier_clsname.rsplit('.', 1)
-            module = importlib.import_module(module_name)
-            classifier = getattr(module, cls_name)()
-        else:
-            classifier = globals()[classifier_clsname]()
-
-        if classifier_params is not None:
-            classifier.set_params(**classifier_params)
-
-        extractors = [(str(idx), extractor) for idx, extractor in enumerate(feature_extractors)]
-
-        return SKLearnClassifierBasedTypeFilter(classifier, extractors)
-
-
-    def __init__(self, classifier=None, feature_extractors=None):
-
-        if classifier is None:
-            self.classifier = SVC()
-        else:
-            self.classifier = classifier
-
-        if feature_extractors is None:
-            self.feature_extractors = [('surface', SurfaceExtractor())]
-        else:
-            self.feature_extractors = feature_extractors
-
-
-    def fit(self, X_data, Y_data=None):
-        self._clf = Pipeline([
-            ('features', FeatureUnion(transformer_list=self.feature_extractors)),
-            ('clf', self.classifier),
-        ])
-        self._clf.fit(X_data, Y_data)
-
-        return self
-
-    def predict(self, X_data):
-        try:
-            getattr(self, "_clf")
-        except AttributeError:
-            raise RuntimeError("Classifier has to be trained!")
-
-        return(self._clf.predict(X_data))
-
-    def get_params(self, deep=True):
-
-        features = self._get_params('feature_extractors', deep=deep)
-        if deep:
-            features = {**features, **{'classifier__' + key: value for key, value in self.classifier.get_params(deep=deep).items()}}
-
-        return features
-
-    def set_params(self, **params):
-
-        self._set_params('feature_extractors', **params)
-
-
-    def train(self, positive_pairs, negative_pairs):
-
-        X = (positive_pairs + negative_pairs)
-        Y = [1]*len(positive_pairs) + [0]*len(negative_pairs)
-
-        self.fit(X, Y)
-
-    def isPair(self, word, candidate):
-
-        if self.predict([(word, candidate)]) == 1:
-            return True
-        else:
-            return False
-
-    def load(modelfile_name):
-        return joblib.load(modelfile_name)
-
-    def save(self, modelfile_name):
-        joblib.dump(self, modelfile_name)
-
-
 class ClusterTypeFilter(_AbstractTypeFilter):
 
     name = 'cluster'
 
-    def create(cluster_type, cluster_file: os.PathLike, simplification_file=None, unknown_type=None, remove_candidates_without_cluster=False):
+    def create(cluster_type, cluster_file: os.PathLike, simplification_file=None, unknown_type=None, remove_candidates_without_cluster=False,
+               cache_file=None):
 
-        clusters = spellvardetection.lib.clusters.WordClusters(cluster_type, cluster_file, simplification_file, unknown_type)
+        clusters = spellvardetection.lib.clusters.WordClusters(cluster_type, cluster_file, simplification_file, unknown_type, cache_file)
         return ClusterTypeFilter(clusters, remove_candidates_without_cluster)
 
     def __init__(self, clusters, remove_candidates_without_cluster=False):
@@ -176,6 +82,19 @@ class ClusterTypeFilter(_AbstractTypeFilter):
         else:
             return self.clusters.inSameCluster(word, candidate)
 
+    def filterCandidates(self, word, candidates):
+
+        candidates = list(candidates)
+        if not candidates or not self.clusters.hasCluster(word):
+            return set(candidates)
+
+        ## check all candidates at once
+        keep = self.clusters.inSameClusterMany(word, candidates)
+        if not self.remove_candidates_without_cluster:
+            keep = keep | ~self.clusters.hasClusterMany(candidates)
+
+        return set([candidate for candidate, keep_candidate in zip(candidates, keep) if keep_candidate])
+
 
 class _SimilarityFilter(_AbstractTypeFilter):
 
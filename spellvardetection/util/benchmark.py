@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+import concurrent.futures
+import multiprocessing
+import time
+
+from spellvardetection.lib import profiling
+from spellvardetection.lib.util import load_from_file_if_string
+from spellvardetection.util.spellvarfactory import create_base_factory
+
+## parts of the synthetic words, loosely modelled on middle low german (GML) spellings
+_ONSETS = ['', 'b', 'd', 'dh', 'g', 'gh', 'h', 'k', 'l', 'm', 'n', 'r', 's', 'sch', 'st', 't', 'th', 'v', 'vr', 'w']
+_VOWELS = ['a', 'e', 'i', 'o', 'u', 'ae', 'ee', 'oe']
+_CODAS = ['', 'n', 'nd', 'r', 't', 'ch', 'ck', 'l', 's', 'cht', 'ft']
+_ENDINGS = ['', 'e', 'en', 'er', 'es']
+
+## spelling alternations for the variant noise, as found in the GML example data (e.g. vnd/und, in/jn/yn, deme/dheme)
+VARIANT_RULES = [
+    ('u', 'v'), ('i', 'j'), ('i', 'y'), ('c', 'k'), ('t', 'th'), ('d', 'dh'),
+    ('g', 'gh'), ('s', 'z'), ('a', 'ae'), ('e', 'ee'), ('e', ''),
+]
+
+BENCHMARK_GENERATORS = {
+    'levenshtein': {'type': 'levenshtein', 'options': {'max_dist': 1}},
+    'jaccard': {'type': 'jaccard', 'options': {}},
+    'proxinette': {'type': 'proxinette', 'options': {}},
+    'simplification': {'type': 'simplification', 'options': {'ruleset': [list(rule) for rule in VARIANT_RULES]}},
+}
+BENCHMARK_GENERATORS['union'] = {'type': 'union', 'options': {'generators': [
+    BENCHMARK_GENERATORS['levenshtein'], BENCHMARK_GENERATORS['simplification']]}}
+
+BENCHMARK_TYPE_FILTERS = {
+    'edit_probabilities': {'type': 'edit_probabilities', 'options': {
+        ## the single character edits of the variant rules
+        'probabilities': [{'char1': char1, 'char2': char2, 'probability': 0.9}
+                          for char1, char2 in [('u', 'v'), ('i', 'j'), ('i', 'y'), ('c', 'k'), ('s', 'z'), ('e', ''), ('h', '')]],
+        'sim_thresh': 0.5, 'default_probability': 0.1}},
+}
+BENCHMARK_GENERATORS['pipeline'] = {'type': 'pipeline', 'options': {
+    'generator': {'type': 'levenshtein', 'options': {'max_dist': 2}},
+    'type_filter': BENCHMARK_TYPE_FILTERS['edit_probabilities']}}
+
+
+def getSettings(settings, presets):
+    """Get the settings for the name of a preset or from json."""
+
+    if isinstance(settings, str) and settings in presets:
+        return presets[settings]
+    return load_from_file_if_string(settings)
+
+def generateWord(rng):
+
+    syllables = [rng.choice(_ONSETS) + rng.choice(_VOWELS) + rng.choice(_CODAS) for _ in range(rng.randint(1, 3))]
+    return ''.join(syllables) + rng.choice(_ENDINGS)
+
+def generateVariant(word, rng, max_changes=2):
+
+    for _ in range(rng.randint(1, max_changes)):
+        applicable = [(lhs, rhs) for lhs, rhs in VARIANT_RULES if lhs in word] + \
+            [(rhs, lhs) for lhs, rhs in VARIANT_RULES if rhs and rhs in word]
+        if not applicable:
+            break
+        lhs, rhs = rng.choice(applicable)
+        positions = [i for i in range(len(word)) if word.startswith(lhs, i)]
+        position = rng.choice(positions)
+        word = word[:position] + rhs + word[position+len(lhs):]
+
+    return word
+
+def generateSpellvarData(num_types, rng, variant_ratio=0.5, max_variants=3):
+    """Generate a synthetic dictionary with num_types types and a spelling
+    variant dictionary for its types.
+
+    A share of variant_ratio of the words gets up to max_variants spelling
+    variants. The result only depends on the state of the random number
+    generator rng.
+    """
+
+    ## dicts are used as ordered sets, so the result is reproducible
+    dictionary = {}
+    spellvardict = {}
+
+    while len(dictionary) < num_types:
+        word = generateWord(rng)
+        if word in dictionary:
+            continue
+
+        group = {word: None}
+        if rng.random() < variant_ratio:
+            for _ in range(rng.randint(1, max_variants)):
+                variant = generateVariant(word, rng)
+                if variant and variant not in dictionary:
+                    group[variant] = None
+        group = list(group)[:num_types - len(dictionary)]
+
+        dictionary.update(dict.fromkeys(group))
+        if len(group) > 1:
+            for type_ in group:
+                spellvardict[type_] = [variant for variant in group if variant != type_]
+
+    return list(dictionary), spellvardict
+
+def benchmarkGenerator(factory, generator_settings, dictionary, queries, spellvardict={},
+                       type_filter_settings=None, max_processes=1):
+    """Measure the time for building the generator (and type filter) for the
+    dictionary and for generating (and filtering) the candidates for the
+    queries.
+
+    The peak memory usage is the maximum for the whole process, the increase
+    is measured from the peak before building the generator.
+    """
+
+    baseline_memory = profiling.get_peak_memory()
+
+    start = time.perf_counter()
+    generator = factory.create_from_name('generator', generator_settings)
+    generator.setMaxProcesses(max_processes)
+    generator.setDictionary(dictionary)
+    type_filter = None
+    if type_filter_settings is not None:
+        type_filter = factory.create_from_name('type_filter', type_filter_settings)
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    candidate_items = list(generator.iterCandidatesForWords(queries))
+    query_seconds = time.perf_counter() - start
+
+    filter_seconds = 0.0
+    if type_filter is not None:
+        start = time.perf_counter()
+        candidate_items = [(word, type_filter.filterCandidates(word, candidates)) for word, candidates in candidate_items]
+        filter_seconds = time.perf_counter() - start
+
+    number_of_gold = sum(len(spellvardict.get(word, [])) for word in queries)
+    number_of_candidates = sum(len(candidates) for _, candidates in candidate_items)
+    found = sum(len(set(spellvardict.get(word, [])).intersection(candidates)) for word, candidates in candidate_items)
+    peak_memory = profiling.get_peak_memory()
+
+    return {
+        'build_seconds': build_seconds,
+        'query_seconds': query_seconds,
+        'filter_seconds': filter_seconds,
+        'queries_per_second': len(queries)/(query_seconds + filter_seconds) if query_seconds + filter_seconds > 0 else None,
+        'candidates_per_query': number_of_candidates/len(queries) if queries else 0,
+        'precision': found/number_of_candidates if number_of_candidates > 0 else 1,
+        'recall': found/number_of_gold if number_of_gold > 0 else 1,
+        'peak_memory_kb': peak_memory,
+        'peak_memory_increase_kb': peak_memory - baseline_memory if peak_memory is not None else None,
+    }
+
+def _benchmarkGeneratorWithBaseFactory(*args):
+
+    return benchmarkGenerator(create_base_factory(), *args)
+
+def benchmarkGeneratorInProcess(generator_settings, dictionary, queries, spellvardict={},
+                                type_filter_settings=None, max_processes=1):
+    """Run benchmarkGenerator in a new process, so the peak memory usage is
+    only that of this configuration."""
+
+    ## a forked or spawned process would start with the peak memory usage of this process
+    start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    with concurrent.futures.ProcessPoolExecutor(1, mp_context=multiprocessing.get_context(start_method)) as executor:
+        return executor.submit(
+            _benchmarkGeneratorWithBaseFactory, generator_settings, dictionary, queries, spellvardict,
+            type_filter_settings, max_processes).result()
@@ -1,44 +1,76 @@
  # -*- coding: utf-8 -*-
 
 import abc
+import functools
 import inspect
 import itertools
 import json
-import os
-from threading import Lock
+import uuid
+import weakref
 
-import numpy
+from spellvardetection.lib import profiling
+from spellvardetection.lib.feature_cache import FeatureCache
+from spellvardetection.lib.feature_store import FeatureStore
 
-from sklearn.base import BaseEstimator, TransformerMixin
-from sklearn.feature_extraction import DictVectorizer
-from sklearn.pipeline import Pipeline
-from sklearn.preprocessing import StandardScaler
-from sklearn.impute import SimpleImputer
-from sklearn.metrics.pairwise import cosine_similarity
 
-import spellvardetection.lib.embeddings
-import spellvardetection.lib.util
+## extractors with a feature cache in this process by the token of their cache
+## used to give the cache back to copies of an extractor that are unpickled in this process
+## (e.g. when a fitted extractor is returned from a worker process)
+_cache_owners = weakref.WeakValueDictionary()
 
+## extractors based on scikit-learn are defined in sklearn_feature_extractor,
+## they are available here (e.g. for unpickling older models) but scikit-learn
+## is only imported when they are used
+_SKLEARN_EXTRACTORS = ['SurfaceExtractor', 'ContextExtractor']
 
-class FeatureExtractorMixin(metaclass=abc.ABCMeta):
+def __getattr__(name):
+
+    if name in _SKLEARN_EXTRACTORS:
+        import spellvardetection.util.sklearn_feature_extractor
+        return getattr(spellvardetection.util.sklearn_feature_extractor, name)
+
+    raise AttributeError("module '" + __name__ + "' has no attribute '" + name + "'")
 
-    lock = Lock()
+
+class FeatureExtractorMixin(metaclass=abc.ABCMeta):
 
     ## prevent cache from being pickled
     ## subclasses can provide __getstate__ to override this behaviour
     def __getstate__(self):
 
         pickle_dict = dict(self.__dict__)
-        if 'feature_cache' in pickle_dict:
-            del pickle_dict['feature_cache']
+        feature_cache = pickle_dict.pop('feature_cache', None)
+
+        ## a feature store used as backend is passed as read-only handle (its arrays are memory-mapped)
+        store = getattr(feature_cache, 'backend', None)
+        if isinstance(store, FeatureStore):
+            pickle_dict['_feature_store_path'] = store.path
+
         return pickle_dict
 
+    def __setstate__(self, state):
+
+        state = dict(state)
+        feature_store_path = state.pop('_feature_store_path', None)
+        self.__dict__.update(state)
+
+        owner = _cache_owners.get(state.get('_cache_token'))
+        if owner is not None and hasattr(owner, 'feature_cache'):
+            self.feature_cache = owner.feature_cache
+            _cache_owners[self._cache_token] = self
+        elif feature_store_path is not None:
+            ## e.g. in a worker process: features are read from the store, new features are not kept
+            try:
+                self.feature_cache = FeatureCache(max_entries=0, backend=FeatureStore(feature_store_path))
+            except OSError:
+                pass
+
     def __init_subclass__(cls, **kwargs):
 
         if not hasattr(cls, '__getstate__'):
             setattr(cls, '__getstate__', FeatureExtractorMixin.__getstate__)
 
-        ## add attributes cache and key to create function and set the cache
+        ## add attributes cache, key and cache_options to create function and set the cache
         ## subclasses create method can add cache or key as parameter to the create method to override this behaviour
         if hasattr(cls, 'create'):
 
@@ -47,16 +79,17 @@ class FeatureExtractorMixin(metaclass=abc.ABCMeta):
             sig = inspect.signature(getattr(cls, 'create'))
             if "cache" not in sig.parameters and "key" not in sig.parameters:
 
-                def create_and_add_cache(*args, cache: dict=None, key=None, **kwargs):
+                def create_and_add_cache(*args, cache: dict=None, key=None, cache_options: dict=None, **kwargs):
 
                     extractor = func(*args, **kwargs)
-                    if cache is not None:
-                        extractor.setFeatureCache(cache, key)
+                    if cache is not None or cache_options is not None:
+                        extractor.setFeatureCache(cache, key, **(cache_options if cache_options is not None else {}))
                     return extractor
 
                 new_signature = list(sig.parameters.values()) + [
                     inspect.Parameter("cache", inspect.Parameter.POSITIONAL_OR_KEYWORD, default=None, annotation=dict),
-                    inspect.Parameter("key", inspect.Parameter.POSITIONAL_OR_KEYWORD, default=None)]
+                    inspect.Parameter("key", inspect.Parameter.POSITIONAL_OR_KEYWORD, default=None),
+                    inspect.Parameter("cache_options", inspect.Parameter.POSITIONAL_OR_KEYWORD, default=None, annotation=dict)]
 
                 create_and_add_cache.__signature__ = inspect.Signature(new_signature)
 
@@ -76,54 +109,185 @@ class FeatureExtractorMixin(metaclass=abc.ABCMeta):
     def _featureExtraction(self, datapoint):  # pragma: no cover
         pass
 
+    def _featureExtractionBatch(self, data):
+        """Extract the features for a list of datapoints.
+
+        Subclasses can override this to extract the features of many
+        datapoints at once.
+        """
+
+        return [self._featureExtraction(datapoint) for datapoint in data]
+
+    def _getCachedFeatures(self, data_key):
+
+        ## no global lock is needed: single get and set operations on a dict are atomic,
+        ## a FeatureCache does its own locking if it is shared between threads
+        if self.key is not None and isinstance(self.feature_cache, FeatureCache):
+            ## only counted as a hit if the entry contains the features for the key
+            return self.feature_cache.getFeatures(data_key, self.key)
+
+        cached = self.feature_cache.get(data_key, None)
+        if cached is not None:
+            if self.key is None:
+                return cached, cached
+            return cached, cached.get(self.key, None)
+
+        return cached, None
+
+    def _cacheFeatures(self, data_key, cached, features):
+
+        if self.key is None:
+            self.feature_cache[data_key] = features
+        else:
+            if cached is None:
+                cached = dict()
+            cached[self.key] = features
+            ## reassign the entry so that a FeatureCache can update its size
+            self.feature_cache[data_key] = cached
+
     def extractFeaturesFromDatapoint(self, datapoint):
 
-        ## query cache
-        with FeatureExtractorMixin.lock:
-            if hasattr(self, 'feature_cache'):
-                if self._getDataKey(datapoint) in self.feature_cache:
-                    features = self.feature_cache[self._getDataKey(datapoint)]
-                    if self.key is not None:
-                        features = features.get(self.key, None)
-                    if features is not None:
-                        return features
+        feature_cache = getattr(self, 'feature_cache', None)
+        if feature_cache is None:
+            return self._featureExtraction(datapoint)
 
-        features = self._featureExtraction(datapoint)
+        ## the key is computed only once per datapoint
+        data_key = self._getDataKey(datapoint)
 
-        ## update cache
-        with FeatureExtractorMixin.lock:
-            if hasattr(self, 'feature_cache'):
+        cached, features = self._getCachedFeatures(data_key)
+        if features is not None:
+            return features
 
-                if self.key is None:
-                    self.feature_cache[self._getDataKey(datapoint)] = features
-                else:
-                    if self._getDataKey(datapoint) not in self.feature_cache:
-                        self.feature_cache[self._getDataKey(datapoint)] = dict()
-                    self.feature_cache[self._getDataKey(datapoint)][self.key] = features
+        features = self._featureExtraction(datapoint)
+        self._cacheFeatures(data_key, cached, features)
 
         return features
 
     def extractFeatures(self, data):
 
-        return [self.extractFeaturesFromDatapoint(datapoint) for datapoint in data]
+        with profiling.stage(profiling.FEATURE_EXTRACTION):
+            return self._extractFeatures(data)
+
+    def _extractFeatures(self, data):
 
-    def setFeatureCache(self, feature_cache=None, key=None):
+        data = list(data)
 
+        feature_cache = getattr(self, 'feature_cache', None)
         if feature_cache is None:
-            self.feature_cache = dict()
-        else:
-            self.feature_cache = feature_cache
+            return list(self._featureExtractionBatch(data))
+
+        features = [None] * len(data)
+
+        ## datapoints that are not in the cache are extracted in one batch
+        missing = {}
+        for idx, datapoint in enumerate(data):
+            data_key = self._getDataKey(datapoint)
+            if data_key in missing:
+                missing[data_key][0].append(idx)
+                continue
+
+            cached, features[idx] = self._getCachedFeatures(data_key)
+            if features[idx] is None:
+                missing[data_key] = ([idx], cached, datapoint)
+
+        if missing:
+            extracted = self._featureExtractionBatch([datapoint for _, _, datapoint in missing.values()])
+            for (data_key, (indices, cached, _)), datapoint_features in zip(missing.items(), extracted):
+                self._cacheFeatures(data_key, cached, datapoint_features)
+                for idx in indices:
+                    features[idx] = datapoint_features
+
+        return features
+
+    def setFeatureCache(self, feature_cache=None, key=None, max_entries=None, max_memory=None, thread_safe=False):
+
+        if feature_cache is None:
+            feature_cache = dict()
 
+        ## a (read-only) feature store is used as backend of a FeatureCache
+        if isinstance(feature_cache, FeatureStore):
+            feature_cache = FeatureCache(max_entries=max_entries, max_memory=max_memory, thread_safe=thread_safe, backend=feature_cache)
+
+        ## bound the cache (number of entries and/or memory in bytes) by using a FeatureCache
+        ## the content of a given dict is copied into the new FeatureCache
+        if (max_entries is not None or max_memory is not None or thread_safe) and not isinstance(feature_cache, FeatureCache):
+            feature_cache = FeatureCache(feature_cache, max_entries, max_memory, thread_safe)
+
+        self.feature_cache = feature_cache
         self.key = key
 
+        self._cache_token = uuid.uuid4().hex
+        _cache_owners[self._cache_token] = self
+
+    def clearFeatureCache(self):
+        """Remove the features of this extractor from its cache, e.g. after
+        its parameters have been changed."""
+
+        feature_cache = getattr(self, 'feature_cache', None)
+        if feature_cache is None:
+            return
+
+        if self.key is None:
+            feature_cache.clear()
+            return
+
+        ## other extractors sharing the cache keep their features
+        for data_key in list(feature_cache):
+            entry = feature_cache.peek(data_key) if isinstance(feature_cache, FeatureCache) else feature_cache.get(data_key)
+            if entry is not None and self.key in entry:
+                del entry[self.key]
+                if entry:
+                    ## reassign the entry so that a FeatureCache can update its size
+                    feature_cache[data_key] = entry
+                else:
+                    del feature_cache[data_key]
+
+        ## the features in a feature store used as backend are outdated as well
+        if isinstance(feature_cache, FeatureCache) and feature_cache.backend is not None:
+            self.feature_cache = FeatureCache(
+                max_entries=feature_cache.max_entries, max_memory=feature_cache.max_memory,
+                thread_safe=feature_cache.thread_safe)
+
+    def getCacheStatistics(self):
+
+        feature_cache = getattr(self, 'feature_cache', None)
+        if feature_cache is None:
+            return None
+        elif isinstance(feature_cache, FeatureCache):
+            return feature_cache.getStatistics()
+        else:
+            return {'entries': len(feature_cache)}
+
+@functools.lru_cache(maxsize=None)
+def _getSkipgramPositions(ngram_size, skip):
+    """Get the positions that are kept in skip-grams of the given size with
+    the given number of skipped characters.
+
+    The first and the last position are always kept, the skipped positions
+    are all combinations of skip positions in between.
+    """
+
+    if ngram_size < 2:
+        ## only the first position is kept
+        return ((0,),) if ngram_size + skip > 0 else ((),)
+
+    inner_positions = range(1, ngram_size + skip - 1)
+    return tuple(
+        (0,) + kept + (ngram_size + skip - 1,)
+        for kept in itertools.combinations(inner_positions, ngram_size - 2))
+
+
 class NGramExtractor(FeatureExtractorMixin):
 
     name = "ngram"
 
-    def create(min_ngram_size=2, max_ngram_size=float('inf'), skip_size=0, gap="|", bow="$", eow="$", pad_ngrams=False):
-        return NGramExtractor(min_ngram_size, max_ngram_size, skip_size, gap, bow, eow, pad_ngrams)
+    ## default for objects pickled without this attribute
+    intern_features = False
 
-    def __init__(self, min_ngram_size=2, max_ngram_size=float('inf'), skip_size=0, gap="|", bow="$", eow="$", pad_ngrams=False):
+    def create(min_ngram_size=2, max_ngram_size=float('inf'), skip_size=0, gap="|", bow="$", eow="$", pad_ngrams=False, intern_features=False):
+        return NGramExtractor(min_ngram_size, max_ngram_size, skip_size, gap, bow, eow, pad_ngrams, intern_features)
+
+    def __init__(self, min_ngram_size=2, max_ngram_size=float('inf'), skip_size=0, gap="|", bow="$", eow="$", pad_ngrams=False, intern_features=False):
 
         self.min_ngram_size = min_ngram_size
         self.max_ngram_size = max_ngram_size
@@ -133,10 +297,28 @@ class NGramExtractor(FeatureExtractorMixin):
         self.eow = eow
         self.pad_ngrams = pad_ngrams
 
+        ## if set, ngrams are returned as integer ids
+        self.intern_features = intern_features
+        self.feature_ids = {}
+        self.features = []
+
     # http://locallyoptimal.com/blog/2013/01/20/elegant-n-gram-generation-in-python/
     def _find_ngrams(self, input_list, n):
         return zip(*[input_list[i:] for i in range(n)])
 
+    def _getFeatureId(self, feature):
+
+        feature_id = self.feature_ids.get(feature)
+        if feature_id is None:
+            feature_id = len(self.features)
+            self.feature_ids[feature] = feature_id
+            self.features.append(feature)
+        return feature_id
+
+    def getFeature(self, feature_id):
+
+        return self.features[feature_id]
+
     def _featureExtraction(self, datapoint):
 
         padded_datapoint = list(datapoint)
@@ -156,107 +338,22 @@ class NGramExtractor(FeatureExtractorMixin):
         ngrams = set()
 
         for i in range(self.min_ngram_size, max_ngram_size + 1):
-            ngrams.update(list(self._find_ngrams(padded_datapoint, i)))
+            ngrams.update(self._find_ngrams(padded_datapoint, i))
             ### add skip grams for the given size
             for skip in range(1, min(self.skip_size, len(datapoint) - i) + 1):
                 ngrams_for_skipgrams = list(self._find_ngrams(datapoint, i + skip))
-                ### get all combinations of (i-2) times True and skip times False
-                seen_permutations = set()
-                for skip_vector in itertools.permutations([False]*skip + [True]*(i-2)):
-                    if skip_vector in seen_permutations:
-                        continue
-                    seen_permutations.add(skip_vector)
-                    skip_vector = [True] + list(skip_vector) + [True]
+                ### the kept positions are precomputed for each combination of size and skip
+                for positions in _getSkipgramPositions(i, skip):
                     if self.gap:
-                        skipgrams = [tuple([char if skip_vector[position] else self.gap for position, char in enumerate(ngram)]) for ngram in ngrams_for_skipgrams]
+                        gap_ngram = [self.gap] * (i + skip)
+                        for ngram in ngrams_for_skipgrams:
+                            for position in positions:
+                                gap_ngram[position] = ngram[position]
+                            ngrams.add(tuple(gap_ngram))
                     else:
-                        skipgrams = [tuple([char for position, char in enumerate(ngram) if skip_vector[position]]) for ngram in ngrams_for_skipgrams]
-                    ngrams.update(skipgrams)
+                        ngrams.update([tuple([ngram[position] for position in positions]) for ngram in ngrams_for_skipgrams])
 
-        return ngrams
-
-class SurfaceExtractor(BaseEstimator, TransformerMixin, FeatureExtractorMixin):
-
-    name = "surface"
-
-    def create(min_ngram_size=1, max_ngram_size=3, only_mismatch_ngrams=True, padding_char="$"):
-        return SurfaceExtractor(min_ngram_size, max_ngram_size, only_mismatch_ngrams, padding_char)
-
-    def __init__(self, min_ngram_size=1, max_ngram_size=3, only_mismatch_ngrams=True, padding_char="$"):
-
-        self.ngram_extractor = NGramExtractor(min_ngram_size, max_ngram_size, skip_size=0,
-                                              bow='', eow='')
-        self.padding_char = padding_char
-        self.only_mismatch_ngrams = only_mismatch_ngrams
-
-    def _featureExtraction(self, data_point):
-
-        word = data_point[0]
-        candidate = data_point[1]
-
-        ## align word and candidate
-        alignment = list(spellvardetection.lib.util.get_alignment(self.padding_char + word + self.padding_char,
-                                             self.padding_char + candidate + self.padding_char))
-        ## get ngrams from alignment (size is option)
-        ngrams = list(self.ngram_extractor.extractFeaturesFromDatapoint(alignment))
-
-        ## only alignment from mismatch
-        if self.only_mismatch_ngrams:
-            ngrams = list(filter(lambda x: any([len(pair) > 1 and pair[0] != pair[1] in pair for pair in x]), ngrams))
+        if self.intern_features:
+            return set([self._getFeatureId(ngram) for ngram in ngrams])
 
         return ngrams
-
-
-    def fit(self, data, y=None):
-
-        self.vec = DictVectorizer(dtype=numpy.int64)
-        self.vec.fit(list(map(lambda ngrams: {tuple(key): 1 for key in ngrams},
-                              [self.extractFeaturesFromDatapoint(observation) for observation in data])))
-
-        return self
-
-    def transform(self, data):
-
-        return self.vec.transform(list(map(lambda ngrams: {tuple(key): 1 for key in ngrams},
-                                           [self.extractFeaturesFromDatapoint(observation) for observation in data])))
-
-class ContextExtractor(BaseEstimator, TransformerMixin, FeatureExtractorMixin):
-
-    name = 'context'
-
-    def create(vector_type, vectorfile_name: os.PathLike, simplfile_name=None, missing_words=None):
-
-        embeddings = spellvardetection.lib.embeddings.WordEmbeddings(vector_type, vectorfile_name, simplfile_name, missing_words)
-        return ContextExtractor(embeddings)
-
-    def __init__(self, embeddings):
-
-        self.embeddings = embeddings
-
-    def _featureExtraction(self, data_point):
-
-        word = data_point[0]
-        candidate = data_point[1]
-
-        word_embedd = self.embeddings.get(word)
-        cand_embedd = self.embeddings.get(candidate)
-        if not (word_embedd is None or cand_embedd is None):
-            features = cosine_similarity([word_embedd], [cand_embedd])[0][0]
-        else:
-            features = float('nan')
-
-        return features
-
-    def fit(self, data, y=None):
-
-        self.preprocessing = Pipeline([
-            ('imputer', SimpleImputer(strategy='mean')),
-            ('normalizer', StandardScaler())
-        ])
-        self.preprocessing.fit(numpy.array([self.extractFeaturesFromDatapoint(x) for x in data]).reshape(-1, 1))
-
-        return self
-
-    def transform(self, data):
-
-        return self.preprocessing.transform(numpy.array([self.extractFeaturesFromDatapoint(x) for x in data]).reshape(-1, 1))
@@ -1,29 +1,76 @@
-from collections import defaultdict
+import collections
+import json
+import multiprocessing
+import os
 
 from spellvardetection.generator import LevenshteinGenerator
-from spellvardetection.lib.util import get_alignment, getTrueAndFalsePairs
+from spellvardetection.lib.util import get_alignment, getTrueAndFalsePairs, count_in_chunks
 
-def getProbabilitiesFromSpellvars(type_variants, max_processes=None):
+def getEditOps(pair):
 
-    generator = LevenshteinGenerator(max_dist=1, transposition=True)
-    true_pairs, false_pairs = getTrueAndFalsePairs(type_variants, generator, max_processes)
+    return [edit_op for edit_op in get_alignment(pair[0], pair[1], directed=False, conflate_id_pairs=True, empty_char='')
+            if edit_op != 'IDD']
+
+def countEditOps(pairs):
+
+    counts = collections.Counter()
+    for pair in pairs:
+        counts.update(getEditOps(pair))
 
-    ## initialize counts with 1 (Laplace smoothing)
-    probabilities = defaultdict(lambda: {'correct': 1, 'false': 1})
+    return counts
 
-    def get_edit_ops(pair):
-        return filter(lambda e: e != 'IDD',
-                      get_alignment(pair[0], pair[1],
-                                    directed=False, conflate_id_pairs=True, empty_char=''))
+def getEditOpCounts(true_pairs, false_pairs, max_processes=None, chunk_size=10000, counts=None):
+    """Count the edit operations in true pairs (correct) and false pairs
+    (false), the counts are added to the given counts."""
 
-    for pair in true_pairs:
-        for edit_op in get_edit_ops(pair):
-            probabilities[edit_op]['correct'] += 1
+    pool = multiprocessing.Pool(max_processes) if max_processes != 1 else None
 
-    for pair in false_pairs:
-        for edit_op in get_edit_ops(pair):
-            probabilities[edit_op]['false'] += 1
+    try:
+        ## each chunk is counted separately, only the counts are merged
+        correct_counts = count_in_chunks(countEditOps, true_pairs, pool, chunk_size)
+        false_counts = count_in_chunks(countEditOps, false_pairs, pool, chunk_size)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
 
+    counts = {edit_op: dict(op_counts) for edit_op, op_counts in (counts or {}).items()}
+    for key, key_counts in [('correct', correct_counts), ('false', false_counts)]:
+        for edit_op, count in key_counts.items():
+            op_counts = counts.setdefault(edit_op, {'correct': 0, 'false': 0})
+            op_counts[key] = op_counts.get(key, 0) + count
+
+    return counts
+
+def getProbabilitiesFromCounts(counts):
+
+    ## Laplace smoothing: all counts start with 1
     return [{'char1': edit_op[0], 'char2': edit_op[1] if len(edit_op) == 2 else '',
-             'probability': counts['correct']/(counts['correct'] + counts['false'])}
-            for edit_op, counts in probabilities.items()]
+             'probability': (op_counts['correct'] + 1)/(op_counts['correct'] + op_counts['false'] + 2)}
+            for edit_op, op_counts in counts.items()]
+
+def getProbabilitiesFromSpellvars(type_variants, max_processes=None, counts_file=None):
+    """Learn edit probabilities from a spelling variant dictionary.
+
+    If a counts file is given, the counts of the edit operations are added
+    to the counts in this file (if it exists) and written back to it, so
+    counts can be accumulated across multiple dictionaries. The file is only
+    written after all pairs are counted and does not record which pairs
+    were counted, so a dictionary must not be added twice.
+    """
+
+    generator = LevenshteinGenerator(max_dist=1, transposition=True)
+    true_pairs, false_pairs = getTrueAndFalsePairs(type_variants, generator, max_processes)
+
+    counts = None
+    if counts_file is not None and os.path.exists(counts_file):
+        with open(counts_file, 'r', encoding='utf-8') as infile:
+            counts = json.load(infile)
+
+    counts = getEditOpCounts(true_pairs, false_pairs, max_processes, counts=counts)
+
+    if counts_file is not None:
+        with open(counts_file, 'w', encoding='utf-8') as outfile:
+            json.dump(counts, outfile)
+
+    return getProbabilitiesFromCounts(counts)
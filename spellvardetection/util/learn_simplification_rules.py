@@ -1,9 +1,10 @@
 import difflib
+import functools
 import multiprocessing
 import collections
 
 from spellvardetection.generator import LevenshteinGenerator
-from spellvardetection.lib.util import getTrueAndFalsePairs
+from spellvardetection.lib.util import getTrueAndFalsePairs, count_in_chunks
 
 def getRules(word1, word2, padding_left = "^^", padding_right = "^^"):
 
@@ -29,36 +30,46 @@ def getRules(word1, word2, padding_left = "^^", padding_right = "^^"):
 
     return tuple(substitution_rules + deletion_rules)
 
-def getRulesFromPair(pair):
+def getRuleKeysFromPair(pair):
 
-    return { rule['rule']: {'left_context': rule['left_context'], 'right_context': rule['right_context'], 'pair': set(pair) } for rule in getRules(pair[0], pair[1]) }
+    return set([rule['rule'] for rule in getRules(pair[0], pair[1])])
 
+def countRules(pairs, rules=None):
+    """Count the number of pairs each rule can be extracted from.
 
-def getRulesAndFreqFromSpellvars(type_variants, max_processes=None):
+    If a collection of rules is given, only these rules are counted.
+    """
 
-    generator = LevenshteinGenerator(max_dist=1, merge_split=True)
-    true_pairs, false_pairs = getTrueAndFalsePairs(type_variants, generator, max_processes)
+    counts = collections.Counter()
+    for pair in pairs:
+        pair_rules = getRuleKeysFromPair(pair)
+        if rules is not None:
+            pair_rules.intersection_update(rules)
+        counts.update(pair_rules)
+
+    return counts
 
-    # Getting true rules
-    with multiprocessing.Pool(max_processes) as pool:
-        true_simplification_rules = pool.map(getRulesFromPair, true_pairs)
+def getRulesAndFreqFromPairs(true_pairs, false_pairs, max_processes=None, chunk_size=10000):
+    """Count the rules of true pairs (tp) and how often they are found in
+    false pairs (fp), the pairs can be iterables that are read in chunks."""
 
-    # Getting all rules
-    with multiprocessing.Pool(max_processes) as pool:
-        false_simplification_rules = pool.map(getRulesFromPair, false_pairs)
+    pool = multiprocessing.Pool(max_processes) if max_processes != 1 else None
 
-    # Collect rules
-    rules = {}
-    for rule_feat in true_simplification_rules:
-        for rule, _ in rule_feat.items():
-            if rule not in rules:
-                rules[rule] = {'tp': 0, 'fp': 0}
-            rules[rule]['tp'] += 1
+    try:
+        ## each chunk is counted separately, only the counts are merged
+        true_counts = count_in_chunks(countRules, true_pairs, pool, chunk_size)
+        ## only rules of true pairs are of interest
+        false_counts = count_in_chunks(functools.partial(countRules, rules=frozenset(true_counts.keys())), false_pairs, pool, chunk_size)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
 
-    for rule_feat in false_simplification_rules:
-        for rule, _ in rule_feat.items():
-            if rule in rules:
-                rules[rule]['fp'] += 1
+    return {rule: {'tp': count, 'fp': false_counts[rule]} for rule, count in true_counts.items()}
 
-    return rules
+def getRulesAndFreqFromSpellvars(type_variants, max_processes=None):
+
+    generator = LevenshteinGenerator(max_dist=1, merge_split=True)
+    true_pairs, false_pairs = getTrueAndFalsePairs(type_variants, generator, max_processes)
 
+    return getRulesAndFreqFromPairs(true_pairs, false_pairs, max_processes)
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy
+
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.feature_extraction import DictVectorizer, FeatureHasher
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.impute import SimpleImputer
+
+import spellvardetection.lib.embeddings
+import spellvardetection.lib.util
+from spellvardetection.util.feature_extractor import FeatureExtractorMixin, NGramExtractor
+
+
+class SurfaceExtractor(BaseEstimator, TransformerMixin, FeatureExtractorMixin):
+
+    name = "surface"
+
+    ## default for objects pickled without this attribute
+    n_features = None
+
+    def create(min_ngram_size=1, max_ngram_size=3, only_mismatch_ngrams=True, padding_char="$", n_features=None):
+        return SurfaceExtractor(min_ngram_size, max_ngram_size, only_mismatch_ngrams, padding_char, n_features)
+
+    def __init__(self, min_ngram_size=1, max_ngram_size=3, only_mismatch_ngrams=True, padding_char="$", n_features=None):
+
+        self.min_ngram_size = min_ngram_size
+        self.max_ngram_size = max_ngram_size
+        self.padding_char = padding_char
+        self.only_mismatch_ngrams = only_mismatch_ngrams
+        ## if n_features is set, ngrams are hashed into a feature space of this size
+        self.n_features = n_features
+
+        self._setNGramExtractor()
+
+    def __setstate__(self, state):
+
+        ## objects pickled with older versions do not contain the ngram sizes
+        if 'min_ngram_size' not in state:
+            state['min_ngram_size'] = state['ngram_extractor'].min_ngram_size
+            state['max_ngram_size'] = state['ngram_extractor'].max_ngram_size
+
+        super().__setstate__(state)
+
+    def _setNGramExtractor(self):
+
+        self.ngram_extractor = NGramExtractor(self.min_ngram_size, self.max_ngram_size, skip_size=0,
+                                              bow='', eow='')
+
+    def _getExtractionParams(self):
+
+        return (self.min_ngram_size, self.max_ngram_size, self.padding_char, self.only_mismatch_ngrams)
+
+    def set_params(self, **params):
+
+        extraction_params = self._getExtractionParams()
+
+        super().set_params(**params)
+        self._setNGramExtractor()
+
+        ## cached features have been extracted with the old parameters (n_features is only used when the features are hashed)
+        if self._getExtractionParams() != extraction_params:
+            self.clearFeatureCache()
+
+        return self
+
+    def _featureExtraction(self, data_point):
+
+        word = data_point[0]
+        candidate = data_point[1]
+
+        ## align word and candidate
+        alignment = list(spellvardetection.lib.util.get_alignment(self.padding_char + word + self.padding_char,
+                                             self.padding_char + candidate + self.padding_char))
+        ## get ngrams from alignment (size is option)
+        ngrams = list(self.ngram_extractor.extractFeaturesFromDatapoint(alignment))
+
+        ## only alignment from mismatch
+        if self.only_mismatch_ngrams:
+            ngrams = list(filter(lambda x: any([len(pair) > 1 and pair[0] != pair[1] in pair for pair in x]), ngrams))
+
+        return ngrams
+
+
+    def _getHashedFeatures(self, data):
+
+        ## repeated ngrams are only counted once, as with the DictVectorizer
+        return (set(['\x00'.join(key) for key in self.extractFeaturesFromDatapoint(observation)]) for observation in data)
+
+    def fit(self, data, y=None):
+
+        ## hashed features need no vocabulary - no pass over the data is needed
+        if self.n_features is not None:
+            self.vec = FeatureHasher(n_features=self.n_features, input_type='string', alternate_sign=False, dtype=numpy.int64)
+            return self
+
+        self.vec = DictVectorizer(dtype=numpy.int64)
+        self.vec.fit(list(map(lambda ngrams: {tuple(key): 1 for key in ngrams},
+                              [self.extractFeaturesFromDatapoint(observation) for observation in data])))
+
+        return self
+
+    def partial_fit(self, data, y=None):
+
+        if self.n_features is None:
+            raise ValueError('Incremental fitting is only possible with hashed features (n_features has to be set).')
+
+        if not hasattr(self, 'vec'):
+            self.fit(data, y)
+
+        return self
+
+    def transform(self, data):
+
+        if self.n_features is not None:
+            return self.vec.transform(self._getHashedFeatures(data))
+
+        return self.vec.transform(list(map(lambda ngrams: {tuple(key): 1 for key in ngrams},
+                                           [self.extractFeaturesFromDatapoint(observation) for observation in data])))
+
+class ContextExtractor(BaseEstimator, TransformerMixin, FeatureExtractorMixin):
+
+    name = 'context'
+
+    ## number of pairs whose similarities are computed at once
+    batch_size = 10000
+
+    def create(vector_type, vectorfile_name: os.PathLike, simplfile_name=None, missing_words=None):
+
+        embeddings = spellvardetection.lib.embeddings.WordEmbeddings(vector_type, vectorfile_name, simplfile_name, missing_words)
+        return ContextExtractor(embeddings)
+
+    def __init__(self, embeddings):
+
+        self.embeddings = embeddings
+
+    def _getEmbeddings(self, words):
+
+        if hasattr(self.embeddings, 'getMany'):
+            return self.embeddings.getMany(words)
+
+        ## embeddings given as a mapping from words to vectors, missing words are NaN
+        vectors = [self.embeddings.get(word) for word in words]
+        dim = next((len(vector) for vector in vectors if vector is not None), 1)
+        return numpy.array([numpy.full(dim, numpy.nan) if vector is None else vector for vector in vectors], dtype=float).reshape(len(words), dim)
+
+    def _featureExtraction(self, data_point):
+
+        return self._featureExtractionBatch([data_point])[0]
+
+    def _featureExtractionBatch(self, data):
+
+        features = []
+        for start in range(0, len(data), self.batch_size):
+
+            batch = data[start:start + self.batch_size]
+            word_embedds = self._getEmbeddings([data_point[0] for data_point in batch])
+            cand_embedds = self._getEmbeddings([data_point[1] for data_point in batch])
+
+            ## row-wise cosine similarity, embeddings of missing words are NaN if
+            ## they are not replaced and vectors of zeros have a similarity of 0
+            norms = numpy.linalg.norm(word_embedds, axis=1) * numpy.linalg.norm(cand_embedds, axis=1)
+            similarities = numpy.einsum('ij,ij->i', word_embedds, cand_embedds) / numpy.where(norms == 0, 1, norms)
+
+            features.extend(similarities.tolist())
+
+        return features
+
+    def fit(self, data, y=None):
+
+        self.preprocessing = Pipeline([
+            ('imputer', SimpleImputer(strategy='mean')),
+            ('normalizer', StandardScaler())
+        ])
+        self.preprocessing.fit(numpy.array(self.extractFeatures(data)).reshape(-1, 1))
+
+        return self
+
+    def transform(self, data):
+
+        return self.preprocessing.transform(numpy.array(self.extractFeatures(data)).reshape(-1, 1))
@@ -1,23 +1,159 @@
-import factory_manager
+import importlib
 
-from spellvardetection.generator import _AbstractCandidateGenerator
-from spellvardetection.type_filter import _AbstractTrainableTypeFilter, _AbstractTypeFilter
-from spellvardetection.token_filter import _AbstractTrainableTokenFilter, _AbstractTokenFilter
-from spellvardetection.util.feature_extractor import FeatureExtractorMixin
+import factory_manager
 
 from spellvardetection.lib.util import load_from_file_if_string
 
+## object hierarchies that can be created by the factory:
+## name -> (base class, function used for creating objects, module defining the class for each type)
+## the modules are only imported when an object of the hierarchy or type is created for the first time
+_OBJECT_HIERARCHIES = {
+    'generator': ('spellvardetection.generator._AbstractCandidateGenerator', 'create', {
+        'union': 'spellvardetection.generator',
+        'pipeline': 'spellvardetection.generator',
+        'lookup': 'spellvardetection.generator',
+        'gent_gml_simplification': 'spellvardetection.generator',
+        'simplification': 'spellvardetection.generator',
+        'levenshtein': 'spellvardetection.generator',
+        'levenshtein_normalized': 'spellvardetection.generator',
+        'cluster': 'spellvardetection.generator',
+        'proxinette': 'spellvardetection.generator',
+        'jaccard': 'spellvardetection.generator',
+        'frequency_wjaccard': 'spellvardetection.generator',
+    }),
+    'trainable_type_filter': ('spellvardetection.type_filter._AbstractTrainableTypeFilter', 'create_for_training', {
+        'uspsim': 'spellvardetection.type_filter',
+        'sklearn': 'spellvardetection.sklearn_type_filter',
+    }),
+    'type_filter': ('spellvardetection.type_filter._AbstractTypeFilter', 'create', {
+        'cluster': 'spellvardetection.type_filter',
+        'uspsim': 'spellvardetection.type_filter',
+        'edit_probabilities': 'spellvardetection.type_filter',
+        'sklearn': 'spellvardetection.sklearn_type_filter',
+    }),
+    'token_filter': ('spellvardetection.token_filter._AbstractTokenFilter', 'create', {
+        'cnn': 'spellvardetection.token_filter',
+        'numpy_cnn': 'spellvardetection.token_filter',
+    }),
+    'trainable_token_filter': ('spellvardetection.token_filter._AbstractTrainableTokenFilter', None, {
+        'cnn': 'spellvardetection.token_filter',
+    }),
+    'extractor': ('spellvardetection.util.feature_extractor.FeatureExtractorMixin', 'create', {
+        'ngram': 'spellvardetection.util.feature_extractor',
+        'surface': 'spellvardetection.util.sklearn_feature_extractor',
+        'context': 'spellvardetection.util.sklearn_feature_extractor',
+    }),
+}
+
+
+def _getClassName(cls):
+
+    return getattr(cls, '__module__', None), getattr(cls, '__qualname__', None)
+
+
+class _LazyFactories(dict):
+    """Factory methods for classes, asking for the factory method of the base
+    class of a lazy object hierarchy adds the hierarchy."""
+
+    def __init__(self, factory):
+
+        super().__init__()
+        self.factory = factory
+
+    def __contains__(self, cls):
+
+        self.factory._addHierarchyForClass(cls)
+        return super().__contains__(cls)
+
+
+class LazyFactoryManager(factory_manager.FactoryManager):
+    """A factory manager where object hierarchies are registered by the names
+    of their classes and modules.
+
+    The modules are imported (and the object hierarchy is added to the
+    factory) when an object of the hierarchy is created.
+    """
+
+    def __init__(self, option_parser=None):
+
+        super().__init__(option_parser)
+        self.factories_for_classes = _LazyFactories(self)
+        self.lazy_hierarchies = {}
+        self.imported_modules = {}
+
+    def add_lazy_object_hierarchy(self, type_name, base_cls_name, modules_for_types, create_func=None):
+
+        self.lazy_hierarchies[type_name] = (base_cls_name, modules_for_types, create_func)
+
+    def add_factory_method(self, cls, method):
+
+        ## the check must not add a lazy hierarchy
+        if dict.__contains__(self.factories_for_classes, cls):
+            raise ValueError('There is already a factory method for ' + cls.__name__ + '.')
+
+        dict.__setitem__(self.factories_for_classes, cls, method)
+
+    def _getHierarchyForClass(self, cls):
+
+        for type_name, (base_cls_name, _, _) in self.lazy_hierarchies.items():
+            if tuple(base_cls_name.rsplit('.', 1)) == _getClassName(cls):
+                return type_name
+        return None
+
+    def _addHierarchyForClass(self, cls):
+
+        type_name = self._getHierarchyForClass(cls)
+        if type_name is not None and type_name not in self.classes_for_name:
+            self._addHierarchy(type_name)
+
+    def _addHierarchy(self, type_name, object_type=None):
+
+        base_cls_name, modules_for_types, create_func = self.lazy_hierarchies[type_name]
+        base_module_name, base_name = base_cls_name.rsplit('.', 1)
+
+        modules = set([base_module_name])
+        if object_type in modules_for_types:
+            modules.add(modules_for_types[object_type])
+
+        if type_name in self.classes_for_name and modules <= self.imported_modules[type_name]:
+            return
+
+        for module in modules:
+            importlib.import_module(module)
+        base_cls = getattr(importlib.import_module(base_module_name), base_name)
+
+        ## the hierarchy is (re-)added with all subclasses that are imported now
+        if type_name in self.classes_for_name:
+            del self.classes_for_name[type_name]
+            dict.__delitem__(self.factories_for_classes, base_cls)
+        self.add_object_hierarchy(type_name, base_cls, create_func=create_func)
+        self.imported_modules[type_name] = self.imported_modules.get(type_name, set()) | modules
+
+    def create_from_cls(self, cls, options):
+
+        type_name = self._getHierarchyForClass(cls)
+        if type_name is not None and not isinstance(options, cls):
+            if self.option_parser is not None:
+                options = self.option_parser(options)
+            self._addHierarchy(type_name, options.get('type') if isinstance(options, dict) else None)
+
+        return super().create_from_cls(cls, options)
+
+    def create_from_name(self, type_name, options):
+
+        if type_name in self.lazy_hierarchies and type_name not in self.classes_for_name:
+            self._addHierarchy(type_name)
+
+        return super().create_from_name(type_name, options)
+
+
 def create_base_factory():
-    factory = factory_manager.FactoryManager(option_parser=load_from_file_if_string)
+    factory = LazyFactoryManager(option_parser=load_from_file_if_string)
     factory.add_factory_method(list, load_from_file_if_string)
     factory.add_factory_method(dict, load_from_file_if_string)
     factory.add_factory_method(set, lambda x: set(load_from_file_if_string(x)))
 
-    factory.add_object_hierarchy("generator", _AbstractCandidateGenerator, create_func='create')
-    factory.add_object_hierarchy("trainable_type_filter", _AbstractTrainableTypeFilter, create_func='create_for_training')
-    factory.add_object_hierarchy("type_filter", _AbstractTypeFilter, create_func='create')
-    factory.add_object_hierarchy("token_filter", _AbstractTokenFilter, create_func='create')
-    factory.add_object_hierarchy("trainable_token_filter", _AbstractTrainableTokenFilter)
-    factory.add_object_hierarchy("extractor", FeatureExtractorMixin, create_func='create')
+    for type_name, (base_cls_name, create_func, modules_for_types) in _OBJECT_HIERARCHIES.items():
+        factory.add_lazy_object_hierarchy(type_name, base_cls_name, modules_for_types, create_func=create_func)
 
     return factory